@@ -0,0 +1,285 @@
+"""
+ジョブのキャンセルとステージごとの制限時間。
+
+_process_job がジョブごとに CancelToken をバインドし、各サービスは
+  - check()          : キャンセル済み・期限切れなら JobCancelled を送出
+  - remaining()      : 現在のステージの残り時間（HTTP タイムアウトに使う）
+  - track_process()  : 外部プロセス（ffmpeg 等）をキャンセル時に kill する
+  - on_cancel()      : キャンセル時に呼ぶ後始末（SDK クライアントの close 等）を登録する
+  - call()           : ブロッキング呼び出し（HTTP/SDK）をキャンセル時に見捨てて即座に戻る
+を使う。トークンがバインドされていなければ（スクリプトからの直接呼び出しなど）何もしない。
+
+キャンセル要求は store の cancel_requested で伝わるため、別プロセスのワーカーにも届く。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# ステージごとの制限時間（秒）。STAGE_TIMEOUT_<STAGE> で上書きできる
+_DEFAULT_TIMEOUTS = {"download": 900, "extract": 600, "transcribe": 3600, "generate": 300}
+STAGE_TIMEOUTS = {
+    stage: float(os.environ.get(f"STAGE_TIMEOUT_{stage.upper()}", default))
+    for stage, default in _DEFAULT_TIMEOUTS.items()
+}
+
+# キャンセル要求・期限切れを確認する間隔（秒）
+POLL_SECONDS = float(os.environ.get("CANCEL_POLL_SECONDS", "0.5"))
+
+
+class JobCancelled(BaseException):
+    """
+    ジョブがキャンセルされた、またはステージの制限時間を超えた。
+
+    asyncio.CancelledError と同じく BaseException を継承する。プロバイダの
+    フォールバック（except Exception）で握りつぶされて次の処理に進まないようにするため。
+    """
+
+    def __init__(self, reason: str, stage: str | None = None):
+        self.reason = reason  # cancelled | timeout
+        self.stage = stage
+        if reason == "timeout":
+            super().__init__(f"{stage} が制限時間（{STAGE_TIMEOUTS.get(stage or '', 0):.0f}秒）を超えました")
+        else:
+            super().__init__("ジョブがキャンセルされました")
+
+
+class CancelToken:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.stage: str | None = None
+        self.deadline: float | None = None
+        self.reason: str | None = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes: set[subprocess.Popen] = set()
+        self._closers: list[Callable[[], object]] = []
+        self._paused = 0  # paused() の中にいるスレッド数
+        self._paused_since = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """キャンセルし、実行中の外部プロセスを kill し、登録された後始末（接続の close 等）を呼ぶ。"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            processes = list(self._processes)
+            closers = list(self._closers)
+        logger.info("[%s] Cancelling (%s, stage=%s)", self.job_id, reason, self.stage)
+        for proc in processes:
+            if proc.poll() is None:
+                proc.kill()
+        for close in closers:
+            try:
+                close()
+            except Exception:
+                logger.debug("[%s] Closer %r failed", self.job_id, close, exc_info=True)
+
+    def expired(self) -> bool:
+        """ステージの制限時間を過ぎたか。paused() の中にいる間は過ぎない。"""
+        deadline = self.deadline
+        return deadline is not None and not self._paused and time.monotonic() > deadline
+
+    def check(self) -> None:
+        if self.expired():
+            self.cancel("timeout")
+        if self._event.is_set():
+            raise JobCancelled(self.reason or "cancelled", self.stage)
+
+    def remaining(self, default: float) -> float:
+        if self.deadline is None:
+            return default
+        return max(0.1, min(default, self.deadline - time.monotonic()))
+
+    def wait(self, seconds: float) -> bool:
+        return self._event.wait(seconds)
+
+
+_current: contextvars.ContextVar[CancelToken | None] = contextvars.ContextVar("cancel_token", default=None)
+
+
+def bind(token: CancelToken | None) -> None:
+    _current.set(token)
+
+
+def current() -> CancelToken | None:
+    return _current.get()
+
+
+def check() -> None:
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+def sleep(seconds: float) -> None:
+    """seconds 待つ。キャンセル・期限切れならすぐに JobCancelled を送出する。"""
+    token = _current.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    token.wait(seconds)
+    token.check()
+
+
+def remaining(default: float) -> float:
+    token = _current.get()
+    return default if token is None else token.remaining(default)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """ステージの制限時間を設定する。"""
+    token = _current.get()
+    if token is None:
+        yield
+        return
+    token.check()
+    token.stage = name
+    token.deadline = time.monotonic() + STAGE_TIMEOUTS.get(name, float("inf"))
+    try:
+        yield
+        token.check()
+    finally:
+        token.deadline = None
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """
+    この中で過ごした時間をステージの制限時間に数えない（レート制限の枠待ちなど、
+    ジョブ自身の処理ではない待ち）。並列のスレッドが重なって入った場合は、誰かが中にいる間を数えない。
+    キャンセル要求はこの中でも効く。
+    """
+    token = _current.get()
+    if token is None:
+        yield
+        return
+    with token._lock:
+        if token._paused == 0:
+            token._paused_since = time.monotonic()
+        token._paused += 1
+    try:
+        yield
+    finally:
+        with token._lock:
+            token._paused -= 1
+            if token._paused == 0 and token.deadline is not None:
+                token.deadline += time.monotonic() - token._paused_since
+
+
+@contextmanager
+def track_process(proc: subprocess.Popen) -> Iterator[subprocess.Popen]:
+    """キャンセル時に proc を kill するよう登録する。"""
+    token = _current.get()
+    if token is None:
+        yield proc
+        return
+    with token._lock:
+        token._processes.add(proc)
+        already = token.cancelled
+    if already:
+        proc.kill()
+    try:
+        yield proc
+    finally:
+        with token._lock:
+            token._processes.discard(proc)
+
+
+@contextmanager
+def on_cancel(close: Callable[[], object]) -> Iterator[None]:
+    """
+    この中でキャンセル・期限切れになったら close を呼ぶ。SDK クライアントの close を登録すると、
+    call() が見捨てた実行中のリクエストの接続も切れて、応答を待ち続けずに止まる。
+    """
+    token = _current.get()
+    if token is None:
+        yield
+        return
+    with token._lock:
+        token._closers.append(close)
+        already = token.cancelled
+    if already:
+        close()
+    try:
+        yield
+    finally:
+        with token._lock:
+            token._closers.remove(close)
+
+
+def is_cancelled() -> bool:
+    """このコンテキストのジョブがキャンセル・期限切れになったか（見捨てられたスレッドの後処理の判定用）。"""
+    token = _current.get()
+    return token is not None and token.cancelled
+
+
+def call(fn: Callable, *args, **kwargs):
+    """
+    fn を別スレッドで実行し、完了かキャンセル・期限切れのどちらか早い方で戻る。
+    キャンセル時は実行中の呼び出し（HTTP リクエスト等）を見捨ててワーカーを解放する。
+
+    見捨てたスレッドはそのまま走り続けるので、呼び出し側は on_cancel() でクライアントの close を
+    登録するか、ストリームで受け取りながら check() して、実行中のリクエストを止める。
+    止められない呼び出しも遅れて届いた結果はジョブに書かない（metrics は is_cancelled() を見る）。
+    """
+    token = _current.get()
+    if token is None:
+        return fn(*args, **kwargs)
+
+    ctx = contextvars.copy_context()
+    future: Future = Future()
+
+    def target():
+        try:
+            future.set_result(ctx.run(profiling.run_attached, fn, *args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name=f"cancellable-{token.job_id[:8]}", daemon=True).start()
+    while True:
+        try:
+            future.exception(timeout=POLL_SECONDS)
+        except FutureTimeout:
+            token.check()
+            continue
+        # on_cancel() の close で切られた呼び出しの接続エラーより、キャンセルを優先して送出する
+        token.check()
+        return future.result()
+
+
+def watch(token: CancelToken, is_requested: Callable[[], bool]) -> Callable[[], None]:
+    """
+    キャンセル要求と期限切れを監視するスレッドを起動する。返り値を呼ぶと停止する。
+    期限切れ・キャンセル時はその場で外部プロセスを kill する。
+    """
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(POLL_SECONDS) and not token.cancelled:
+            if token.expired():
+                token.cancel("timeout")
+            elif is_requested():
+                token.cancel("cancelled")
+
+    threading.Thread(target=loop, name=f"cancel-watch-{token.job_id[:8]}", daemon=True).start()
+    return stop.set
@@ -0,0 +1,139 @@
+"""
+ジョブのコスト見積もり（ステージごとの CPU 秒・所要秒・ピークメモリ）。
+
+アップロード時の media_probe の結果（長さ・映像の有無・サイズ）から見積もり、
+  - 受け付け: ピークメモリがメモリ予算を超えるジョブは断る（admit）
+  - スケジューリング: 所要秒の短い順（待ち時間で優先度を上げる）に取り出す（job_queue）
+  - ETA: 先に処理されるジョブの所要秒の合計から出す（job_queue）
+に使う。係数は目安なので、実測の timings を見て COST_* で調整する。
+
+メモリ予算は SCHEDULER_MEMORY_MB（未設定ならコンテナのメモリ上限の 80% から
+Whisper モデル分を引いた値。上限が分からなければ無制限）。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# decode_audio は 16kHz mono の float32 を丸ごとメモリに持つ（1秒あたり 64KB）
+PCM_MB_PER_SEC = 16000 * 4 / 1e6
+# ローカル Whisper の実時間比（CPU・int8 の目安。1秒の音声にかかる秒数）とモデルのメモリ
+_WHISPER_RTF = {"tiny": 0.05, "base": 0.1, "small": 0.3, "medium": 0.8, "large-v2": 1.6, "large-v3": 1.6}
+_WHISPER_MODEL_MB = {"tiny": 150, "base": 250, "small": 600, "medium": 1500, "large-v2": 3100, "large-v3": 3100}
+# 長さが分からないときにサイズから推定するビットレート（バイト/秒）
+_VIDEO_BYTES_PER_SEC = 250_000  # 2Mbps
+_AUDIO_BYTES_PER_SEC = 16_000   # 128kbps
+
+GENERATE_SECONDS = float(os.environ.get("COST_GENERATE_SEC", "20"))
+# 見積もりのないジョブ（見積もり導入前のジョブなど）に使う値
+DEFAULT_COST = (float(os.environ.get("COST_DEFAULT_SEC", "120")), 300.0)
+
+
+def _whisper_model() -> str:
+    return os.environ.get("WHISPER_MODEL_SIZE", "base")
+
+
+def _whisper_rtf() -> float:
+    if os.environ.get("COST_WHISPER_RTF"):
+        return float(os.environ["COST_WHISPER_RTF"])
+    rtf = _WHISPER_RTF.get(_whisper_model(), 0.3)
+    return rtf / 5 if os.environ.get("WHISPER_DEVICE") == "cuda" else rtf
+
+
+def _cgroup_memory_mb() -> float | None:
+    """コンテナのメモリ上限（cgroup v2 / v1）。無ければ None。"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:  # v1 の「無制限」は巨大な値
+            return int(value) / 1e6
+    return None
+
+
+def _memory_budget_mb() -> float:
+    if os.environ.get("SCHEDULER_MEMORY_MB"):
+        return float(os.environ["SCHEDULER_MEMORY_MB"])
+    limit = _cgroup_memory_mb()
+    if limit is None:
+        return 0.0
+    # Whisper のモデルはプロセスで共有されるので、ジョブごとではなく予算から先に引く
+    return max(0.0, limit * 0.8 - _WHISPER_MODEL_MB.get(_whisper_model(), 600))
+
+
+MEMORY_BUDGET_MB = _memory_budget_mb()  # 0 は無制限
+
+
+def _stage(cpu_seconds: float, wall_seconds: float, memory_mb: float) -> dict:
+    return {"cpu_seconds": round(cpu_seconds, 1), "wall_seconds": round(wall_seconds, 1), "memory_mb": round(memory_mb)}
+
+
+def estimate(probe: dict | None, source_type: str) -> dict:
+    """
+    probe（media_probe の結果、None 可）からジョブのコストを見積もる。
+
+    Returns:
+        {"duration", "duration_estimated", "media", "stages": {name: {cpu_seconds, wall_seconds, memory_mb}},
+         "cpu_seconds", "wall_seconds", "memory_mb"}
+    """
+    from services import transcription
+
+    probe = probe or {}
+    duration = probe.get("duration")
+    duration_estimated = duration is None
+    if duration is None:
+        size = probe.get("size") or 0
+        rate = _AUDIO_BYTES_PER_SEC if probe.get("has_video") is False else _VIDEO_BYTES_PER_SEC
+        duration = size / rate if size else 600.0
+    duration = float(duration)
+
+    stages = {}
+    if source_type == "youtube":
+        stages["download"] = _stage(duration * 0.005, duration * 0.02 + 3, 80)
+    if probe.get("has_video") is not False and source_type != "youtube":
+        stages["extract"] = _stage(duration * 0.01 + 1, duration * 0.01 + 1, 100)
+
+    if transcription.USE_OPENAI_API:
+        # VAD + Opus 圧縮はローカル、認識は API 側
+        stages["transcribe"] = _stage(duration * 0.02, duration * 0.05 + 5, duration * PCM_MB_PER_SEC + 150)
+    elif transcription.USE_LOCAL_WHISPER:
+        wall = duration * _whisper_rtf()
+        threads = int(os.environ.get("WHISPER_CPU_THREADS") or 4)
+        stages["transcribe"] = _stage(wall * threads, wall, duration * PCM_MB_PER_SEC + 200)
+    else:
+        stages["transcribe"] = _stage(0, 1, 50)
+
+    stages["generate"] = _stage(1, GENERATE_SECONDS, 50)
+
+    return {
+        "duration": round(duration, 1),
+        "duration_estimated": duration_estimated,
+        "media": probe or None,
+        "stages": stages,
+        "cpu_seconds": round(sum(s["cpu_seconds"] for s in stages.values()), 1),
+        "wall_seconds": round(sum(s["wall_seconds"] for s in stages.values()), 1),
+        "memory_mb": max(s["memory_mb"] for s in stages.values()),
+    }
+
+
+def admit(job_estimate: dict) -> str | None:
+    """メモリ予算に収まらないジョブを断る理由（受け付けるなら None）。"""
+    if MEMORY_BUDGET_MB and job_estimate["memory_mb"] > MEMORY_BUDGET_MB:
+        return (f"メディアが長すぎるため処理できません（約{job_estimate['duration'] / 60:.0f}分、"
+                f"必要メモリ約{job_estimate['memory_mb']:.0f}MB / 上限{MEMORY_BUDGET_MB:.0f}MB）")
+    return None
+
+
+def queue_cost(job: dict, regenerate: bool = False) -> tuple[float, float]:
+    """キューに渡す (所要秒, ピークメモリ MB)。選択再生成は生成ステージだけ。"""
+    if regenerate:
+        return GENERATE_SECONDS, 50.0
+    job_estimate = job.get("estimate")
+    if not job_estimate:
+        return DEFAULT_COST
+    return job_estimate["wall_seconds"], job_estimate["memory_mb"]
@@ -0,0 +1,191 @@
+"""
+音声指紋のローカル索引（SQLite）。
+
+文字起こしが終わったジョブの指紋（services/fingerprint.py のハッシュ + アンカー時刻）を保存し、
+新しいジョブの指紋と突き合わせて、同じ内容を含む既存ジョブと一致区間を探す。
+
+突き合わせは「一致したハッシュの時刻差（元ジョブの時刻 - 新しい音声の時刻）」の多数決。
+同じ内容なら時刻差がそろうので、前後が切られていても一致区間と位置のずれが分かる。
+途中が差し替えられていればその間だけ一致が途切れるので、途切れた区間（holes）も返す。
+途中が削られていれば削られた位置の前後で時刻差が変わるので、一致区間は片側だけになる。
+
+保存先は FINGERPRINT_DB_PATH（未設定なら SEARCH_DB_PATH → JOB_DB_PATH）の SQLite。
+どれも未設定のインメモリ構成では、プロセス内のメモリ上の SQLite を使う。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple
+
+import store
+from services.fingerprint import FRAMES_PER_SEC, Fingerprint
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = os.environ.get("FINGERPRINT_DB_PATH") or os.environ.get("SEARCH_DB_PATH") or store.DB_PATH
+
+# 同じ時刻差で一致したハッシュ数・一致区間の長さ・区間内の一致率がこれ以上なら同じ内容とみなす
+MIN_MATCHES = int(os.environ.get("FINGERPRINT_MIN_MATCHES", "25"))
+MIN_SECONDS = float(os.environ.get("FINGERPRINT_MIN_SECONDS", "20"))
+MIN_SCORE = float(os.environ.get("FINGERPRINT_MIN_SCORE", "0.05"))
+# 一致区間の途中で、同じ時刻差の一致がこれ以上の秒数途切れたら、その間は内容が違う（差し替え・編集）とみなす
+MAX_HOLE_SECONDS = float(os.environ.get("FINGERPRINT_MAX_HOLE_SEC", "10"))
+# 索引にこれより多く出てくるハッシュ（無音・定常音など）は突き合わせに使わない
+MAX_HASH_ROWS = 200
+_QUERY_BATCH = 500
+
+_memory_conn: sqlite3.Connection | None = None
+_memory_lock = threading.Lock()
+_init_lock = threading.Lock()
+_initialized = False
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS audio_fingerprints ("
+    " hash INTEGER NOT NULL,"
+    " job_id TEXT NOT NULL,"
+    " t INTEGER NOT NULL,"
+    " PRIMARY KEY (hash, job_id, t)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS audio_fingerprints_job ON audio_fingerprints (job_id)",
+)
+
+
+class Match(NamedTuple):
+    job_id: str
+    offset: float   # 元ジョブの時刻 - 新しい音声の時刻（秒）
+    start: float    # 一致区間（新しい音声の秒）
+    end: float
+    matches: int    # 同じ時刻差で一致したハッシュ数
+    score: float    # 一致区間内のハッシュのうち一致した割合
+    # 一致区間の途中で一致が MAX_HOLE_SECONDS 以上途切れた区間（新しい音声の秒）。流用せずに文字起こしする
+    holes: tuple[tuple[float, float], ...] = ()
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    global _memory_conn
+    if INDEX_PATH:
+        conn = sqlite3.connect(INDEX_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        try:
+            _ensure_schema(conn)
+            yield conn
+        finally:
+            conn.close()
+        return
+    # インメモリは接続を閉じると消えるので1本を共有する
+    with _memory_lock:
+        if _memory_conn is None:
+            _memory_conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        _ensure_schema(_memory_conn)
+        yield _memory_conn
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            _initialized = True
+
+
+def add(job_id: str, fingerprint: Fingerprint) -> int:
+    """ジョブの指紋を索引し直す。保存したハッシュ数を返す。"""
+    rows = zip(fingerprint.hashes.tolist(), [job_id] * len(fingerprint.hashes), fingerprint.times.tolist())
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM audio_fingerprints WHERE job_id = ?", (job_id,))
+            conn.executemany("INSERT OR IGNORE INTO audio_fingerprints (hash, job_id, t) VALUES (?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return len(fingerprint.hashes)
+
+
+def remove(job_id: str) -> None:
+    with _connect() as conn:
+        conn.execute("DELETE FROM audio_fingerprints WHERE job_id = ?", (job_id,))
+
+
+def best_match(fingerprint: Fingerprint, exclude: str | None = None) -> Match | None:
+    """指紋が最もよく一致する既存ジョブ。しきい値に届かなければ None。"""
+    import numpy as np
+
+    if not len(fingerprint.hashes):
+        return None
+    unique = np.unique(fingerprint.hashes).tolist()
+    rows: list[tuple[int, str, int]] = []
+    with _connect() as conn:
+        for i in range(0, len(unique), _QUERY_BATCH):
+            batch = unique[i:i + _QUERY_BATCH]
+            rows += conn.execute(
+                f"SELECT hash, job_id, t FROM audio_fingerprints WHERE hash IN ({','.join('?' * len(batch))})"
+                " AND job_id != ?",
+                (*batch, exclude or ""),
+            ).fetchall()
+    if not rows:
+        return None
+
+    db_hash = np.fromiter((r[0] for r in rows), dtype=np.uint32, count=len(rows))
+    db_t = np.fromiter((r[2] for r in rows), dtype=np.int64, count=len(rows))
+    job_ids, db_job = np.unique(np.array([r[1] for r in rows]), return_inverse=True)
+    # ありふれたハッシュは除く
+    _, hash_inverse, rows_per_hash = np.unique(db_hash, return_inverse=True, return_counts=True)
+    keep = rows_per_hash[hash_inverse] <= MAX_HASH_ROWS
+    db_hash, db_t, db_job = db_hash[keep], db_t[keep], db_job[keep]
+
+    # 同じハッシュを持つ (新しい音声の出現, 既存の出現) の組を全部作る
+    order = np.argsort(fingerprint.hashes, kind="stable")
+    q_hash = fingerprint.hashes[order]
+    q_t = fingerprint.times[order].astype(np.int64)
+    lo = np.searchsorted(q_hash, db_hash, side="left")
+    hi = np.searchsorted(q_hash, db_hash, side="right")
+    counts = hi - lo
+    pair_db = np.repeat(np.arange(len(db_hash)), counts)
+    if not len(pair_db):
+        return None
+    # 各既存の出現について、新しい音声側の lo..hi-1 を展開する
+    pair_q = np.repeat(lo, counts) + np.arange(len(pair_db)) - np.repeat(np.cumsum(counts) - counts, counts)
+    offsets = db_t[pair_db] - q_t[pair_q]
+    pair_job = db_job[pair_db]
+
+    # (ジョブ, 時刻差) ごとに数え、±1 フレームのずれも合算して最多を取る
+    keys = pair_job.astype(np.int64) * (1 << 32) + (offsets + (1 << 31))
+    values, key_counts = np.unique(keys, return_counts=True)
+    smoothed = key_counts.copy()
+    for shift in (-1, 1):
+        idx = np.searchsorted(values, values + shift)
+        found = (idx < len(values)) & (values[np.minimum(idx, len(values) - 1)] == values + shift)
+        smoothed[found] += key_counts[idx[found]]
+    best = values[smoothed.argmax()]
+    best_job, best_offset = int(best >> 32), int((best & 0xFFFFFFFF) - (1 << 31))
+    matched = (pair_job == best_job) & (np.abs(offsets - best_offset) <= 1)
+    n_matched = int(matched.sum())
+
+    matched_t = q_t[pair_q[matched]]
+    start_frame, end_frame = int(matched_t.min()), int(matched_t.max())
+    in_region = int(((fingerprint.times >= start_frame) & (fingerprint.times <= end_frame)).sum())
+    anchors = np.unique(matched_t)
+    breaks = np.nonzero(np.diff(anchors) > MAX_HOLE_SECONDS * FRAMES_PER_SEC)[0]
+    holes = tuple((anchors[i] / FRAMES_PER_SEC, anchors[i + 1] / FRAMES_PER_SEC) for i in breaks.tolist())
+    match = Match(
+        job_id=str(job_ids[best_job]),
+        offset=best_offset / FRAMES_PER_SEC,
+        start=start_frame / FRAMES_PER_SEC,
+        end=min(fingerprint.duration, end_frame / FRAMES_PER_SEC + 1.0),
+        matches=n_matched,
+        score=n_matched / max(1, in_region),
+        holes=holes,
+    )
+    logger.info("Fingerprint best match: %s", match)
+    if n_matched < MIN_MATCHES or match.end - match.start < MIN_SECONDS or match.score < MIN_SCORE:
+        return None
+    return match
@@ -0,0 +1,390 @@
+"""
+ジョブキュー。API プロセスが enqueue し、ワーカーがリース付きで claim する。
+
+- リースは LEASE_SECONDS で失効する。ワーカーは heartbeat で延長し続ける
+- 失効したリースは次の claim 時に自動で queued に戻る（MAX_ATTEMPTS 回まで）
+- complete / heartbeat はリーストークンが一致する場合のみ成功する（フェンシング）。
+  リースを失ったワーカーの結果は捨てられるので、ジョブの結果は1回分だけ反映される
+- 取り出し順は見積もり所要秒の短い順（SJF）。待った秒数 × QUEUE_AGING だけ優先度を上げるので
+  長いジョブもいずれ先頭に来る。処理中ジョブの見積もりメモリの合計が予算（cost_model）を
+  超えるジョブは、メモリが空くまで後回しにする
+
+バックエンドは QUEUE_BACKEND で選ぶ:
+  inprocess: プロセス内（デフォルト。API プロセス内のワーカースレッドで処理）
+  sqlite:    JOB_DB_PATH の SQLite（同じボリュームを見る複数プロセスで共有）
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+import cost_model
+import store
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = float(os.environ.get("QUEUE_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.environ.get("QUEUE_MAX_ATTEMPTS", "3"))
+# 1秒待つごとに見積もり所要秒から引く秒数（大きいほど到着順に近づく）
+QUEUE_AGING = float(os.environ.get("QUEUE_AGING", "1.0"))
+# 先頭のジョブがこれ以上待っていてメモリ待ちなら、後ろのジョブに追い越させない
+QUEUE_STARVATION_SECONDS = float(os.environ.get("QUEUE_STARVATION_SECONDS", "1800"))
+
+
+@dataclass
+class Lease:
+    job_id: str
+    token: str
+    worker_id: str
+    attempt: int
+
+
+@dataclass
+class _Entry:
+    job_id: str
+    seconds: float      # 見積もり所要秒
+    memory_mb: float    # 見積もりピークメモリ
+    enqueued_at: float  # time.time()
+
+
+class InProcessQueue:
+    """プロセス内のキュー。単一コンテナ構成用（外部サービス不要）。"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queued: dict[str, _Entry] = {}
+        # job_id -> (lease, expires_at, entry, started_at)
+        self._leases: dict[str, tuple[Lease, float, _Entry, float]] = {}
+        self._attempts: dict[str, int] = {}
+
+    def enqueue(self, job_id: str, seconds: float = cost_model.DEFAULT_COST[0],
+                memory_mb: float = cost_model.DEFAULT_COST[1]) -> None:
+        with self._cond:
+            if job_id in self._queued or job_id in self._leases:
+                return
+            self._attempts.pop(job_id, None)
+            self._queued[job_id] = _Entry(job_id, seconds, memory_mb, time.time())
+            self._cond.notify()
+
+    def claim(self, worker_id: str, timeout: float = 1.0) -> Lease | None:
+        exhausted: list[Lease] = []
+        try:
+            with self._cond:
+                exhausted += self._requeue_expired()
+                entry = self._pick()
+                if entry is None:
+                    self._cond.wait(timeout)
+                    exhausted += self._requeue_expired()
+                    entry = self._pick()
+                    if entry is None:
+                        return None
+                job_id = entry.job_id
+                del self._queued[job_id]
+                attempt = self._attempts.get(job_id, 0) + 1
+                self._attempts[job_id] = attempt
+                lease = Lease(job_id, uuid.uuid4().hex, worker_id, attempt)
+                self._leases[job_id] = (lease, time.monotonic() + LEASE_SECONDS, entry, time.time())
+                return lease
+        finally:
+            for lost in exhausted:
+                _give_up(lost)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        with self._cond:
+            held = self._leases.get(lease.job_id)
+            if held is None or held[0].token != lease.token:
+                return False
+            self._leases[lease.job_id] = (held[0], time.monotonic() + LEASE_SECONDS, *held[2:])
+            return True
+
+    def complete(self, lease: Lease) -> bool:
+        with self._cond:
+            held = self._leases.get(lease.job_id)
+            if held is None or held[0].token != lease.token:
+                return False
+            del self._leases[lease.job_id]
+            self._attempts.pop(lease.job_id, None)
+            self._cond.notify_all()  # メモリが空いたのでメモリ待ちのジョブを取れるかもしれない
+            return True
+
+    def release(self, lease: Lease) -> None:
+        """処理せずにリースを返す（シャットダウン時など）。"""
+        with self._cond:
+            held = self._leases.get(lease.job_id)
+            if held is not None and held[0].token == lease.token:
+                del self._leases[lease.job_id]
+                self._attempts[lease.job_id] = max(0, lease.attempt - 1)
+                self._queued[lease.job_id] = held[2]  # 待った時間（エイジング）は引き継ぐ
+                self._cond.notify()
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._queued)
+
+    def estimate(self, job_id: str) -> dict | None:
+        """待ち順位と ETA。キューにいなければ None。"""
+        with self._cond:
+            running = [(entry.seconds, started) for _, _, entry, started in self._leases.values()]
+            return _eta(list(self._queued.values()), running, job_id)
+
+    def _pick(self) -> _Entry | None:
+        in_use = sum(entry.memory_mb for _, _, entry, _ in self._leases.values())
+        return _pick(list(self._queued.values()), time.time(), in_use)
+
+    def _requeue_expired(self) -> list[Lease]:
+        """失効したリースを queued に戻し、試行回数の上限に達したリースを返す。"""
+        now = time.monotonic()
+        exhausted = []
+        for job_id, (lease, expires, entry, _) in list(self._leases.items()):
+            if expires > now:
+                continue
+            del self._leases[job_id]
+            if _should_requeue(lease):
+                self._queued[job_id] = entry
+            else:
+                self._attempts.pop(job_id, None)
+                exhausted.append(lease)
+        return exhausted
+
+
+class SQLiteQueue:
+    """JOB_DB_PATH の SQLite を使うキュー。複数のワーカープロセスで共有できる。"""
+
+    def __init__(self):
+        if not store.DB_PATH:
+            raise RuntimeError("QUEUE_BACKEND=sqlite には JOB_DB_PATH の設定が必要です")
+        conn = store.connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                " job_id TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL,"          # queued | leased
+                " enqueued_at REAL NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " lease_token TEXT,"
+                " lease_owner TEXT,"
+                " lease_expires REAL,"
+                " cost_seconds REAL NOT NULL DEFAULT 0,"
+                " memory_mb REAL NOT NULL DEFAULT 0,"
+                " leased_at REAL)"
+            )
+            # 見積もり導入前に作られたテーブルに列を足す
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(queue)")}
+            for column, decl in (("cost_seconds", "REAL NOT NULL DEFAULT 0"),
+                                 ("memory_mb", "REAL NOT NULL DEFAULT 0"), ("leased_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE queue ADD COLUMN {column} {decl}")
+            conn.execute("CREATE INDEX IF NOT EXISTS queue_state ON queue (state, enqueued_at)")
+        finally:
+            conn.close()
+
+    def enqueue(self, job_id: str, seconds: float = cost_model.DEFAULT_COST[0],
+                memory_mb: float = cost_model.DEFAULT_COST[1]) -> None:
+        conn = store.connect()
+        try:
+            conn.execute(
+                "INSERT INTO queue (job_id, state, enqueued_at, cost_seconds, memory_mb)"
+                " VALUES (?, 'queued', ?, ?, ?) ON CONFLICT (job_id) DO NOTHING",
+                (job_id, time.time(), seconds, memory_mb),
+            )
+        finally:
+            conn.close()
+
+    def claim(self, worker_id: str, timeout: float = 1.0) -> Lease | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            lease = self._try_claim(worker_id)
+            if lease is not None or time.monotonic() >= deadline:
+                return lease
+            time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+
+    def _try_claim(self, worker_id: str) -> Lease | None:
+        exhausted: list[Lease] = []
+        conn = store.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            expired = conn.execute(
+                "SELECT job_id, lease_token, lease_owner, attempts FROM queue"
+                " WHERE state = 'leased' AND lease_expires < ?",
+                (now,),
+            ).fetchall()
+            for job_id, token, owner, attempts in expired:
+                lost = Lease(job_id, token, owner, attempts)
+                if _should_requeue(lost):
+                    # enqueued_at はそのまま（待った時間のエイジングを引き継ぐ）
+                    conn.execute(
+                        "UPDATE queue SET state = 'queued', lease_token = NULL,"
+                        " lease_owner = NULL, lease_expires = NULL, leased_at = NULL WHERE job_id = ?",
+                        (job_id,),
+                    )
+                else:
+                    conn.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+                    exhausted.append(lost)
+            rows = conn.execute(
+                "SELECT job_id, cost_seconds, memory_mb, enqueued_at, attempts FROM queue WHERE state = 'queued'"
+            ).fetchall()
+            in_use = conn.execute(
+                "SELECT COALESCE(SUM(memory_mb), 0) FROM queue WHERE state = 'leased'"
+            ).fetchone()[0]
+            entry = _pick([_Entry(*row[:4]) for row in rows], now, in_use)
+            if entry is None:
+                conn.execute("COMMIT")
+                return None
+            attempts = next(row[4] for row in rows if row[0] == entry.job_id)
+            lease = Lease(entry.job_id, uuid.uuid4().hex, worker_id, attempts + 1)
+            conn.execute(
+                "UPDATE queue SET state = 'leased', attempts = ?, lease_token = ?, lease_owner = ?,"
+                " lease_expires = ?, leased_at = ? WHERE job_id = ?",
+                (lease.attempt, lease.token, worker_id, now + LEASE_SECONDS, now, entry.job_id),
+            )
+            conn.execute("COMMIT")
+            return lease
+        finally:
+            conn.close()
+            # ジョブの更新は別接続で行うため、キューのトランザクションを閉じてから
+            for lost in exhausted:
+                _give_up(lost)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        conn = store.connect()
+        try:
+            cur = conn.execute(
+                "UPDATE queue SET lease_expires = ? WHERE job_id = ? AND lease_token = ?",
+                (time.time() + LEASE_SECONDS, lease.job_id, lease.token),
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, lease: Lease) -> bool:
+        conn = store.connect()
+        try:
+            cur = conn.execute(
+                "DELETE FROM queue WHERE job_id = ? AND lease_token = ?", (lease.job_id, lease.token)
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def release(self, lease: Lease) -> None:
+        conn = store.connect()
+        try:
+            conn.execute(
+                "UPDATE queue SET state = 'queued', attempts = ?, lease_token = NULL, lease_owner = NULL,"
+                " lease_expires = NULL, leased_at = NULL WHERE job_id = ? AND lease_token = ?",
+                (max(0, lease.attempt - 1), lease.job_id, lease.token),
+            )
+        finally:
+            conn.close()
+
+    def depth(self) -> int:
+        conn = store.connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM queue WHERE state = 'queued'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def estimate(self, job_id: str) -> dict | None:
+        conn = store.connect()
+        try:
+            queued = conn.execute(
+                "SELECT job_id, cost_seconds, memory_mb, enqueued_at FROM queue WHERE state = 'queued'"
+            ).fetchall()
+            running = conn.execute(
+                "SELECT cost_seconds, leased_at FROM queue WHERE state = 'leased'"
+            ).fetchall()
+        finally:
+            conn.close()
+        return _eta([_Entry(*row) for row in queued], [(s, t or time.time()) for s, t in running], job_id)
+
+
+def _rank(entries: list[_Entry], now: float) -> list[_Entry]:
+    """優先度順（見積もり所要秒 - 待った秒 × QUEUE_AGING。同じなら到着順）。"""
+    return sorted(entries, key=lambda e: (e.seconds - QUEUE_AGING * (now - e.enqueued_at), e.enqueued_at))
+
+
+def _pick(entries: list[_Entry], now: float, in_use_mb: float) -> _Entry | None:
+    """次に処理するジョブ。メモリ予算に空きがなければ None。"""
+    ranked = _rank(entries, now)
+    if not ranked:
+        return None
+    budget = cost_model.MEMORY_BUDGET_MB
+    head = ranked[0]
+    # 何も処理していなければ予算を超えるジョブでも通す（永久に待たせない）
+    if not budget or in_use_mb <= 0 or head.memory_mb <= budget - in_use_mb:
+        return head
+    if now - head.enqueued_at >= QUEUE_STARVATION_SECONDS:
+        return None  # 先頭のためにメモリが空くのを待つ
+    return next((e for e in ranked[1:] if e.memory_mb <= budget - in_use_mb), None)
+
+
+def _eta(queued: list[_Entry], running: list[tuple[float, float]], job_id: str) -> dict | None:
+    """
+    先に処理されるジョブと処理中ジョブの残り秒をワーカー数で割って待ち時間を出す。
+    running: [(見積もり所要秒, 開始時刻)]
+    """
+    now = time.time()
+    ranked = _rank(queued, now)
+    position = next((i for i, e in enumerate(ranked) if e.job_id == job_id), None)
+    if position is None:
+        return None
+    busy = sum(max(0.0, seconds - (now - started)) for seconds, started in running)
+    wait = (sum(e.seconds for e in ranked[:position]) + busy) / _worker_slots()
+    return {
+        "position": position + 1,
+        "wait_seconds": round(wait, 1),
+        "eta_seconds": round(wait + ranked[position].seconds, 1),
+    }
+
+
+def _worker_slots() -> int:
+    """同時に処理できるジョブ数（ETA 用）。QUEUE_WORKER_SLOTS で上書きできる。"""
+    if os.environ.get("QUEUE_WORKER_SLOTS"):
+        return max(1, int(os.environ["QUEUE_WORKER_SLOTS"]))
+    import worker
+
+    return max(1, worker.EMBEDDED_WORKERS or worker.WORKER_CONCURRENCY)
+
+
+def _should_requeue(lease: Lease) -> bool:
+    """失効したリースを再キューするか。試行回数の上限に達していたら False。"""
+    if lease.attempt >= MAX_ATTEMPTS:
+        logger.error("[%s] Lease lost %d times (last worker %s), giving up",
+                     lease.job_id, lease.attempt, lease.worker_id)
+        return False
+    logger.warning("[%s] Lease held by %s expired, re-queueing (attempt %d)",
+                   lease.job_id, lease.worker_id, lease.attempt)
+    return True
+
+
+def _give_up(lease: Lease) -> None:
+    store.update_job(lease.job_id, status="error", error="ワーカーが応答しなくなったため処理を中断しました")
+
+
+_BACKENDS = {
+    "inprocess": InProcessQueue,
+    "sqlite": SQLiteQueue,
+}
+
+BACKEND = os.environ.get("QUEUE_BACKEND") or ("sqlite" if store.DB_PATH else "inprocess")
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """設定されたバックエンドのキューを返す（プロセス内で1つ）。"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if BACKEND not in _BACKENDS:
+                raise ValueError(f"Unknown QUEUE_BACKEND: {BACKEND}")
+            _queue = _BACKENDS[BACKEND]()
+            logger.info("Job queue backend: %s", BACKEND)
+        return _queue
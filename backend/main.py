@@ -12,11 +12,35 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
 )
 
-from fastapi import FastAPI
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routers import upload, generate
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+import warmup  # 起動時刻を記録するので先に import する
+import metrics
+import worker
+from routers import upload, generate, search, clips, waveform, profiles
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # インメモリ構成ではこのプロセス内のワーカーがキューを処理する
+    stop = threading.Event()
+    # 重いモジュール・Whisper モデルの準備はバックグラウンドで（起動は待たせない。/ready で完了が分かる）
+    warmup.start_in_background()
+    if worker.EMBEDDED_WORKERS > 0:
+        from services import ollama_engine
 
-app = FastAPI(title="Multi-Viral AI API", version="0.1.0")
+        ollama_engine.warm_in_background()
+        worker.start_workers(worker.EMBEDDED_WORKERS, stop)
+    yield
+    stop.set()
+
+
+app = FastAPI(title="Multi-Viral AI API", version="0.1.0", lifespan=lifespan)
 
 # CORS: ローカル + Vercel (*.vercel.app)
 _cors_origins = [
@@ -32,13 +56,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 大きいレスポンス（文字起こし・結果入りのジョブ）を圧縮する。brotli-asgi があれば brotli を優先
+try:
+    from brotli_asgi import BrotliMiddleware
+
+    app.add_middleware(BrotliMiddleware, minimum_size=1024, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 app.include_router(upload.router, prefix="/api")
 app.include_router(generate.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+app.include_router(clips.router, prefix="/api")
+app.include_router(waveform.router, prefix="/api")
+app.include_router(profiles.router, prefix="/api")
 
 
 @app.get("/")
 def root():
-    return {"message": "Multi-Viral AI API", "docs": "/docs", "health": "/health"}
+    return {"message": "Multi-Viral AI API", "docs": "/docs", "health": "/health", "ready": "/ready", "metrics": "/metrics"}
 
 
 @app.get("/health")
@@ -46,6 +82,22 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """
+    ウォームアップ（STARTUP_WARMUP=1）が終わったら 200、それまでは 503。
+    /health はプロセスが応答するかだけを見る。無効なら常に 200。
+    """
+    return JSONResponse(warmup.status(), status_code=200 if warmup.is_ready() else 503)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus 形式のメトリクス。"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,197 @@
+"""
+Prometheus メトリクス。
+/metrics で公開する。ステージ別の所要時間とトークン使用量はジョブにも記録する。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+import cancellation
+import job_queue
+import profiling
+import store
+
+# パイプラインのステージ名（ジョブの timings のキーにもなる）
+STAGES = ("download", "extract", "transcribe", "generate")
+
+# /metrics で常に 0 を含めて出すステータス
+JOB_STATUSES = (
+    "uploaded", "processing", "downloading", "transcribing", "generating",
+    "completed", "error", "cancelled", "timed_out",
+)
+
+_DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+
+STAGE_DURATION = Histogram(
+    "mva_stage_duration_seconds",
+    "パイプライン各ステージの所要時間",
+    ["stage"],
+    buckets=_DURATION_BUCKETS,
+)
+QUEUE_DEPTH = Gauge("mva_queue_depth", "キューで処理開始待ちのジョブ数")
+JOBS_BY_STATUS = Gauge("mva_jobs", "ステータス別のジョブ数", ["status"])
+PROVIDER_LATENCY = Histogram(
+    "mva_provider_latency_seconds",
+    "外部プロバイダ呼び出しのレイテンシ（kind=asr|llm, path=フォールバック経路）",
+    ["kind", "provider", "path"],
+    buckets=_DURATION_BUCKETS,
+)
+PROVIDER_ERRORS = Counter(
+    "mva_provider_errors_total",
+    "外部プロバイダ呼び出しの失敗数",
+    ["kind", "provider", "path"],
+)
+LLM_TOKENS = Counter(
+    "mva_llm_tokens_total",
+    "LLM のトークン数（direction=input|output|cache_read|cache_write）",
+    ["provider", "direction"],
+)
+RATELIMIT_WAIT = Gauge(
+    "mva_llm_ratelimit_wait_seconds",
+    "今リクエストした場合の LLM レート制限の推定待ち時間",
+    ["provider"],
+)
+RATELIMIT_WAITING = Gauge("mva_llm_ratelimit_waiting", "LLM レート制限の枠待ちのリクエスト数", ["provider"])
+RATELIMIT_WAITED = Histogram(
+    "mva_llm_ratelimit_waited_seconds",
+    "LLM レート制限で実際に待った時間",
+    ["provider"],
+    buckets=(0, 0.5, 1, 2, 5, 10, 30, 60, 120, 300),
+)
+LLM_INFLIGHT = Gauge("mva_llm_inflight", "LLM サーバーに送信中のリクエスト数（同時実行数の上限内）", ["provider"])
+LLM_SLOT_WAITING = Gauge("mva_llm_slot_waiting", "LLM サーバーの同時実行枠の空き待ちのリクエスト数", ["provider"])
+TRANSFER_BYTES = Counter(
+    "mva_transfer_bytes_total",
+    "転送バイト数（direction=downloaded|uploaded）",
+    ["direction", "source"],
+)
+
+# 処理中のジョブ ID（_process_job の中でバインドする）
+_current_job: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_job", default=None)
+# 並列生成で同じジョブの usage を複数スレッドから加算するため
+_usage_lock = threading.Lock()
+
+
+def bind_job(job_id: str | None) -> None:
+    """以降のメトリクス記録を job_id に紐づける。"""
+    _current_job.set(job_id)
+
+
+def current_job() -> str | None:
+    return _current_job.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """ステージの所要時間をヒストグラムとジョブの timings に記録する。失敗時も記録する。"""
+    started = time.perf_counter()
+    profile = profiling.current()
+    try:
+        with profile.stage(name) if profile is not None else nullcontext():
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.labels(stage=name).observe(elapsed)
+        job_id = _current_job.get()
+        job = store.get_job(job_id) if job_id else None
+        if job is not None:
+            timings = dict(job.get("timings") or {})
+            timings[name] = round(elapsed, 3)
+            store.update_job(job_id, timings=timings)
+
+
+@contextmanager
+def track_provider(kind: str, provider: str, path: str) -> Iterator[None]:
+    """
+    プロバイダ呼び出しのレイテンシとエラーを記録する。例外はそのまま送出する。
+    キャンセル・期限切れ（JobCancelled）はプロバイダの失敗ではないのでエラーに数えない。
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except cancellation.JobCancelled:
+        raise
+    except BaseException:
+        PROVIDER_ERRORS.labels(kind=kind, provider=provider, path=path).inc()
+        raise
+    finally:
+        PROVIDER_LATENCY.labels(kind=kind, provider=provider, path=path).observe(
+            time.perf_counter() - started
+        )
+
+
+def record_tokens(
+    provider: str,
+    input_tokens: int | None,
+    output_tokens: int | None,
+    cache_read: int | None = 0,
+    cache_write: int | None = 0,
+) -> None:
+    """
+    LLM のトークン数を記録する。ジョブがバインドされていればジョブの usage にも加算する。
+    cache_read / cache_write: プロンプトキャッシュから読んだ / に書いたトークン数
+    （input_tokens に含まれるかはプロバイダによる。Claude は含まない、Gemini は含む）
+    """
+    counts = {
+        "input_tokens": int(input_tokens or 0),
+        "output_tokens": int(output_tokens or 0),
+        "cache_read_tokens": int(cache_read or 0),
+        "cache_write_tokens": int(cache_write or 0),
+    }
+    for key, n in counts.items():
+        LLM_TOKENS.labels(provider=provider, direction=key.removesuffix("_tokens")).inc(n)
+
+    job_id = _current_job.get()
+    # キャンセル後に見捨てられたスレッドから届いた分はジョブに書かない（全体のカウンタには数える）
+    if not job_id or cancellation.is_cancelled():
+        return
+    with _usage_lock:
+        job = store.get_job(job_id)
+        if job is not None:
+            usage = dict(job.get("usage") or {})
+            for key, n in counts.items():
+                usage[key] = usage.get(key, 0) + n
+            store.update_job(job_id, usage=usage)
+
+
+def record_ratelimit_wait(provider: str, seconds: float) -> None:
+    """レート制限の待ち時間を記録する。ジョブがバインドされていればジョブの usage にも加算する。"""
+    RATELIMIT_WAITED.labels(provider=provider).observe(seconds)
+    job_id = _current_job.get()
+    if not job_id or seconds < 0.001 or cancellation.is_cancelled():
+        return
+    with _usage_lock:
+        job = store.get_job(job_id)
+        if job is not None:
+            usage = dict(job.get("usage") or {})
+            usage["ratelimit_wait_seconds"] = round(usage.get("ratelimit_wait_seconds", 0) + seconds, 3)
+            store.update_job(job_id, usage=usage)
+
+
+def record_bytes(direction: str, source: str, num_bytes: int) -> None:
+    """転送バイト数を記録する。direction: downloaded | uploaded"""
+    if num_bytes > 0:
+        TRANSFER_BYTES.labels(direction=direction, source=source).inc(num_bytes)
+
+
+def _refresh_job_gauges() -> None:
+    counts = dict.fromkeys(JOB_STATUSES, 0)
+    for job in store.list_jobs():
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    JOBS_BY_STATUS.clear()
+    for status, n in counts.items():
+        JOBS_BY_STATUS.labels(status=status).set(n)
+    QUEUE_DEPTH.set(job_queue.get_queue().depth())
+
+
+def render() -> tuple[bytes, str]:
+    """Prometheus テキスト形式の (本文, Content-Type) を返す。"""
+    _refresh_job_gauges()
+    return generate_latest(), CONTENT_TYPE_LATEST
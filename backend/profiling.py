@@ -0,0 +1,258 @@
+"""
+ジョブ単位のプロファイリング（オプトイン）。
+
+POST /api/generate/{id}?profile=1 で指定したジョブと、PROFILE_SAMPLE_PERCENT % の
+ジョブを抜き取りで、_process_job 全体をプロファイルする。
+
+  - サンプリングプロファイラ: ジョブのスレッドと、ジョブのコンテキストで動くスレッド
+    （cancellation.call の呼び出し・並列生成など。attach_thread() で登録）のスタックを
+    PROFILE_INTERVAL_MS ごとに記録する。スタックの根にはスレッド名（thread:job 等）を付ける
+    （決定的プロファイラと違い、関数呼び出しごとのオーバーヘッドがない）
+  - ステージごと（metrics.stage）: 経過時間・プロセスの CPU 時間・子プロセス（ffmpeg 等）の CPU 時間・
+    tracemalloc のメモリ確保ピーク（経過時間以外はプロセス全体の値。同時に動く他のジョブの分も含む）
+  - サンプルに多く現れた（時間を使った）関数の上位 PROFILE_TOP_N 件（スレッドをまたいで合計する）
+
+要約はジョブの profile に、スタック全体（flamegraph / speedscope 用の folded 形式）を含む
+成果物は uploads/profiles/{job_id}.json に保存し、GET /api/jobs/{id}/profile で取得できる。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+import store
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_PERCENT = float(os.environ.get("PROFILE_SAMPLE_PERCENT", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "10"))
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "25"))
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "profiles")
+MAX_STACK_DEPTH = 64
+
+_current: contextvars.ContextVar[JobProfile | None] = contextvars.ContextVar("job_profile", default=None)
+
+# tracemalloc はプロセス全体で1つなので、プロファイル中のジョブ数で開始・停止する
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_ours = False
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class JobProfile:
+    def __init__(self, job_id: str, reason: str):
+        self.job_id = job_id
+        self.reason = reason  # requested | sampled
+        self._threads: dict[int, str] = {threading.get_ident(): "job"}  # スレッド ID -> スタックの根のラベル
+        self._threads_lock = threading.Lock()
+        self.interval = PROFILE_INTERVAL_MS / 1000
+        self.stacks: Counter[str] = Counter()
+        self.stages: dict[str, dict] = {}
+        self._open_peaks: list[int] = []  # 入れ子のステージごとのメモリ確保ピーク
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{job_id[:8]}", daemon=True)
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._threads_lock:
+                threads = list(self._threads.items())
+            for thread_id, label in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join([f"thread:{label}", *reversed(stack)])] += 1
+
+    @contextmanager
+    def attach(self, label: str) -> Iterator[None]:
+        """この中の間、呼び出したスレッドもサンプリングする。"""
+        thread_id = threading.get_ident()
+        with self._threads_lock:
+            self._threads[thread_id] = label
+        try:
+            yield
+        finally:
+            with self._threads_lock:
+                self._threads.pop(thread_id, None)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """ステージの経過時間・CPU 時間（プロセス全体）・メモリ確保ピークを記録する。"""
+        wall, cpu, children = time.perf_counter(), time.process_time(), _children_cpu()
+        self._take_peak()  # ここまでのピークは外側のステージの分
+        self._open_peaks.append(0)
+        try:
+            yield
+        finally:
+            peak = max(self._open_peaks.pop(), self._take_peak())
+            if self._open_peaks:  # 外側のステージのピークにも含める
+                self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+            self.stages[name] = {
+                "wall_seconds": round(time.perf_counter() - wall, 3),
+                # ジョブが使うスレッドをすべて含めるためプロセス全体の値（同時に動く他のジョブの分も含む）
+                "process_cpu_seconds": round(time.process_time() - cpu, 3),
+                "children_cpu_seconds": round(_children_cpu() - children, 3),
+                "alloc_peak_mb": round(peak / 1e6, 1) if tracemalloc.is_tracing() else None,
+            }
+
+    def _take_peak(self) -> int:
+        """前回からのメモリ確保ピークを読んでリセットする。"""
+        if not tracemalloc.is_tracing():
+            return 0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        for i, open_peak in enumerate(self._open_peaks):
+            self._open_peaks[i] = max(open_peak, peak)
+        return peak
+
+    def _top_functions(self) -> list[dict]:
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # 根のスレッド名は除く
+            own[frames[-1]] += count
+            for label in set(frames):  # 再帰は1回だけ数える
+                total[label] += count
+        return [
+            {
+                "function": label,
+                "self_seconds": round(own[label] * self.interval, 3),
+                "total_seconds": round(total[label] * self.interval, 3),
+            }
+            for label, _ in own.most_common(PROFILE_TOP_N)
+        ]
+
+    def summary(self, wall: float, cpu: float) -> dict:
+        return {
+            "reason": self.reason,
+            "wall_seconds": round(wall, 3),
+            "process_cpu_seconds": round(cpu, 3),
+            "samples": sum(self.stacks.values()),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "stages": self.stages,
+            "top_functions": self._top_functions(),
+            "artifact": f"/api/jobs/{self.job_id}/profile",
+        }
+
+
+def current() -> JobProfile | None:
+    """このコンテキストでプロファイル中のジョブ（metrics.stage から使う）。"""
+    return _current.get()
+
+
+@contextmanager
+def attach_thread(label: str | None = None) -> Iterator[None]:
+    """
+    プロファイル中のジョブのコンテキストで動くスレッドをサンプリング対象にする。
+    ジョブのコンテキストをコピーして別スレッドで処理を動かす箇所（cancellation.call 等）から使う。
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.attach(label or threading.current_thread().name.split("-")[0].split("_")[0]):
+        yield
+
+
+def run_attached(fn, *args, **kwargs):
+    """attach_thread() の中で fn を呼ぶ（contextvars.Context.run に渡す用）。"""
+    with attach_thread():
+        return fn(*args, **kwargs)
+
+
+def _should_profile(job_id: str) -> str | None:
+    job = store.get_job(job_id) or {}
+    if job.get("profile_requested"):
+        return "requested"
+    if PROFILE_SAMPLE_PERCENT > 0 and random.random() * 100 < PROFILE_SAMPLE_PERCENT:
+        return "sampled"
+    return None
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_ours
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_ours = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_ours
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_ours:
+            tracemalloc.stop()
+            _tracemalloc_ours = False
+
+
+@contextmanager
+def profile_job(job_id: str) -> Iterator[None]:
+    """指定・抜き取り対象のジョブならプロファイルする。対象外なら何もしない。"""
+    reason = _should_profile(job_id)
+    if reason is None:
+        yield
+        return
+
+    profile = JobProfile(job_id, reason)
+    token = _current.set(profile)
+    _start_tracemalloc()
+    wall, cpu = time.perf_counter(), time.process_time()
+    profile._sampler.start()
+    logger.info("[%s] Profiling job (%s, every %.0fms)", job_id, reason, PROFILE_INTERVAL_MS)
+    try:
+        yield
+    finally:
+        profile._stop.set()
+        profile._sampler.join()
+        _stop_tracemalloc()
+        _current.reset(token)
+        summary = profile.summary(time.perf_counter() - wall, time.process_time() - cpu)
+        try:
+            _save(profile, summary)
+        except Exception:
+            logger.exception("[%s] Failed to save profile", job_id)
+
+
+def _save(profile: JobProfile, summary: dict) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = artifact_path(profile.job_id)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"job_id": profile.job_id, **summary, "stacks": dict(profile.stacks)}, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    store.update_job(profile.job_id, profile=summary)
+    logger.info("[%s] Profile saved: %d samples, %s", profile.job_id, summary["samples"], path)
+
+
+def artifact_path(job_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{job_id}.json")
+
+
+def to_folded(artifact: dict) -> str:
+    """成果物のスタックを folded 形式（"a;b;c 回数" の行）にする。flamegraph.pl / speedscope で読める。"""
+    return "".join(f"{stack} {count}\n" for stack, count in artifact.get("stacks", {}).items())
@@ -0,0 +1,57 @@
+"""viral_clips の切り抜き書き出し。"""
+
+import json
+import os
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
+
+import store
+from services.clip_exporter import export_clips
+
+router = APIRouter(tags=["clips"])
+
+CLIPS_DIR = os.path.join(os.path.dirname(__file__), "..", "uploads", "clips")
+
+
+@router.post("/jobs/{job_id}/clips")
+async def export_job_clips(
+    job_id: str,
+    accurate: bool = Query(False, description="true: 再エンコードして指定位置ちょうどで切る"),
+):
+    """
+    viral_clips を元ファイルから書き出す。終わったクリップから1行ずつ NDJSON で返す:
+    {"index", "title", "start", "end", "mode", "size", "url"} または {"index", "title", "error"}
+    """
+    job = store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    clips = (job.get("results") or {}).get("viral_clips") or []
+    if not clips:
+        raise HTTPException(status_code=409, detail="Job has no viral clips yet")
+    source = job.get("file_path")
+    if not source or not os.path.exists(source):
+        raise HTTPException(status_code=409, detail="Source file is no longer available")
+
+    def stream():
+        exported = dict(job.get("clip_files") or {})
+        for result in export_clips(source, clips, job.get("segments"), os.path.join(CLIPS_DIR, job_id), accurate):
+            if "path" in result:
+                exported[str(result["index"])] = result.pop("path")
+                store.update_job(job_id, clip_files=exported)
+                result["url"] = f"/api/jobs/{job_id}/clips/{result['index']}"
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    # 圧縮ミドルウェアは本文をまとめてから送るので、書き出せたクリップから届くように圧縮させない
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"Content-Encoding": "identity"})
+
+
+@router.get("/jobs/{job_id}/clips/{index}")
+async def download_clip(job_id: str, index: int):
+    job = store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    path = (job.get("clip_files") or {}).get(str(index))
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Clip not exported")
+    return FileResponse(path, filename=f"{job_id[:8]}_clip{index:02d}{os.path.splitext(path)[1]}")
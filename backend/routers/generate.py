@@ -1,14 +1,27 @@
-"""コンテンツ生成パイプライン。BackgroundTasks で非同期実行する。"""
+"""コンテンツ生成パイプライン。キューに積み、ワーカーで非同期実行する。"""
 
 import os
 import logging
+import zlib
+from typing import Callable
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 
+import cancellation
+import cost_model
+import fingerprint_index
+import job_queue
+import metrics
+import search_index
 import store
-from services.audio_extractor import extract_audio
+from segments import SegmentArray
+from services import fingerprint
+from services.audio_extractor import cut_audio, extract_audio
 from services.transcription import transcribe_audio
-from services.ai_generator import generate_content
+from services.waveform import write_peaks
+from services.ai_generator import ARTIFACTS, generate_languages
 from services.youtube_downloader import download_youtube_audio, is_youtube_url
 
 logger = logging.getLogger(__name__)
@@ -17,23 +30,53 @@ router = APIRouter(tags=["generate"])
 
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "..", "uploads")
 
+# 終了済みのステータス
+TERMINAL_STATUSES = ("completed", "error", "cancelled", "timed_out")
+CANCELLED_STATUSES = ("cancelled", "timed_out")
 
-def _process_job(job_id: str):
+
+class RegenerateRequest(BaseModel):
+    artifacts: list[str]  # viral_clips | x_thread | blog_article
+
+
+def _process_job(job_id: str, still_leased: Callable[[], bool] | None = None):
     """
-    バックグラウンドで実行される処理パイプライン。
+    ワーカー（worker.py）で実行される処理パイプライン。
 
-    Step 1: 動画 → 音声抽出 (moviepy)
+    Step 1: 動画 → 音声抽出 (ffmpeg)
     Step 2: 音声 → 文字起こし (Whisper API)
     Step 3: 文字起こし → コンテンツ生成 (Claude API)
     Step 4: 結果を保存、ステータスを completed に更新
+
+    still_leased: 結果を書き込む直前に呼ぶ。False ならリースを失っている
+                  （別ワーカーが再実行中）ので結果を書き込まない。
+
+    job に regenerate（成果物名のリスト）があれば、保存済みの文字起こしから
+    その成果物だけを生成し直す（POST /api/jobs/{id}/regenerate）。
+
+    各ステップは STAGE_TIMEOUTS の制限時間付きで実行し、キャンセル要求
+    （POST /api/jobs/{id}/cancel）が来たら実行中の処理を止めて一時ファイルを消す。
     """
     job = store.get_job(job_id)
     if job is None:
         logger.error("Job %s not found", job_id)
         return
+    if job["status"] in CANCELLED_STATUSES or job.get("cancel_requested"):
+        logger.info("[%s] Cancelled before start, skipping", job_id)
+        store.update_job(job_id, status="cancelled", error="ジョブがキャンセルされました")
+        return
 
+    token = cancellation.CancelToken(job_id)
+    stop_watch = cancellation.watch(token, lambda: bool((store.get_job(job_id) or {}).get("cancel_requested")))
+    metrics.bind_job(job_id)
+    cancellation.bind(token)
+    audio_path = None
+    file_path = job.get("file_path") or ""
     try:
-        file_path = job.get("file_path") or ""
+        if job.get("regenerate"):
+            _regenerate(job_id, job, still_leased)
+            return
+
         source_url = job.get("source_url") or ""
         source_type = job.get("source_type") or ""
         logger.info("[%s] source_type=%s, source_url=%s, file_path=%s",
@@ -50,7 +93,9 @@ def _process_job(job_id: str):
             store.update_job(job_id, status="downloading")
             logger.info("[%s] Step 0: Downloading from YouTube: %s", job_id, source_url[:60])
             try:
-                file_path = download_youtube_audio(source_url, UPLOAD_DIR, job_id)
+                with metrics.stage("download"), cancellation.stage("download"):
+                    file_path = download_youtube_audio(source_url, UPLOAD_DIR, job_id)
+                metrics.record_bytes("downloaded", "youtube", os.path.getsize(file_path))
                 store.update_job(job_id, file_path=file_path)
             except ValueError as e:
                 logger.error("[%s] YouTube download failed: %s", job_id, e)
@@ -62,81 +107,346 @@ def _process_job(job_id: str):
         logger.info("[%s] Step 1: Extracting audio from %s", job_id, file_path)
 
         if file_path and os.path.exists(file_path):
-            audio_path = extract_audio(file_path, UPLOAD_DIR)
+            with metrics.stage("extract"), cancellation.stage("extract"):
+                audio_path = extract_audio(file_path, UPLOAD_DIR)
+                _write_waveform(job_id, audio_path)
         else:
-            audio_path = None
             logger.warning("[%s] File not found, using dummy transcription", job_id)
 
         # ── Step 2: 文字起こし ──
         transcript_lang = job.get("transcript_language") or "ja"
         logger.info("[%s] Step 2: Transcribing audio (lang=%s)...", job_id, transcript_lang)
-        transcript_data = transcribe_audio(audio_path or file_path or "", language=transcript_lang)
+        with metrics.stage("transcribe"), cancellation.stage("transcribe"):
+            transcript_data, fp = _transcribe(job_id, audio_path or file_path or "", transcript_lang)
+        segments = SegmentArray.from_dicts(transcript_data.get("segments"))
         transcript_text = transcript_data["text"]
-        segments = transcript_data.get("segments", [])
+        if transcript_text == segments.text:
+            transcript_text = segments.text  # 同じ文字列オブジェクトを共有して全文を二重に持たない
 
-        store.update_job(job_id, transcript=transcript_text)
+        store.update_job(job_id, transcript=transcript_text, segments=segments)
+        _index_transcript(job_id, segments, transcript_text)
+        if fp is not None:
+            _index_fingerprint(job_id, fp)
         logger.info("[%s] Transcription done (%d chars, %d segments)",
                      job_id, len(transcript_text), len(segments))
 
         # 抽出した音声ファイルを削除（元の動画ファイルとは別の場合のみ）
-        if audio_path != file_path and os.path.exists(audio_path):
-            os.remove(audio_path)
-            logger.info("[%s] Cleaned up extracted audio: %s", job_id, audio_path)
+        _remove_extracted_audio(job_id, audio_path, file_path)
 
         # ── Step 3: コンテンツ生成 ──
-        output_lang = job.get("output_language") or "same"
+        output_langs = _output_languages(job)
         store.update_job(job_id, status="generating")
-        logger.info("[%s] Step 3: Generating content with AI (output=%s)...", job_id, output_lang)
+        logger.info("[%s] Step 3: Generating content with AI (output=%s)...", job_id, ",".join(output_langs))
 
-        results = generate_content(transcript_text, segments, output_language=output_lang)
+        with metrics.stage("generate"), cancellation.stage("generate"):
+            results = generate_languages(transcript_text, segments, output_langs, transcript_language=transcript_lang)
 
         # ── Step 4: 結果を保存 ──
+        if still_leased is not None and not still_leased():
+            logger.warning("[%s] Lease lost, discarding results", job_id)
+            return
         store.update_job(job_id, status="completed", results=results)
         logger.info("[%s] Pipeline completed!", job_id)
 
+    except cancellation.JobCancelled as e:
+        status = "timed_out" if e.reason == "timeout" else "cancelled"
+        logger.warning("[%s] Pipeline %s at stage %s", job_id, status, e.stage)
+        _remove_extracted_audio(job_id, audio_path, file_path)
+        if e.stage == "download":
+            _remove_partial_download(job_id)
+        store.update_job(job_id, status=status, error=str(e), cancel_requested=False)
     except Exception as e:
         logger.exception("[%s] Pipeline failed: %s", job_id, e)
         store.update_job(job_id, status="error", error=str(e))
+    finally:
+        stop_watch()
+        cancellation.bind(None)
+        metrics.bind_job(None)
+
+
+def _regenerate(job_id: str, job: dict, still_leased: Callable[[], bool] | None) -> None:
+    """指定された成果物だけを生成し直し、既存の results にマージする。"""
+    artifacts = job["regenerate"]
+    logger.info("[%s] Regenerating %s", job_id, ", ".join(artifacts))
+    with metrics.stage("generate"), cancellation.stage("generate"):
+        partial = generate_languages(job["transcript"], job.get("segments"), _output_languages(job), artifacts,
+                                     transcript_language=job.get("transcript_language"))
+
+    if still_leased is not None and not still_leased():
+        logger.warning("[%s] Lease lost, discarding results", job_id)
+        return
+    results = dict((store.get_job(job_id) or job).get("results") or {})
+    # 言語ごとの文章は言語単位でマージする（再生成しなかった成果物を消さない）
+    languages = {lang: dict(values) for lang, values in (results.get("languages") or {}).items()}
+    for lang, values in partial.pop("languages", {}).items():
+        languages.setdefault(lang, {}).update(values)
+    results.update(partial)
+    if languages:
+        results["languages"] = languages
+    store.update_job(job_id, status="completed", results=results, regenerate=None)
+    logger.info("[%s] Regeneration completed", job_id)
+
+
+def _output_languages(job: dict) -> list[str]:
+    """ジョブの出力言語（output_languages 導入前のジョブは output_language の1つ）。"""
+    return job.get("output_languages") or [job.get("output_language") or "same"]
+
+
+def _index_transcript(job_id: str, segments: SegmentArray, transcript: str) -> None:
+    """検索インデックスに追加する。失敗してもジョブは続ける。"""
+    try:
+        n = search_index.index_job(job_id, segments, transcript)
+        logger.info("[%s] Indexed %d segments for search", job_id, n)
+    except Exception:
+        logger.exception("[%s] Failed to index transcript", job_id)
+
+
+def _transcribe(job_id: str, path: str, language: str) -> tuple[dict, "fingerprint.Fingerprint | None"]:
+    """
+    文字起こし。音声指紋が既存ジョブと一致すれば、一致区間はそのジョブのセグメントを流用し、
+    流用できない先頭・末尾と、途中で一致が途切れた区間だけを文字起こしする。返り値の指紋は完了後に索引に追加する。
+    """
+    fp = _fingerprint(job_id, path)
+    match = None
+    if fp is not None:
+        try:
+            match = fingerprint_index.best_match(fp, exclude=job_id)
+        except Exception:
+            logger.exception("[%s] Fingerprint lookup failed", job_id)
+    source = store.get_job(match.job_id) if match else None
+    if not source or not source.get("segments") or source.get("transcript_language") != language:
+        return transcribe_audio(path, language=language), fp
+
+    reused, gaps = fingerprint.reuse_segments(source["segments"], match.offset, match.start, match.end, fp.duration,
+                                              holes=match.holes)
+    logger.info("[%s] Audio matches job %s (offset %.1fs, %.0f-%.0fs, score %.2f, %d hole(s)): reusing %d segments, "
+                "transcribing %d gap(s)", job_id, match.job_id, match.offset, match.start, match.end,
+                match.score, len(match.holes), len(reused), len(gaps))
+    if not reused:
+        return transcribe_audio(path, language=language), fp
+
+    pieces = []
+    for start, end in gaps:
+        piece_path = os.path.join(UPLOAD_DIR, f"{job_id}_gap{int(start)}.wav")
+        try:
+            cut_audio(path, start, end, piece_path)
+            result = transcribe_audio(piece_path, language=language)
+        except RuntimeError:
+            logger.warning("[%s] Could not cut gap %.0f-%.0fs, transcribing everything", job_id, start, end)
+            return transcribe_audio(path, language=language), fp
+        finally:
+            if os.path.exists(piece_path):
+                os.remove(piece_path)
+        pieces += [{**seg, "start": round(seg["start"] + start, 3), "end": round(seg["end"] + start, 3)}
+                   for seg in result["segments"]]
+    merged = sorted(reused + pieces, key=lambda seg: seg["start"])
+    store.update_job(job_id, reused_transcript={
+        "job_id": match.job_id, "offset": round(match.offset, 2), "start": round(match.start, 2),
+        "end": round(match.end, 2), "score": round(match.score, 3),
+        "holes": [(round(a, 2), round(b, 2)) for a, b in match.holes],
+    })
+    return {"text": " ".join(seg["text"] for seg in merged), "segments": merged}, fp
+
+
+def _fingerprint(job_id: str, path: str) -> "fingerprint.Fingerprint | None":
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with metrics.stage("fingerprint"):
+            return fingerprint.compute(path)
+    except Exception:
+        logger.exception("[%s] Failed to compute audio fingerprint", job_id)
+        return None
+
+
+def _index_fingerprint(job_id: str, fp: "fingerprint.Fingerprint") -> None:
+    """指紋を索引に追加する。失敗してもジョブは続ける。"""
+    try:
+        n = fingerprint_index.add(job_id, fp)
+        logger.info("[%s] Indexed %d fingerprint hashes", job_id, n)
+    except Exception:
+        logger.exception("[%s] Failed to index audio fingerprint", job_id)
+
+
+def _write_waveform(job_id: str, audio_path: str) -> None:
+    """波形プレビュー用のピークを保存する。失敗してもジョブは続ける。"""
+    try:
+        write_peaks(audio_path, UPLOAD_DIR, job_id)
+    except Exception:
+        logger.exception("[%s] Failed to compute waveform peaks", job_id)
+
+
+def _remove_extracted_audio(job_id: str, audio_path: str | None, file_path: str) -> None:
+    if audio_path and audio_path != file_path and os.path.exists(audio_path):
+        os.remove(audio_path)
+        logger.info("[%s] Cleaned up extracted audio: %s", job_id, audio_path)
+
+
+def _remove_partial_download(job_id: str) -> None:
+    """中断したダウンロードの途中ファイル（.part 等）を消す。"""
+    prefix = f"{job_id}_youtube."
+    for name in os.listdir(UPLOAD_DIR):
+        if name.startswith(prefix):
+            os.remove(os.path.join(UPLOAD_DIR, name))
+            logger.info("[%s] Cleaned up partial download: %s", job_id, name)
 
 
 @router.post("/generate/{job_id}")
-async def start_generation(job_id: str, background_tasks: BackgroundTasks):
+async def start_generation(
+    job_id: str,
+    profile: bool = Query(False, description="true: このジョブをプロファイルする（GET /jobs/{id}/profile で取得）"),
+):
     job = store.get_job(job_id)
     if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    if job["status"] not in ("uploaded", "error"):
+    if job["status"] not in ("uploaded", "error", *CANCELLED_STATUSES):
         raise HTTPException(
             status_code=409,
             detail=f"Job is already {job['status']}",
         )
 
-    store.update_job(job_id, status="processing")
-    background_tasks.add_task(_process_job, job_id)
+    store.update_job(
+        job_id, status="processing", error=None, cancel_requested=False, regenerate=None, profile_requested=profile,
+    )
+    queue = job_queue.get_queue()
+    queue.enqueue(job_id, *cost_model.queue_cost(job))
 
     return {
         "job_id": job_id,
         "status": "processing",
         "message": "Content generation started",
+        "queue": queue.estimate(job_id),  # {"position", "wait_seconds", "eta_seconds"}
     }
 
 
+@router.post("/jobs/{job_id}/regenerate")
+async def regenerate_artifacts(job_id: str, req: RegenerateRequest):
+    """
+    保存済みの文字起こしから、指定した成果物だけを生成し直して results にマージする。
+    例: {"artifacts": ["blog_article"]}
+    """
+    job = store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    unknown = sorted(set(req.artifacts) - set(ARTIFACTS))
+    if not req.artifacts or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"artifacts must be a non-empty subset of {list(ARTIFACTS)}",
+        )
+    if job["status"] not in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    if not job.get("transcript"):
+        raise HTTPException(status_code=409, detail="Job has no transcript yet")
+    # 生成前に失敗・キャンセルしたジョブは一部の成果物だけで completed になってしまうので、/generate からやり直す
+    if not job.get("results"):
+        raise HTTPException(status_code=409, detail="Job has no results to regenerate; run /generate first")
+
+    artifacts = [name for name in ARTIFACTS if name in req.artifacts]
+    store.update_job(job_id, status="generating", error=None, cancel_requested=False, regenerate=artifacts)
+    queue = job_queue.get_queue()
+    queue.enqueue(job_id, *cost_model.queue_cost(job, regenerate=True))
+
+    return {"job_id": job_id, "status": "generating", "artifacts": artifacts, "queue": queue.estimate(job_id)}
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    ジョブをキャンセルする。
+    開始前ならその場で cancelled に、実行中なら処理中のワーカーに停止を要求する。
+    """
+    job = store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+
+    if job["status"] in ("uploaded", "processing"):
+        # まだワーカーに取られていない。取られても _process_job の冒頭で読み飛ばされる
+        store.update_job(job_id, status="cancelled", error="ジョブがキャンセルされました", cancel_requested=True)
+        return {"job_id": job_id, "status": "cancelled"}
+
+    store.update_job(job_id, cancel_requested=True)
+    return {"job_id": job_id, "status": "cancelling"}
+
+
+# GET /jobs/{id} の fields= で選べるフィールド（job_id は常に返す）
+JOB_FIELDS = (
+    "status", "source_type", "output_languages", "transcript", "results", "error", "timings", "estimate", "profile",
+    "created_at", "updated_at",
+)
+
+
 @router.get("/jobs/{job_id}")
-async def get_job(job_id: str):
+async def get_job(
+    job_id: str,
+    request: Request,
+    fields: str | None = Query(None, description="返すフィールド（カンマ区切り）例: status,error"),
+):
+    """
+    ジョブの状態を返す。ポーリング向けに
+      - fields= で必要なフィールドだけ返す（処理中は status,error だけ等）
+      - 弱い ETag（ジョブの version から作る）を返し、If-None-Match が一致すれば 304
+    """
+    selected = JOB_FIELDS
+    if fields:
+        names = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = names - set(JOB_FIELDS) - {"job_id"}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        selected = tuple(f for f in JOB_FIELDS if f in names)
+
     job = store.get_job(job_id)
     if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return {
-        "job_id": job["id"],
+    # 同じ version でも fields が違えば別の表現なので、ETag に含める。
+    # 圧縮ミドルウェアが gzip / br にするとバイト列が変わるので弱い ETag にする
+    etag = f'W/"{job_id}-{job.get("version", 0)}-{zlib.crc32(",".join(selected).encode()):08x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    values = {
         "status": job["status"],
         "source_type": job["source_type"],
+        "output_languages": _output_languages(job),
         "transcript": job["transcript"],
         "results": job["results"],
         "error": job["error"],
+        "timings": job.get("timings") or {},
+        "estimate": job.get("estimate"),
+        "profile": job.get("profile"),
         "created_at": job["created_at"],
         "updated_at": job["updated_at"],
     }
+    body = {"job_id": job["id"], **{name: values[name] for name in selected}}
+    return JSONResponse(body, headers=headers)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match は弱い比較（W/ の有無は問わない）
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+@router.get("/jobs/{job_id}/segments")
+async def get_segments(job_id: str):
+    """タイムスタンプ付きセグメントを列形式で返す: {"start": [...], "end": [...], "text": [...]}"""
+    job = store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    segments = job.get("segments")
+    if not isinstance(segments, SegmentArray):
+        segments = SegmentArray.from_dicts(segments)
+    return segments.to_columns()
 
 
 @router.get("/jobs")
@@ -0,0 +1,32 @@
+"""ジョブのプロファイル成果物の取得。"""
+
+import json
+import os
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+
+import profiling
+import store
+
+router = APIRouter(tags=["profiling"])
+
+
+@router.get("/jobs/{job_id}/profile")
+async def get_profile(
+    job_id: str,
+    format: str = Query("json", pattern="^(json|folded)$", description="json | folded（flamegraph / speedscope 用）"),
+):
+    """POST /generate/{id}?profile=1（または抜き取り）でプロファイルしたジョブの成果物をダウンロードする。"""
+    if store.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    path = profiling.artifact_path(job_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Job was not profiled")
+    if format == "json":
+        return FileResponse(path, media_type="application/json", filename=f"profile_{job_id[:8]}.json")
+    with open(path, encoding="utf-8") as f:
+        folded = profiling.to_folded(json.load(f))
+    return PlainTextResponse(
+        folded, headers={"Content-Disposition": f'attachment; filename="profile_{job_id[:8]}.folded"'},
+    )
@@ -0,0 +1,27 @@
+"""文字起こしの全文検索。"""
+
+import time
+
+from fastapi import APIRouter, HTTPException, Query
+
+import search_index
+
+router = APIRouter(tags=["search"])
+
+
+@router.get("/search")
+async def search_transcripts(
+    q: str = Query(..., min_length=1, description="検索語（空白区切りで AND）"),
+    limit: int = Query(50, ge=1, le=500),
+    job_id: str | None = Query(None, description="指定したジョブ内だけを検索"),
+):
+    """全ジョブの文字起こしから、語を含むセグメントをタイムスタンプ付きで返す（新しい順）。"""
+    if not search_index.available():
+        raise HTTPException(status_code=503, detail="Transcript search is not available")
+    started = time.perf_counter()
+    hits = search_index.search(q, limit=limit, job_id=job_id)
+    return {
+        "query": q,
+        "hits": hits,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
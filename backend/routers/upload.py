@@ -1,10 +1,15 @@
 import os
 import uuid
 
-from fastapi import APIRouter, UploadFile, File, Query
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
+import cost_model
+import metrics
 import store
+from services.ai_generator import normalize_languages
+from services.media_probe import probe_file, probe_youtube
 
 router = APIRouter(tags=["upload"])
 
@@ -15,16 +20,32 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 class YoutubeRequest(BaseModel):
     url: str
     transcript_language: str = "ja"  # ja | en
-    output_language: str = "same"   # same | ja（英語動画を日本語で出力）
+    output_language: str = "same"   # same | ja | en（英語動画を日本語で出力）
+    output_languages: list[str] | None = None  # 複数言語で出力（指定時は output_language より優先）
+
+
+def _output_languages(output_language: str, output_languages: list[str] | None, transcript_language: str) -> list[str]:
+    """
+    output_languages があればそれを、無ければ output_language の1つを出力言語にする。
+    same は動画の言語（transcript_language）に置き換える。
+    """
+    try:
+        return list(normalize_languages(output_languages or output_language, transcript_language))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
 
 
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
     transcript_language: str = Query("ja", description="動画の言語: ja | en"),
-    output_language: str = Query("same", description="出力: same | ja（英語動画を日本語で）"),
+    output_language: str = Query("same", description="出力: same | ja | en（英語動画を日本語で）"),
+    output_languages: list[str] | None = Query(
+        None, description="複数言語で出力（繰り返し・カンマ区切り）例: ja,en。切り抜き箇所は1回だけ分析する",
+    ),
 ):
     job_id = str(uuid.uuid4())
+    languages = _output_languages(output_language, output_languages, transcript_language)
 
     # ファイルをディスクに保存
     ext = os.path.splitext(file.filename or "file")[1]
@@ -32,28 +53,47 @@ async def upload_file(
     contents = await file.read()
     with open(save_path, "wb") as f:
         f.write(contents)
+    metrics.record_bytes("uploaded", "client", len(contents))
+
+    # 長さ・コーデックを調べてコストを見積もり、メモリ予算に収まらなければ断る
+    estimate = cost_model.estimate(await run_in_threadpool(probe_file, save_path), "file")
+    rejected = cost_model.admit(estimate)
+    if rejected:
+        os.remove(save_path)
+        raise HTTPException(status_code=413, detail=rejected)
 
     job = store.create_job(
         job_id,
         source_type="file",
         file_path=save_path,
         transcript_language=transcript_language,
-        output_language=output_language,
+        output_language=languages[0],
+        output_languages=languages,
+        estimate=estimate,
     )
 
-    return {"job_id": job["id"], "filename": file.filename, "status": job["status"]}
+    return {"job_id": job["id"], "filename": file.filename, "status": job["status"], "estimate": estimate}
 
 
 @router.post("/upload/youtube")
 async def upload_youtube(req: YoutubeRequest):
     job_id = str(uuid.uuid4())
+    languages = _output_languages(req.output_language, req.output_languages, req.transcript_language)
+
+    # メタデータが取れなくても受け付ける（見積もりはデフォルトの長さで出す）
+    estimate = cost_model.estimate(await run_in_threadpool(probe_youtube, req.url), "youtube")
+    rejected = cost_model.admit(estimate)
+    if rejected:
+        raise HTTPException(status_code=413, detail=rejected)
 
     job = store.create_job(
         job_id,
         source_type="youtube",
         source_url=req.url,
         transcript_language=req.transcript_language,
-        output_language=req.output_language,
+        output_language=languages[0],
+        output_languages=languages,
+        estimate=estimate,
     )
 
-    return {"job_id": job["id"], "url": req.url, "status": job["status"]}
+    return {"job_id": job["id"], "url": req.url, "status": job["status"], "estimate": estimate}
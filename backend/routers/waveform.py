@@ -0,0 +1,56 @@
+"""波形プレビュー用ピークの配信（Range 対応）。"""
+
+import os
+import re
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+import store
+from routers.generate import UPLOAD_DIR
+from services.waveform import peaks_path
+
+router = APIRouter(tags=["waveform"])
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+@router.get("/jobs/{job_id}/waveform")
+async def get_waveform(job_id: str, request: Request):
+    """
+    ジョブの波形ピーク（services/waveform.py の PKS1 形式）を返す。
+    Range: bytes=a-b に対応する。先頭 256 バイトでヘッダとレベル表が読めるので、
+    UI はそこから必要なレベルの区間だけを取りに行ける。
+    """
+    if store.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    path = peaks_path(UPLOAD_DIR, job_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Waveform not available")
+    with open(path, "rb") as f:
+        data = f.read()
+    stat = os.stat(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        "Cache-Control": "no-cache",
+        # 圧縮ミドルウェアが Range の応答を書き換えないようにする
+        "Content-Encoding": "identity",
+    }
+
+    range_header = request.headers.get("range")
+    if not range_header:
+        return Response(data, media_type="application/octet-stream", headers=headers)
+
+    match = _RANGE.match(range_header.strip())
+    size = len(data)
+    if match is None or match.groups() == ("", ""):
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{size}"})
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(0, size - int(last)), size - 1  # bytes=-N は末尾 N バイト
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(data[start:end + 1], status_code=206, media_type="application/octet-stream", headers=headers)
@@ -0,0 +1,41 @@
+"""
+faster-whisper のモデルを Docker イメージに焼き込む（ビルド時にダウンロードしておく）。
+
+起動後の最初のジョブでハブからモデルをダウンロードしないようにする。
+保存先は Hugging Face のキャッシュ（HF_HOME）。実行時は whisper_tuning.get_model が
+まずキャッシュだけを見てロードする。
+
+  python scripts/bake_whisper_model.py                 # WHISPER_MODEL_SIZE（未設定なら base）
+  python scripts/bake_whisper_model.py --size small
+  python scripts/bake_whisper_model.py --size none     # 焼き込まない（OpenAI API で文字起こしする場合）
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default=os.environ.get("WHISPER_MODEL_SIZE") or "base",
+                        help="モデルサイズ（tiny/base/small/medium/large-v3）。none なら何もしない")
+    args = parser.parse_args()
+
+    if args.size == "none":
+        print("Whisper model: skipped")
+        return
+
+    from faster_whisper.utils import download_model
+
+    started = time.perf_counter()
+    path = download_model(args.size)
+    size_mb = sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    ) / 1e6
+    print(f"Whisper model {args.size}: {path} ({size_mb:.0f} MB, {time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+ローカル Whisper のスループット比較: 現行のジョブごとの逐次推論 vs バッチ推論。
+
+  python scripts/bench_batched_whisper.py a.wav b.wav --jobs 4 --batch-size 8
+
+--jobs 本の同時ジョブ（ファイルを順に割り当て）を
+  1. per-job: 各ジョブが model.transcribe を個別に実行（現行の経路）
+  2. batched: BatchedTranscriber でチャンクをまとめてデコード
+の両方で流し、実時間とスループット（音声秒/実時間秒）を表示する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.batched_transcription import SAMPLE_RATE, BatchedTranscriber
+from services.whisper_tuning import get_model, load_tuning
+
+
+def _per_job(model, path: str, language: str | None, beam_size: int) -> int:
+    segments, _ = model.transcribe(path, language=language, beam_size=beam_size, vad_filter=True)
+    return sum(1 for s in segments if s.text.strip())
+
+
+def _run(label: str, fn, paths: list[str], total_audio: float) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        counts = list(pool.map(fn, paths))
+    wall = time.perf_counter() - started
+    print(f"{label:<10} wall={wall:8.2f}s  throughput={total_audio / wall:7.2f}x realtime  segments={sum(counts)}")
+    return wall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", nargs="+")
+    parser.add_argument("--jobs", type=int, default=4, help="同時ジョブ数")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--language", default="ja")
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL_SIZE", "base"))
+    args = parser.parse_args()
+
+    from faster_whisper import decode_audio
+
+    language = None if args.language == "auto" else args.language
+    paths = [args.audio[i % len(args.audio)] for i in range(args.jobs)]
+    total_audio = sum(len(decode_audio(p, sampling_rate=SAMPLE_RATE)) / SAMPLE_RATE for p in paths)
+    tuning = load_tuning()
+    model = get_model(args.model, "cpu", tuning)
+    print(f"{args.jobs} jobs, {total_audio:.1f}s audio total, model={args.model}, {tuning}")
+
+    _per_job(model, paths[0], language, tuning.beam_size)  # ウォームアップ
+    base = _run("per-job", lambda p: _per_job(model, p, language, tuning.beam_size), paths, total_audio)
+
+    batcher = BatchedTranscriber(model, batch_size=args.batch_size, beam_size=tuning.beam_size)
+    batched = _run("batched", lambda p: len(batcher.transcribe(p, language)["segments"]), paths, total_audio)
+
+    print(f"speedup: {base / batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+文字起こし検索の速度計測。合成した文字起こしを一時 DB に索引して検索時間を測る。
+
+  python scripts/bench_search.py --hours 2000 --query "コンテンツ 生成" --query 動画
+
+--hours 分（1セグメント約4秒、1ジョブ1時間）を search_index.index_job で索引し、
+各クエリの検索時間（p50 / 最大）とヒット数を表示する。比較用に store.list_jobs() の
+文字起こしを線形に走査した場合の時間も表示する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORDS = (
+    "動画 コンテンツ クリエイター 生成 切り抜き ブログ 記事 投稿 SNS 今日は とても 重要な 話 です "
+    "AI 編集 視聴者 チャンネル 登録 サムネイル 収益化 アルゴリズム 再生 回数"
+).split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=int, default=1000, help="索引する文字起こしの合計時間")
+    parser.add_argument("--query", action="append", help="検索語（複数指定可）")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    queries = args.query or ["サムネイル", "収益化 アルゴリズム", "動画", "存在しない語句"]
+
+    tmp = tempfile.mkdtemp()
+    os.environ["SEARCH_DB_PATH"] = os.path.join(tmp, "search.db")
+    import search_index
+    from segments import SegmentArray
+
+    rng = random.Random(0)
+    started = time.perf_counter()
+    transcripts = []
+    n_segments = 0
+    for job in range(args.hours):
+        segs, t = [], 0.0
+        while t < 3600:
+            text = "".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 16)))
+            segs.append({"start": t, "end": t + 4.0, "text": text})
+            t += 4.0
+        arr = SegmentArray.from_dicts(segs)
+        search_index.index_job(f"job-{job:06d}", arr, arr.text)
+        transcripts.append((f"job-{job:06d}", arr))
+        n_segments += len(arr)
+    print(f"indexed {args.hours} jobs / {n_segments} segments in {time.perf_counter() - started:.1f}s "
+          f"({os.path.getsize(os.environ['SEARCH_DB_PATH']) / 1e6:.0f} MB)")
+
+    for query in queries:
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            hits = search_index.search(query, limit=args.limit)
+            times.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        terms = query.split()
+        scanned = [
+            (job, s.start) for job, arr in transcripts if all(t in arr.text for t in terms)
+            for s in arr if all(t in s.text for t in terms)
+        ][: args.limit]
+        scan_ms = (time.perf_counter() - t0) * 1000
+        print(f"{query!r:<24} hits={len(hits):<4} fts p50={statistics.median(times):8.2f}ms "
+              f"max={max(times):8.2f}ms   linear scan={scan_ms:9.1f}ms ({len(scanned)} hits)")
+
+
+if __name__ == "__main__":
+    main()
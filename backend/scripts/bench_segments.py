@@ -0,0 +1,123 @@
+"""
+セグメント表現のメモリ・シリアライズ比較: dict のリスト + 全文 vs SegmentArray。
+
+  python scripts/bench_segments.py --hours 3 --repeat 5
+
+--hours 分の文字起こし（1セグメント約4秒）を合成し、
+  1. dicts:   [{"start", "end", "text"}, ...] + " ".join した全文（現行の保持形式）
+  2. columnar: SegmentArray（float 配列 + 連結テキスト + オフセット）
+について、保持メモリ（tracemalloc）、ストア用エンコード/デコード、
+レスポンス用 JSON、タイムスタンプ付きテキストの整形にかかる時間とサイズを表示する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segments import SegmentArray
+from services.ai_generator import _build_timestamped_transcript
+
+_WORDS = "動画 コンテンツ クリエイター AI 生成 切り抜き ブログ 記事 投稿 SNS これは とても 重要 です ね".split()
+
+
+def _make_segments(hours: float, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    segments, t = [], 0.0
+    while t < hours * 3600:
+        duration = rng.uniform(2.0, 6.0)
+        text = "".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 20)))
+        segments.append({"start": round(t, 3), "end": round(t + duration, 3), "text": text})
+        t += duration + rng.uniform(0.0, 0.8)
+    return segments
+
+
+def _retained(build) -> tuple[object, int]:
+    """build() の戻り値が保持しているメモリ（バイト）。"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    obj = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return obj, size
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=3.0, help="合成する文字起こしの長さ（時間）")
+    parser.add_argument("--repeat", type=int, default=5, help="時間計測の繰り返し回数（最良値を表示）")
+    args = parser.parse_args()
+
+    source = _make_segments(args.hours)
+    source_json = json.dumps(source, ensure_ascii=False)
+    print(f"{len(source)} segments ({args.hours:g}h)")
+
+    # 保持メモリ: JSON から復元した状態を比較する（ストアから読み出したジョブと同じ条件）
+    dicts, dicts_mem = _retained(lambda: (json.loads(source_json), " ".join(s["text"] for s in json.loads(source_json))))
+    segs, segs_mem = _retained(lambda: SegmentArray.from_dicts(json.loads(source_json)))
+    dict_list, full_text = dicts
+
+    def row(label: str, a: float, b: float, unit: str) -> None:
+        ratio = a / b if b else float("inf")
+        print(f"  {label:<26} dicts={a:12.{3 if unit == 'ms' else 0}f}{unit}  "
+              f"columnar={b:12.{3 if unit == 'ms' else 0}f}{unit}  ({ratio:5.1f}x)")
+
+    print("memory")
+    row("retained", dicts_mem / 1024, segs_mem / 1024, "KiB")
+
+    # ストア用エンコード（SQLite の JSON 列に入る形）
+    dicts_store = json.dumps({"segments": dict_list, "transcript": full_text}, ensure_ascii=False)
+    segs_store = json.dumps({"segments": base64.b64encode(segs.to_bytes()).decode("ascii")})
+    print("store encoding")
+    row("size", len(dicts_store.encode()) / 1024, len(segs_store.encode()) / 1024, "KiB")
+    row("encode",
+        _time(lambda: json.dumps({"segments": dict_list, "transcript": full_text}, ensure_ascii=False), args.repeat) * 1000,
+        _time(lambda: json.dumps({"segments": base64.b64encode(segs.to_bytes()).decode("ascii")}), args.repeat) * 1000,
+        "ms")
+    row("decode",
+        _time(lambda: json.loads(dicts_store), args.repeat) * 1000,
+        _time(lambda: SegmentArray.from_bytes(base64.b64decode(json.loads(segs_store)["segments"])), args.repeat) * 1000,
+        "ms")
+
+    # API レスポンス（行形式 vs 列形式の JSON）
+    print("response json")
+    row("size",
+        len(json.dumps(dict_list, ensure_ascii=False).encode()) / 1024,
+        len(json.dumps(segs.to_columns(), ensure_ascii=False).encode()) / 1024,
+        "KiB")
+    row("encode",
+        _time(lambda: json.dumps(dict_list, ensure_ascii=False), args.repeat) * 1000,
+        _time(lambda: json.dumps(segs.to_columns(), ensure_ascii=False), args.repeat) * 1000,
+        "ms")
+
+    print("views")
+    row("iterate",
+        _time(lambda: sum(len(s["text"]) for s in dict_list), args.repeat) * 1000,
+        _time(lambda: sum(len(text) for _, _, text in segs), args.repeat) * 1000,
+        "ms")
+    row("timestamped transcript",
+        _time(lambda: _build_timestamped_transcript(dict_list), args.repeat) * 1000,
+        _time(lambda: _build_timestamped_transcript(segs), args.repeat) * 1000,
+        "ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+faster-whisper の設定をこのホストでベンチマークし、最速の設定を whisper_tuning.json に書き出す。
+
+  python scripts/calibrate_whisper.py sample.wav
+  python scripts/calibrate_whisper.py sample.wav --reference sample.txt --tolerance 0.02
+
+compute_type × cpu_threads × num_workers × beam_size の組み合わせを計測し、
+基準文字起こしに対する WER（日本語など空白のない言語は文字単位）が
+基準設定の WER + tolerance 以内のものから、スループット最大の設定を選ぶ。
+--reference が無い場合は float32 / beam_size=5 の出力を基準にする。
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+from services.whisper_tuning import COMPUTE_TYPES, TUNING_FILE, WhisperTuning, save_tuning
+
+
+def _tokens(text: str) -> list[str]:
+    """空白区切りの言語は単語、そうでなければ文字単位で比較する。"""
+    words = text.split()
+    if len(words) > 1 and len(words) * 20 > len(text):
+        return [w.strip(".,!?、。").lower() for w in words]
+    return [c for c in text if not c.isspace() and c not in "、。,.!?"]
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = _tokens(reference), _tokens(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1] / len(ref)
+
+
+def _transcribe(model, path: str, language: str | None, beam_size: int) -> str:
+    segments, _ = model.transcribe(path, language=language, beam_size=beam_size, vad_filter=True)
+    return " ".join(s.text.strip() for s in segments if s.text.strip())
+
+
+def _benchmark(model_size: str, path: str, language: str | None, tuning: WhisperTuning, duration: float) -> dict:
+    """num_workers 本の同時文字起こしを流し、スループット（音声秒/実時間秒）を測る。"""
+    from faster_whisper import WhisperModel
+
+    model = WhisperModel(
+        model_size,
+        device="cpu",
+        compute_type=tuning.compute_type,
+        cpu_threads=tuning.cpu_threads,
+        num_workers=tuning.num_workers,
+    )
+    _transcribe(model, path, language, tuning.beam_size)  # ウォームアップ
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=tuning.num_workers) as pool:
+        texts = list(pool.map(lambda _: _transcribe(model, path, language, tuning.beam_size),
+                              range(tuning.num_workers)))
+    wall = time.perf_counter() - started
+    return {
+        "wall_sec": round(wall, 3),
+        "throughput": round(duration * tuning.num_workers / wall, 3),
+        "text": texts[0],
+    }
+
+
+def _audio_duration(path: str) -> float:
+    from faster_whisper.audio import decode_audio
+
+    return len(decode_audio(path)) / 16000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", help="キャリブレーション用の音声（1〜3分程度推奨）")
+    parser.add_argument("--reference", help="正解テキストファイル（省略時は float32/beam5 の出力）")
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL_SIZE", "base"))
+    parser.add_argument("--language", default="ja", help="ja | en | auto")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="基準 WER からの許容悪化幅")
+    parser.add_argument("--compute-types", default=",".join(COMPUTE_TYPES))
+    parser.add_argument("--threads", help="カンマ区切り（省略時は CPU 数から自動）")
+    parser.add_argument("--workers", default="1,2")
+    parser.add_argument("--beams", default="1,5")
+    parser.add_argument("--output", default=TUNING_FILE)
+    args = parser.parse_args()
+
+    language = None if args.language == "auto" else args.language
+    cpus = os.cpu_count() or 1
+    threads = (
+        [int(t) for t in args.threads.split(",")]
+        if args.threads
+        else sorted({max(1, cpus // 2), cpus})
+    )
+    duration = _audio_duration(args.audio)
+    print(f"音声: {args.audio} ({duration:.1f}s)  モデル: {args.model}  CPU: {cpus}")
+
+    baseline = WhisperTuning(compute_type="float32", cpu_threads=cpus, num_workers=1, beam_size=5)
+    base_run = _benchmark(args.model, args.audio, language, baseline, duration)
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = f.read()
+    else:
+        reference = base_run["text"]
+    base_wer = word_error_rate(reference, base_run["text"])
+    print(f"基準 (float32, beam=5): throughput={base_run['throughput']}x  WER={base_wer:.3f}")
+
+    results = []
+    for ct, th, wk, bm in itertools.product(
+        args.compute_types.split(","), threads,
+        [int(w) for w in args.workers.split(",")], [int(b) for b in args.beams.split(",")],
+    ):
+        # num_workers × cpu_threads が CPU 数を大きく超える組み合わせは無意味なので飛ばす
+        if wk * th > cpus * 2:
+            continue
+        tuning = WhisperTuning(compute_type=ct, cpu_threads=th, num_workers=wk, beam_size=bm)
+        try:
+            run = _benchmark(args.model, args.audio, language, tuning, duration)
+        except Exception as e:  # compute_type 非対応の CPU など
+            print(f"  skip {tuning}: {e}")
+            continue
+        wer = word_error_rate(reference, run["text"])
+        ok = wer <= base_wer + args.tolerance
+        results.append({"config": tuning.to_dict(), "throughput": run["throughput"],
+                        "wall_sec": run["wall_sec"], "wer": round(wer, 4), "accepted": ok})
+        print(f"  {ct:<13} threads={th:<3} workers={wk} beam={bm}  "
+              f"throughput={run['throughput']:>7.2f}x  WER={wer:.3f}{'' if ok else '  (許容外)'}")
+
+    accepted = [r for r in results if r["accepted"]]
+    if not accepted:
+        print("許容範囲内の設定がありません。--tolerance を広げてください。")
+        sys.exit(1)
+
+    best = max(accepted, key=lambda r: r["throughput"])
+    tuning = WhisperTuning(**best["config"])
+    report = {
+        "audio_sec": round(duration, 1),
+        "model": args.model,
+        "cpu_count": cpus,
+        "baseline_wer": round(base_wer, 4),
+        "tolerance": args.tolerance,
+        "best": best,
+        "results": results,
+    }
+    path = save_tuning(tuning, report, args.output)
+    print(f"\n最速設定: {tuning}  throughput={best['throughput']}x  WER={best['wer']}")
+    print(f"保存しました: {path}")
+
+
+if __name__ == "__main__":
+    main()
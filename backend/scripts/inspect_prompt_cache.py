@@ -0,0 +1,161 @@
+"""
+プロンプトキャッシュのリクエスト形とキャッシュトークンの記録を、モックのプロバイダで確認する。
+
+  python scripts/inspect_prompt_cache.py --provider claude
+  python scripts/inspect_prompt_cache.py --provider gemini --context-cache
+
+anthropic / google.genai を、受け取ったリクエストを記録して usage を返すモックに差し替え、
+1ジョブ分の「全成果物の生成 → blog_article の選択再生成」を流す。
+各呼び出しのキャッシュ区切りの位置・送った内容と、ジョブの usage を表示する。
+モックは先頭部分（システム + 文字起こし）が前回と同じならキャッシュヒットとして扱う。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import types
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_RESULT = '{"viral_clips": [], "x_thread": ["1/1"], "blog_article": "# t"}'
+
+
+def _tokens(text: str) -> int:
+    from services.rate_limit import estimate_tokens
+
+    return estimate_tokens(text)
+
+
+def _install_anthropic(calls: list[dict]) -> None:
+    seen_prefixes: set[str] = set()
+
+    class Messages:
+        def create(self, **kw):
+            calls.append(kw)
+            # cache_control が付いた最後のブロックまでが先頭部分
+            blocks = list(kw["system"]) + list(kw["messages"][0]["content"])
+            last = max((i for i, b in enumerate(blocks) if "cache_control" in b), default=-1)
+            prefix = "".join(b["text"] for b in blocks[:last + 1])
+            rest = "".join(b["text"] for b in blocks[last + 1:])
+            hit = prefix in seen_prefixes
+            seen_prefixes.add(prefix)
+            usage = types.SimpleNamespace(
+                input_tokens=_tokens(rest),
+                output_tokens=_tokens(_RESULT),
+                cache_read_input_tokens=_tokens(prefix) if hit else 0,
+                cache_creation_input_tokens=0 if hit else _tokens(prefix),
+            )
+            return types.SimpleNamespace(content=[types.SimpleNamespace(text=_RESULT)], usage=usage)
+
+    class Anthropic:
+        def __init__(self, *a, **kw):
+            self.messages = Messages()
+
+    module = types.ModuleType("anthropic")
+    module.Anthropic = Anthropic
+    sys.modules["anthropic"] = module
+
+
+def _install_genai(calls: list[dict]) -> None:
+    caches: dict[str, str] = {}
+
+    class Caches:
+        def create(self, model, config):
+            name = f"cachedContents/{len(caches)}"
+            caches[name] = config.system_instruction + "".join(config.contents)
+            calls.append({"caches.create": name, "cached_tokens": _tokens(caches[name])})
+            return types.SimpleNamespace(name=name)
+
+    class Models:
+        def generate_content(self, model, contents, config):
+            calls.append({"model": model, "contents": contents, "cached_content": config.cached_content})
+            cached = _tokens(caches[config.cached_content]) if config.cached_content else 0
+            usage = types.SimpleNamespace(
+                prompt_token_count=cached + _tokens(contents),
+                candidates_token_count=_tokens(_RESULT),
+                cached_content_token_count=cached,
+            )
+            return types.SimpleNamespace(text=_RESULT, usage_metadata=usage)
+
+    class Client:
+        def __init__(self, *a, **kw):
+            self.caches = Caches()
+            self.models = Models()
+
+    def config(**kw):
+        return types.SimpleNamespace(**{"cached_content": None, **kw})
+
+    genai = types.ModuleType("google.genai")
+    genai.Client = Client
+    genai.types = types.SimpleNamespace(
+        GenerateContentConfig=config,
+        CreateCachedContentConfig=config,
+        ThinkingConfig=config,
+    )
+    google = types.ModuleType("google")
+    google.genai = genai
+    sys.modules["google"] = google
+    sys.modules["google.genai"] = genai
+    sys.modules["google.genai.types"] = genai.types
+
+
+def _describe(call: dict) -> str:
+    if "caches.create" in call:
+        return f"caches.create -> {call['caches.create']} ({call['cached_tokens']} tokens)"
+    if "system" in call:
+        blocks = [("system", b) for b in call["system"]] + [("user", b) for b in call["messages"][0]["content"]]
+        return "  ".join(
+            f"[{role} {len(b['text'])} chars{' | cache' if 'cache_control' in b else ''}]" for role, b in blocks
+        )
+    return f"generate_content cached_content={call['cached_content']} contents={len(call['contents'])} chars"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", choices=("claude", "gemini"), default="claude")
+    parser.add_argument("--context-cache", action="store_true", help="Gemini の明示的なコンテキストキャッシュを使う")
+    parser.add_argument("--segments", type=int, default=400, help="合成する文字起こしのセグメント数")
+    args = parser.parse_args()
+
+    for key in ("ANTHROPIC_API_KEY", "GEMINI_API_KEY", "GOOGLE_API_KEY", "JOB_DB_PATH"):
+        os.environ.pop(key, None)
+    if args.provider == "claude":
+        os.environ["ANTHROPIC_API_KEY"] = "mock"
+    else:
+        os.environ["GEMINI_API_KEY"] = "mock"
+        os.environ["GEMINI_CONTEXT_CACHE"] = "1" if args.context_cache else "0"
+    os.environ.setdefault("LLM_RPM_GEMINI", "0")
+
+    calls: list[dict] = []
+    _install_anthropic(calls)
+    _install_genai(calls)
+
+    import metrics
+    import store
+    from segments import SegmentArray
+    from services.ai_generator import generate_content
+
+    segments = SegmentArray.from_dicts(
+        {"start": i * 4.0, "end": i * 4.0 + 3.5, "text": f"これはキャッシュ確認用のセグメント{i}です。"}
+        for i in range(args.segments)
+    )
+    store.create_job("inspect", source_type="file")
+    metrics.bind_job("inspect")
+
+    for label, artifacts in (("full", None), ("regenerate blog_article", ["blog_article"])):
+        start = len(calls)
+        generate_content(segments.text, segments, artifacts=artifacts)
+        print(f"== {label}")
+        for call in calls[start:]:
+            print("  " + _describe(call))
+
+    print("== job usage")
+    for key, value in store.get_job("inspect")["usage"].items():
+        print(f"  {key:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
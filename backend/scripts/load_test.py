@@ -0,0 +1,428 @@
+"""
+FastAPI アプリの同時実行負荷テスト。
+
+外部依存はすべてローカルの代替に差し替えて、1コンテナで何ジョブ同時にさばけるか、
+E2E レイテンシの p50/p99 がどうなるかを計測する。
+
+  # 代替込みのサーバーを自動起動して計測（推奨）。クローズドループ: 16 ジョブを詰め続ける
+  python scripts/load_test.py run --jobs 100 --concurrency 16
+
+  # オープンループ: 平均 4 jobs/s のポアソン到着。完了を待たずに到着時刻どおり投入する
+  python scripts/load_test.py run --jobs 100 --rate 4
+
+  # 既に起動している代替サーバーに対して計測
+  python scripts/load_test.py serve --port 8765 &
+  python scripts/load_test.py run --url http://127.0.0.1:8765 --jobs 100
+
+  # API 1プロセス + 別プロセスのワーカー 3 本（SQLite キュー）で計測
+  python scripts/load_test.py run --worker-procs 3 --jobs 100
+
+代替:
+  - yt-dlp: 偽の yt_dlp モジュール（無音 WAV を書き出す）
+  - Whisper: 偽の faster_whisper モジュール（固定レイテンシ後にセグメントを返す）
+  - LLM: Ollama 互換のスタブ HTTP サーバー（scripts/ollama_standin.py。固定レイテンシでストリームを返す）
+サーバー RSS は /metrics の process_resident_memory_bytes を定期取得する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import types
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+YOUTUBE_URL = "https://www.youtube.com/watch?v=loadtest"
+TERMINAL = {"completed", "error", "cancelled", "timed_out"}
+
+
+def _silent_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """無音の 16kHz mono WAV を返す。"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+    return buf.getvalue()
+
+
+# ── サーバー側: 代替の差し込み ──
+
+def _install_standins(args: argparse.Namespace) -> None:
+    """yt_dlp / faster_whisper の代替モジュールを sys.modules に登録する。"""
+    audio = _silent_wav(args.media_seconds)
+
+    class DownloadError(Exception):
+        pass
+
+    class YoutubeDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def extract_info(self, url, download=True):
+            time.sleep(args.download_delay)
+            path = self.opts["outtmpl"]["default"].replace("%(ext)s", "wav")
+            with open(path, "wb") as f:
+                f.write(audio)
+            return {"id": "loadtest", "duration": args.media_seconds}
+
+        def download(self, urls):
+            for url in urls:
+                self.extract_info(url)
+
+    yt_dlp = types.ModuleType("yt_dlp")
+    yt_dlp.YoutubeDL = YoutubeDL
+    yt_dlp.utils = types.SimpleNamespace(DownloadError=DownloadError)
+    sys.modules["yt_dlp"] = yt_dlp
+
+    class WhisperModel:
+        def __init__(self, *a, **kw):
+            pass
+
+        def transcribe(self, path, **kw):
+            time.sleep(args.asr_delay)
+            step = 10.0
+            n = max(1, int(args.media_seconds // step))
+            segments = [
+                types.SimpleNamespace(start=i * step, end=(i + 1) * step, text=f"負荷テストのセグメント {i}")
+                for i in range(n)
+            ]
+            return iter(segments), types.SimpleNamespace(language="ja", duration=args.media_seconds)
+
+    faster_whisper = types.ModuleType("faster_whisper")
+    faster_whisper.WhisperModel = WhisperModel
+    sys.modules["faster_whisper"] = faster_whisper
+
+
+def _prepare_process(args: argparse.Namespace) -> None:
+    for key in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GEMINI_API_KEY", "GOOGLE_API_KEY"):
+        os.environ[key] = ""
+    os.environ["USE_LOCAL_WHISPER"] = "1"
+    # LLM はスタブと ollama_engine の同時実行数をそろえる
+    from scripts.ollama_standin import start_standin
+
+    os.environ["OLLAMA_NUM_PARALLEL"] = str(args.llm_parallel)
+    base_url, _ = start_standin(args.llm_delay, num_parallel=args.llm_parallel)
+    os.environ["OLLAMA_BASE_URL"] = base_url
+    _install_standins(args)
+    os.chdir(BACKEND_DIR)
+
+
+def serve(args: argparse.Namespace) -> None:
+    """代替を差し込んだ状態でアプリを起動する。"""
+    _prepare_process(args)
+
+    import logging
+    import uvicorn
+
+    from main import app
+
+    logging.getLogger().setLevel(logging.WARNING)  # パイプラインの INFO ログで計測結果が埋もれないように
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def work(args: argparse.Namespace) -> None:
+    """代替を差し込んだ状態でワーカープロセス（python -m worker 相当）を起動する。"""
+    _prepare_process(args)
+
+    import logging
+    import worker
+
+    logging.basicConfig(level=logging.WARNING)  # worker.main() の INFO 設定より先に決める
+    worker.main()
+
+
+# ── クライアント側: 負荷生成 ──
+
+@dataclass
+class Stats:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    completed: int = 0
+    failed: int = 0
+    rss: list[tuple[float, float]] = field(default_factory=list)
+    inflight: int = 0
+    max_inflight: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+
+    def error(self, name: str) -> None:
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def _timed(stats: Stats, name: str, fn, *a, **kw):
+    started = time.perf_counter()
+    try:
+        resp = fn(*a, **kw)
+    except Exception:
+        stats.error(name)
+        raise
+    stats.observe(name, time.perf_counter() - started)
+    if resp.status_code >= 400:
+        stats.error(name)
+        resp.raise_for_status()
+    return resp
+
+
+def _run_job(session, base: str, stats: Stats, upload_bytes: bytes, youtube_ratio: float, poll: float, timeout: float):
+    started = time.perf_counter()
+    with stats.lock:
+        stats.inflight += 1
+        stats.max_inflight = max(stats.max_inflight, stats.inflight)
+    try:
+        _submit_and_wait(session, base, stats, upload_bytes, youtube_ratio, poll, timeout, started)
+    except Exception:
+        with stats.lock:
+            stats.failed += 1
+        return
+    finally:
+        with stats.lock:
+            stats.inflight -= 1
+    stats.observe("end_to_end", time.perf_counter() - started)
+    with stats.lock:
+        stats.completed += 1
+
+
+def _submit_and_wait(session, base: str, stats: Stats, upload_bytes: bytes, youtube_ratio: float, poll: float,
+                     timeout: float, started: float) -> None:
+    if random.random() < youtube_ratio:
+        r = _timed(stats, "upload_youtube", session.post, f"{base}/api/upload/youtube", json={"url": YOUTUBE_URL})
+    else:
+        files = {"file": ("loadtest.wav", upload_bytes, "audio/wav")}
+        r = _timed(stats, "upload", session.post, f"{base}/api/upload", files=files)
+    job_id = r.json()["job_id"]
+    _timed(stats, "generate", session.post, f"{base}/api/generate/{job_id}")
+
+    while True:
+        job = _timed(stats, "status", session.get, f"{base}/api/jobs/{job_id}").json()
+        if job["status"] in TERMINAL:
+            break
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError(job_id)
+        time.sleep(poll)
+    if job["status"] != "completed":
+        raise RuntimeError(job.get("error"))
+
+
+def _open_loop(args: argparse.Namespace, job_args: tuple) -> None:
+    """
+    オープンループ: ポアソン到着の時刻どおりに、完了を待たずにジョブごとのスレッドで投入する。
+    到着は処理の遅れに引きずられないので、サーバーが追いつかなければ同時進行数が増え続ける。
+    """
+    threads = []
+    next_at = time.perf_counter()
+    for _ in range(args.jobs):
+        next_at += random.expovariate(args.rate)
+        time.sleep(max(0.0, next_at - time.perf_counter()))  # 予定時刻に対して待つ（遅れを積み上げない）
+        t = threading.Thread(target=_run_job, args=job_args, daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+
+def _sample_rss(session, base: str, stats: Stats, stop: threading.Event, interval: float, t0: float):
+    while not stop.is_set():
+        try:
+            text = session.get(f"{base}/metrics", timeout=5).text
+            for line in text.splitlines():
+                if line.startswith("process_resident_memory_bytes"):
+                    stats.rss.append((time.perf_counter() - t0, float(line.split()[-1]) / 1e6))
+        except Exception:
+            pass
+        stop.wait(interval)
+
+
+def _wait_ready(session, base: str, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if session.get(f"{base}/health", timeout=1).ok:
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server did not become healthy: {base}")
+
+
+def run(args: argparse.Namespace) -> None:
+    import requests
+
+    procs: list[subprocess.Popen] = []
+    base = args.url
+    if not base:
+        standin_args = [
+            "--port", str(args.port),
+            "--media-seconds", str(args.media_seconds), "--download-delay", str(args.download_delay),
+            "--asr-delay", str(args.asr_delay), "--llm-delay", str(args.llm_delay),
+            "--llm-parallel", str(args.llm_parallel),
+        ]
+        env = dict(os.environ)
+        if args.worker_procs > 0:
+            # API はキューに積むだけにして、別プロセスのワーカーが SQLite 経由で処理する
+            import tempfile
+
+            env["JOB_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "jobs.db")
+            env["EMBEDDED_WORKERS"] = "0"
+        this = os.path.abspath(__file__)
+        procs.append(subprocess.Popen([sys.executable, this, "serve", *standin_args], env=env))
+        for _ in range(args.worker_procs):
+            procs.append(subprocess.Popen([sys.executable, this, "worker", *standin_args], env=env))
+        base = f"http://127.0.0.1:{args.port}"
+
+    session = requests.Session()
+    # オープンループでは同時進行数の上限がないので、全ジョブ分の接続を持てるようにする
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=(args.jobs if args.rate > 0 else args.concurrency) * 2 + 4)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    stats = Stats()
+    stop = threading.Event()
+    try:
+        _wait_ready(session, base)
+        upload_bytes = _silent_wav(args.media_seconds)
+        t0 = time.perf_counter()
+        sampler = threading.Thread(target=_sample_rss, args=(session, base, stats, stop, args.rss_interval, t0), daemon=True)
+        sampler.start()
+
+        job_args = (session, base, stats, upload_bytes, args.youtube_ratio, args.poll, args.job_timeout)
+        if args.rate > 0:
+            _open_loop(args, job_args)
+        else:
+            # クローズドループ: concurrency 本を詰め続ける（1本終わると次を投入する）
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                for _ in range(args.jobs):
+                    pool.submit(_run_job, *job_args)
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        sampler.join(timeout=args.rss_interval + 5)
+    finally:
+        stop.set()
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=30)
+
+    _report(args, stats, elapsed)
+
+
+def _report(args: argparse.Namespace, stats: Stats, elapsed: float) -> None:
+    total = stats.completed + stats.failed
+    report = {
+        "jobs": total,
+        "mode": "open" if args.rate > 0 else "closed",
+        "concurrency": args.concurrency if args.rate <= 0 else None,
+        "arrival_rate": args.rate,
+        "max_inflight": stats.max_inflight,
+        "elapsed_sec": round(elapsed, 2),
+        "throughput_jobs_per_sec": round(stats.completed / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(stats.failed / total, 4) if total else 0.0,
+        "request_errors": stats.errors,
+        "latency_sec": {
+            name: {
+                "count": len(v),
+                "p50": round(_percentile(v, 50), 4),
+                "p90": round(_percentile(v, 90), 4),
+                "p99": round(_percentile(v, 99), 4),
+                "max": round(max(v), 4),
+            }
+            for name, v in sorted(stats.latencies.items())
+        },
+        "rss_mb": {
+            "max": round(max((m for _, m in stats.rss), default=0.0), 1),
+            "timeline": [(round(t, 1), round(m, 1)) for t, m in stats.rss],
+        },
+    }
+
+    load = f"open loop, rate={args.rate}/s" if args.rate > 0 else f"closed loop, concurrency={args.concurrency}"
+    print(f"\n=== 負荷テスト結果 ({total} jobs, {load}) ===")
+    print(f"経過: {report['elapsed_sec']}s  スループット: {report['throughput_jobs_per_sec']} jobs/s  "
+          f"エラー率: {report['error_rate'] * 100:.1f}%  最大同時進行: {stats.max_inflight}")
+    print(f"{'endpoint':<16}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for name, s in report["latency_sec"].items():
+        print(f"{name:<16}{s['count']:>7}{s['p50']:>10.3f}{s['p90']:>10.3f}{s['p99']:>10.3f}{s['max']:>10.3f}")
+    print(f"サーバー RSS 最大: {report['rss_mb']['max']} MB")
+    for t, m in report["rss_mb"]["timeline"]:
+        print(f"  t={t:>7.1f}s  {m:>8.1f} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"JSON: {args.json}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def standin_opts(p):
+        p.add_argument("--port", type=int, default=8765)
+        p.add_argument("--media-seconds", type=float, default=60.0, help="代替メディアの長さ（秒）")
+        p.add_argument("--download-delay", type=float, default=0.5, help="yt-dlp 代替の遅延（秒）")
+        p.add_argument("--asr-delay", type=float, default=1.0, help="Whisper 代替の遅延（秒）")
+        p.add_argument("--llm-delay", type=float, default=1.0, help="LLM 代替の遅延（秒）")
+        p.add_argument("--llm-parallel", type=int, default=4, help="LLM 代替が同時に生成するリクエスト数")
+
+    p_serve = sub.add_parser("serve", help="代替込みでアプリを起動")
+    standin_opts(p_serve)
+
+    p_worker = sub.add_parser("worker", help="代替込みでワーカープロセスを起動")
+    standin_opts(p_worker)
+
+    p_run = sub.add_parser("run", help="負荷をかけて結果を表示")
+    standin_opts(p_run)
+    p_run.add_argument("--url", help="既存サーバーの URL（省略時は serve を子プロセスで起動）")
+    p_run.add_argument("--worker-procs", type=int, default=0,
+                       help="別プロセスのワーカー数（>0 で SQLite キュー構成、0 なら API プロセス内で処理）")
+    p_run.add_argument("--jobs", type=int, default=50)
+    p_run.add_argument("--concurrency", type=int, default=8,
+                       help="クローズドループで同時に進行させるジョブ数（--rate 指定時は使わない）")
+    p_run.add_argument("--rate", type=float, default=0.0,
+                       help="オープンループの平均到着率（jobs/s、ポアソン到着）。0 ならクローズドループ")
+    p_run.add_argument("--youtube-ratio", type=float, default=0.5, help="YouTube ジョブの割合")
+    p_run.add_argument("--poll", type=float, default=0.5, help="ステータスのポーリング間隔（秒）")
+    p_run.add_argument("--job-timeout", type=float, default=600.0)
+    p_run.add_argument("--rss-interval", type=float, default=1.0)
+    p_run.add_argument("--json", help="結果を JSON で保存するパス")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    elif args.command == "worker":
+        work(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+コールドスタート（プロセス起動から最初のジョブ完了まで）の計測。
+
+毎回 uvicorn を新しいプロセスで起動し、次の時刻を測る（起動からの秒数）:
+  health     /health が応答した（uvicorn が bind した）
+  ready      /ready が 200 を返した（ウォームアップ完了）
+  first_job  最初のジョブ（WAV アップロード → 生成）が completed になった
+  job        ジョブの投入から完了まで
+
+モード:
+  no_bytecode  バイトコードなし（PYTHONPYCACHEPREFIX を空のディレクトリにして全部コンパイルさせる）
+  bytecode     コンパイル済み（Dockerfile の compileall 相当）、ウォームアップなし
+  warmup       コンパイル済み + STARTUP_WARMUP=1。Railway の healthcheckPath=/ready と同じく、
+               /ready を待ってからジョブを投入する
+
+LLM は Ollama 互換のスタブ（scripts/ollama_standin.py）を使う。文字起こし・取得などは
+この環境の設定・インストール済みのモジュールのまま動くので、本番と同じイメージの中で実行する。
+
+  python scripts/measure_cold_start.py --runs 3
+  python scripts/measure_cold_start.py --modes bytecode,warmup --runs 5 --json cold_start.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+MODES = ("no_bytecode", "bytecode", "warmup")
+POLL = 0.05
+
+
+def _tone_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """440Hz の 16kHz mono WAV。"""
+    import math
+
+    buf = io.BytesIO()
+    n = int(seconds * sample_rate)
+    frames = b"".join(
+        int(8000 * math.sin(2 * math.pi * 440 * i / sample_rate)).to_bytes(2, "little", signed=True) for i in range(n)
+    )
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(frames)
+    return buf.getvalue()
+
+
+def _wait(session, url: str, deadline: float) -> None:
+    while time.perf_counter() < deadline:
+        try:
+            if session.get(url, timeout=1).status_code == 200:
+                return
+        except Exception:
+            pass
+        time.sleep(POLL)
+    raise TimeoutError(url)
+
+
+def _run_once(args: argparse.Namespace, mode: str, env: dict, audio: bytes) -> dict:
+    import requests
+
+    env = dict(env)
+    env["STARTUP_WARMUP"] = "1" if mode == "warmup" else "0"
+    if mode == "no_bytecode":
+        env["PYTHONPYCACHEPREFIX"] = tempfile.mkdtemp(prefix="coldstart-pyc-")
+    base = f"http://127.0.0.1:{args.port}"
+    session = requests.Session()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = t0 + args.timeout
+    try:
+        _wait(session, f"{base}/health", deadline)
+        result = {"health": time.perf_counter() - t0}
+        if mode == "warmup":
+            _wait(session, f"{base}/ready", deadline)
+            result["ready"] = time.perf_counter() - t0
+            result["warmup_steps"] = session.get(f"{base}/ready").json().get("steps")
+
+        submitted = time.perf_counter()
+        files = {"file": ("coldstart.wav", audio, "audio/wav")}
+        job_id = session.post(f"{base}/api/upload", files=files).json()["job_id"]
+        session.post(f"{base}/api/generate/{job_id}").raise_for_status()
+        while True:
+            job = session.get(f"{base}/api/jobs/{job_id}", params={"fields": "status,error,timings"}).json()
+            if job["status"] in ("completed", "error", "cancelled", "timed_out"):
+                break
+            if time.perf_counter() > deadline:
+                raise TimeoutError(job_id)
+            time.sleep(POLL)
+        if job["status"] != "completed":
+            raise RuntimeError(f"first job {job['status']}: {job.get('error')}")
+        result["first_job"] = time.perf_counter() - t0
+        result["job"] = time.perf_counter() - submitted
+        result["timings"] = job.get("timings")
+        return result
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def _summary(runs: list[dict]) -> dict:
+    keys = ("health", "ready", "first_job", "job")
+    return {
+        key: {
+            "median": round(statistics.median(r[key] for r in runs), 3),
+            "min": round(min(r[key] for r in runs), 3),
+            "max": round(max(r[key] for r in runs), 3),
+        }
+        for key in keys if all(key in r for r in runs)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"カンマ区切り（{', '.join(MODES)}）")
+    parser.add_argument("--runs", type=int, default=3, help="モードごとの計測回数")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--media-seconds", type=float, default=30.0, help="アップロードする音声の長さ（秒）")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="LLM スタブの生成にかかる秒数")
+    parser.add_argument("--keep-llm-keys", action="store_true",
+                        help="ANTHROPIC_API_KEY / GEMINI_API_KEY を消さずに本物の LLM を使う")
+    parser.add_argument("--timeout", type=float, default=600.0, help="1回あたりの上限（秒）")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    from scripts.ollama_standin import start_standin
+
+    env = dict(os.environ)
+    if not args.keep_llm_keys:
+        for key in ("ANTHROPIC_API_KEY", "GEMINI_API_KEY", "GOOGLE_API_KEY"):
+            env[key] = ""
+        env["OLLAMA_BASE_URL"], _ = start_standin(args.llm_delay, num_parallel=4)
+        env["OLLAMA_NUM_PARALLEL"] = "4"
+    env.pop("JOB_DB_PATH", None)  # API プロセス内のワーカーで処理する
+    if any(m != "no_bytecode" for m in modes):
+        subprocess.run([sys.executable, "-m", "compileall", "-q", BACKEND_DIR], check=True)
+    audio = _tone_wav(args.media_seconds)
+
+    report = {}
+    for mode in modes:
+        runs = []
+        for i in range(args.runs):
+            run = _run_once(args, mode, env, audio)
+            runs.append(run)
+            extra = f"  ready {run['ready']:.2f}s" if "ready" in run else ""
+            print(f"[{mode} #{i + 1}] health {run['health']:.2f}s{extra}  first_job {run['first_job']:.2f}s  "
+                  f"(job {run['job']:.2f}s)")
+        report[mode] = {"summary": _summary(runs), "runs": runs}
+
+    print(f"\n=== コールドスタート（中央値、起動からの秒数。{args.runs} 回ずつ） ===")
+    print(f"{'mode':<14}{'health':>10}{'ready':>10}{'first_job':>12}{'job':>10}")
+    for mode, data in report.items():
+        s = data["summary"]
+        ready = f"{s['ready']['median']:>10.2f}" if "ready" in s else f"{'-':>10}"
+        print(f"{mode:<14}{s['health']['median']:>10.2f}{ready}{s['first_job']['median']:>12.2f}"
+              f"{s['job']['median']:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"JSON: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Ollama 互換のスタブサーバー（/api/generate）と、services/ollama_engine.py の動作確認。
+
+本物の Ollama と同じように振る舞う部分:
+  - モデルが未ロード・keep_alive 切れ・num_ctx が変わったときはロードに --load-delay 秒かかる
+  - 同時に生成するのは --num-parallel 本まで（超えた分はサーバー内で待つ）
+  - stream=true なら NDJSON で少しずつ返し、最後の行に done / トークン数 / load_duration を載せる
+  - format に JSON スキーマがあれば、スキーマの形をした JSON を返す
+  - prompt なしのリクエストはモデルのロードだけ行う（ウォームアップ）
+GET /stats でロード回数・サーバー内の最大同時実行数・受け取った num_ctx などを返す。
+
+  # スタブだけ起動する（OLLAMA_BASE_URL=http://127.0.0.1:11435 で使う）
+  python scripts/ollama_standin.py serve --port 11435 --delay 1 --num-parallel 2
+
+  # スタブに対して ollama_engine を並列に呼び、ロード回数・同時実行数・JSON を確認する
+  python scripts/ollama_standin.py check --requests 8 --num-parallel 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def _sample(schema: dict | None):
+    """JSON スキーマの形をした値を作る。"""
+    schema = schema or {}
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _sample(sub) for name, sub in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        return [_sample(schema.get("items")) for _ in range(2)]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    if "MM:SS" in (schema.get("description") or ""):
+        return "00:10"
+    return "stand-in"
+
+
+def _keep_alive_seconds(value) -> float:
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = str(value).strip()
+    if text.startswith("-"):
+        return float("inf")
+    return float(text[:-1]) * units[text[-1]] if text[-1] in units else float(text)
+
+
+class StandinState:
+    def __init__(self, delay: float, load_delay: float, num_parallel: int, default_response: str | None):
+        self.delay = delay
+        self.load_delay = load_delay
+        self.default_response = default_response
+        self.slots = threading.Semaphore(num_parallel)
+        self.lock = threading.Lock()
+        self.loaded: tuple[str, int] | None = None  # (model, num_ctx)
+        self.expires = 0.0
+        self.inflight = 0
+        self.stats = {"requests": 0, "warmups": 0, "loads": 0, "max_inflight": 0,
+                      "streamed": 0, "with_format": 0, "num_ctx": [], "keep_alive": []}
+
+    def load(self, model: str, num_ctx: int, keep_alive) -> float:
+        """必要ならモデルをロードし、ロードにかかった秒数を返す。"""
+        with self.lock:
+            now = time.monotonic()
+            needed = self.loaded != (model, num_ctx) or now > self.expires
+            if needed:
+                self.stats["loads"] += 1
+                self.loaded = (model, num_ctx)
+            self.expires = now + self.load_delay + _keep_alive_seconds(keep_alive)
+        if needed:
+            time.sleep(self.load_delay)
+        return self.load_delay if needed else 0.0
+
+
+def start_standin(delay: float = 1.0, load_delay: float = 0.0, num_parallel: int = 1,
+                  default_response: str | None = None, port: int = 0) -> tuple[str, StandinState]:
+    """スタブサーバーをバックグラウンドで起動し、(ベース URL, 状態) を返す。"""
+    state = StandinState(delay, load_delay, num_parallel, default_response)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path != "/stats":
+                self.send_error(404)
+                return
+            with state.lock:
+                payload = json.dumps(state.stats).encode()
+            self._send_json(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            options = req.get("options") or {}
+            num_ctx = int(options.get("num_ctx") or 2048)
+            with state.lock:
+                state.stats["num_ctx"].append(num_ctx)
+                state.stats["keep_alive"].append(req.get("keep_alive"))
+            if not req.get("prompt"):
+                load = state.load(req.get("model", ""), num_ctx, req.get("keep_alive"))
+                with state.lock:
+                    state.stats["warmups"] += 1
+                self._send_json(json.dumps({"response": "", "done": True, "done_reason": "load",
+                                            "load_duration": int(load * 1e9)}).encode())
+                return
+
+            state.slots.acquire()
+            try:
+                with state.lock:
+                    state.stats["requests"] += 1
+                    state.stats["streamed"] += bool(req.get("stream", True))
+                    state.stats["with_format"] += isinstance(req.get("format"), dict)
+                    state.inflight += 1
+                    state.stats["max_inflight"] = max(state.stats["max_inflight"], state.inflight)
+                try:
+                    load = state.load(req.get("model", ""), num_ctx, req.get("keep_alive"))
+                    if isinstance(req.get("format"), dict):
+                        text = json.dumps(_sample(req["format"]), ensure_ascii=False)
+                    else:
+                        text = state.default_response or "stand-in"
+                    prompt_tokens = (len(req.get("system", "")) + len(req["prompt"])) // 4
+                    final = {"done": True, "done_reason": "stop", "load_duration": int(load * 1e9),
+                             "prompt_eval_count": min(prompt_tokens, num_ctx), "eval_count": len(text) // 4}
+                    if req.get("stream", True):
+                        self._stream(text, final)
+                    else:
+                        time.sleep(state.delay)
+                        self._send_json(json.dumps({"response": text, **final}).encode())
+                finally:
+                    with state.lock:
+                        state.inflight -= 1
+            finally:
+                state.slots.release()
+
+        def _stream(self, text: str, final: dict) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pieces = [text[i:i + 64] for i in range(0, len(text), 64)] or [""]
+            try:
+                for piece in pieces:
+                    time.sleep(state.delay / len(pieces))
+                    self._chunk(json.dumps({"response": piece, "done": False}).encode() + b"\n")
+                self._chunk(json.dumps({"response": "", **final}).encode() + b"\n")
+                self._chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # クライアントが切断した（キャンセル）
+
+        def _chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, payload: bytes) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *a):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", state
+
+
+def serve(args: argparse.Namespace) -> None:
+    base, _ = start_standin(args.delay, args.load_delay, args.num_parallel, port=args.port)
+    print(f"Ollama stand-in: {base}  (Ctrl+C で終了)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+def check(args: argparse.Namespace) -> None:
+    """スタブに対して ollama_engine を呼び、ロード回数・同時実行数・num_ctx・JSON を表示する。"""
+    import logging
+
+    base, state = start_standin(args.delay, args.load_delay, args.num_parallel)
+    os.environ["OLLAMA_BASE_URL"] = base
+    os.environ["OLLAMA_NUM_PARALLEL"] = str(args.num_parallel)
+    os.environ.setdefault("OLLAMA_KEEP_ALIVE", "-1")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+                        datefmt="%H:%M:%S")
+
+    from services import ai_generator, ollama_engine
+
+    started = time.perf_counter()
+    ollama_engine.warm()
+    warm_seconds = time.perf_counter() - started
+
+    # 短い文字起こしと長い文字起こしを混ぜる（長いほど num_ctx が大きくなる）
+    transcripts = ["今日はAIの話をします。" * (50 if i % 2 else 2000) for i in range(args.requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.requests) as pool:
+        results = list(pool.map(lambda t: ai_generator._generate_ollama(t), transcripts))
+    elapsed = time.perf_counter() - started
+
+    ok = all(all(name in r for name in ai_generator.ARTIFACTS) for r in results)
+    with state.lock:
+        stats = dict(state.stats)
+    print(f"\n=== Ollama stand-in check ({args.requests} requests, num_parallel={args.num_parallel}) ===")
+    print(f"ウォームアップ: {warm_seconds:.2f}s  生成: {elapsed:.2f}s")
+    print(f"モデルのロード回数: {stats['loads']}  サーバー内の最大同時実行数: {stats['max_inflight']}")
+    print(f"stream: {stats['streamed']}/{stats['requests']}  format: {stats['with_format']}/{stats['requests']}")
+    print(f"num_ctx: {sorted(set(stats['num_ctx']))}  keep_alive: {sorted(set(map(str, stats['keep_alive'])))}")
+    print(f"JSON: {'OK' if ok else 'NG'}")
+    if not ok or stats["max_inflight"] > args.num_parallel:
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--delay", type=float, default=1.0, help="1リクエストの生成にかかる秒数")
+        p.add_argument("--load-delay", type=float, default=2.0, help="モデルのロードにかかる秒数")
+        p.add_argument("--num-parallel", type=int, default=1, help="サーバーが同時に生成するリクエスト数")
+
+    p_serve = sub.add_parser("serve", help="スタブを起動する")
+    common(p_serve)
+    p_serve.add_argument("--port", type=int, default=11435)
+
+    p_check = sub.add_parser("check", help="スタブに対して ollama_engine を動かす")
+    common(p_check)
+    p_check.add_argument("--requests", type=int, default=8)
+
+    args = parser.parse_args()
+    {"serve": serve, "check": check}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
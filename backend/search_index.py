@@ -0,0 +1,208 @@
+"""
+文字起こしの全文検索インデックス（SQLite FTS5、trigram トークナイザ）。
+
+セグメント単位で索引し、ヒットしたジョブ ID・セグメントの start/end・スニペットを返す。
+trigram は3文字の n-gram なので、分かち書きのない日本語でも部分一致で引ける。
+trigram で引けない2文字以下の語（「AI」「動画」など）は、1文字・2文字の n-gram を別の FTS テーブル
+（transcript_grams）に索引して引く。
+文字起こしが終わったジョブから index_job() で逐次追加する。
+
+保存先は SEARCH_DB_PATH（未設定なら JOB_DB_PATH）の SQLite。
+どちらも未設定のインメモリ構成では、プロセス内のメモリ上の SQLite を使う。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+import store
+from segments import SegmentArray
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = os.environ.get("SEARCH_DB_PATH") or store.DB_PATH
+
+# これより短い語は trigram で引けないので transcript_grams（1文字・2文字の n-gram）で引く
+MIN_TRIGRAM_CHARS = 3
+_WORD = re.compile(r"[^\W_]+")  # 英数字・かな・漢字の並び（n-gram はこの中だけで作る）
+SNIPPET_TOKENS = 16
+
+_memory_conn: sqlite3.Connection | None = None
+_memory_lock = threading.Lock()
+_available: bool | None = None
+_init_lock = threading.Lock()
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS transcript_segments ("
+    " id INTEGER PRIMARY KEY,"
+    " job_id TEXT NOT NULL,"
+    " start REAL,"
+    " end REAL,"
+    " text TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS transcript_segments_job ON transcript_segments (job_id)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transcript_fts USING fts5("
+    " text, content='transcript_segments', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS transcript_segments_ai AFTER INSERT ON transcript_segments BEGIN"
+    " INSERT INTO transcript_fts (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS transcript_segments_ad AFTER DELETE ON transcript_segments BEGIN"
+    " INSERT INTO transcript_fts (transcript_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    # 本文は持たず（contentless）、mva_grams() で作った n-gram を空白区切りの語として索引する
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transcript_grams USING fts5(grams, content='', tokenize='unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS transcript_grams_ai AFTER INSERT ON transcript_segments BEGIN"
+    " INSERT INTO transcript_grams (rowid, grams) VALUES (new.id, mva_grams(new.text)); END",
+    "CREATE TRIGGER IF NOT EXISTS transcript_grams_ad AFTER DELETE ON transcript_segments BEGIN"
+    " INSERT INTO transcript_grams (transcript_grams, rowid, grams) VALUES ('delete', old.id, mva_grams(old.text));"
+    " END",
+)
+
+
+def _grams(text: str) -> str:
+    """本文の1文字・2文字の n-gram を空白区切りにする（transcript_grams に索引する内容）。"""
+    grams: list[str] = []
+    for word in _WORD.findall(text.lower()):
+        grams.extend(word)
+        grams.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return " ".join(grams)
+
+
+def _register(conn: sqlite3.Connection) -> sqlite3.Connection:
+    # トリガーが使うので、索引に書き込む接続はすべて登録する
+    conn.create_function("mva_grams", 1, _grams, deterministic=True)
+    return conn
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    global _memory_conn
+    if INDEX_PATH:
+        conn = _register(sqlite3.connect(INDEX_PATH, timeout=30, isolation_level=None))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+    # インメモリは接続を閉じると消えるので1本を共有する
+    with _memory_lock:
+        if _memory_conn is None:
+            _memory_conn = _register(sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None))
+        yield _memory_conn
+
+
+def available() -> bool:
+    """FTS5 の trigram が使えるか（初回にテーブルを作る）。SQLite 3.34 未満では使えない。"""
+    global _available
+    with _init_lock:
+        if _available is None:
+            try:
+                with _connect() as conn:
+                    backfill = conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'transcript_segments'"
+                    ).fetchone() is not None and conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'transcript_grams'"
+                    ).fetchone() is None
+                    for statement in _SCHEMA:
+                        conn.execute(statement)
+                    if backfill:  # transcript_grams より前に索引したセグメント
+                        conn.execute("INSERT INTO transcript_grams (rowid, grams)"
+                                     " SELECT id, mva_grams(text) FROM transcript_segments")
+                _available = True
+            except sqlite3.Error as e:
+                logger.warning("Transcript search disabled (SQLite %s): %s", sqlite3.sqlite_version, e)
+                _available = False
+        return _available
+
+
+def index_job(job_id: str, segments: SegmentArray | None, transcript: str = "") -> int:
+    """ジョブの文字起こしを索引し直す。索引したセグメント数を返す。"""
+    if not available():
+        return 0
+    if segments:
+        rows = [(job_id, s.start, s.end, s.text) for s in segments if s.text]
+    elif transcript:
+        rows = [(job_id, None, None, transcript)]  # タイムスタンプなし
+    else:
+        rows = []
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM transcript_segments WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT INTO transcript_segments (job_id, start, end, text) VALUES (?, ?, ?, ?)", rows
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return len(rows)
+
+
+def search(query: str, limit: int = 50, job_id: str | None = None) -> list[dict]:
+    """
+    空白区切りの各語をすべて含むセグメントを新しい順に返す。
+    [{"job_id", "start", "end", "snippet"}, ...]（スニペットの一致箇所は [ ] で囲む）
+    """
+    terms = [t for t in query.split() if t]
+    if not terms or not available():
+        return []
+    long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM_CHARS]
+    short_terms = [t for t in terms if len(t) < MIN_TRIGRAM_CHARS]
+    # 1文字・2文字の n-gram そのものなら transcript_grams で引く。記号を含む語だけ本文の LIKE に残す
+    gram_terms = [t for t in short_terms if _WORD.fullmatch(t)]
+    like_terms = [t for t in short_terms if not _WORD.fullmatch(t)]
+
+    where, params = [], []
+    if long_terms:
+        # 各語をフレーズとして AND 検索（" はエスケープ）
+        where.append("transcript_fts MATCH ?")
+        params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+    if gram_terms:
+        where.append("s.id IN (SELECT rowid FROM transcript_grams WHERE transcript_grams MATCH ?)")
+        params.append(" AND ".join(f'"{t}"' for t in gram_terms))
+    if job_id:
+        where.append("s.job_id = ?")
+        params.append(job_id)
+    # 記号を含む短い語は本文の LIKE（他の条件がなければ全件走査になる）
+    for term in like_terms:
+        where.append("s.text LIKE ? ESCAPE '\\'")
+        params.append("%" + re.sub(r"([%_\\])", r"\\\1", term) + "%")
+
+    if long_terms:
+        sql = (
+            "SELECT s.job_id, s.start, s.end, s.text,"
+            f" snippet(transcript_fts, 0, '[', ']', '…', {SNIPPET_TOKENS})"
+            " FROM transcript_fts JOIN transcript_segments s ON s.id = transcript_fts.rowid"
+            f" WHERE {' AND '.join(where)} ORDER BY transcript_fts.rowid DESC LIMIT ?"
+        )
+    else:
+        sql = (
+            "SELECT s.job_id, s.start, s.end, s.text, NULL FROM transcript_segments s"
+            f" WHERE {' AND '.join(where)} ORDER BY s.id DESC LIMIT ?"
+        )
+    params.append(limit)
+
+    with _connect() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [
+        {
+            "job_id": job,
+            "start": start,
+            "end": end,
+            "snippet": _highlight(snippet or text, short_terms),
+        }
+        for job, start, end, text, snippet in rows
+    ]
+
+
+def _highlight(text: str, terms: list[str]) -> str:
+    """FTS の snippet が効かない短い語を [ ] で囲む。"""
+    for term in terms:
+        text = text.replace(term, f"[{term}]")
+    return text
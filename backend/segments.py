@@ -0,0 +1,137 @@
+"""
+文字起こしセグメントのコンパクトな入れ物。
+
+セグメントごとの dict のリストの代わりに、start / end を float 配列、テキストを
+1本の文字列（セグメントを " " で連結したもの = 全文）とオフセット配列で持つ。
+数時間の動画でも Python オブジェクトは数個で済み、全文テキストも二重に持たない。
+
+  segs = SegmentArray.from_dicts(transcript_data["segments"])
+  for start, end, text in segs: ...
+  segs.text           # 全文（job["transcript"] と共有できる）
+  segs.to_bytes()     # ストア保存用のバイナリ
+  segs.to_columns()   # API レスポンス用の列形式 JSON
+"""
+
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator, NamedTuple
+
+_MAGIC = b"SEG1"
+_HEADER = struct.Struct("<4sII")  # magic, セグメント数, テキストの UTF-8 バイト数
+
+
+class Segment(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+
+class SegmentArray:
+    """start / end の float 配列 + 連結テキスト + オフセットで持つセグメント列。"""
+
+    __slots__ = ("starts", "ends", "offsets", "text")
+
+    def __init__(self, starts: array, ends: array, offsets: array, text: str):
+        self.starts = starts    # array('d')
+        self.ends = ends        # array('d')
+        self.offsets = offsets  # array('I')、len = セグメント数 + 1（text 内の文字位置）
+        self.text = text
+
+    @classmethod
+    def from_dicts(cls, segments: Iterable[dict] | None) -> SegmentArray:
+        """[{"start", "end", "text"}, ...] から作る。"""
+        starts, ends, offsets = array("d"), array("d"), array("I", [0])
+        texts: list[str] = []
+        pos = 0
+        for seg in segments or ():
+            text = seg["text"]
+            if texts:
+                pos += 1  # 区切りの空白
+            pos += len(text)
+            starts.append(seg["start"])
+            ends.append(seg["end"])
+            offsets.append(pos)
+            texts.append(text)
+        return cls(starts, ends, offsets, " ".join(texts))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __bool__(self) -> bool:
+        return len(self.starts) > 0
+
+    def text_at(self, i: int) -> str:
+        # 2番目以降のセグメントは先頭の区切り空白を飛ばす
+        begin = self.offsets[i] + (1 if i else 0)
+        return self.text[begin:self.offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> Segment:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return Segment(self.starts[i], self.ends[i], self.text_at(i))
+
+    def __iter__(self) -> Iterator[Segment]:
+        text, offsets = self.text, self.offsets
+        begin = 0
+        for i, (start, end) in enumerate(zip(self.starts, self.ends)):
+            stop = offsets[i + 1]
+            yield Segment(start, end, text[begin:stop])
+            begin = stop + 1
+
+    def to_dicts(self) -> list[dict]:
+        return [{"start": s.start, "end": s.end, "text": s.text} for s in self]
+
+    # ── エンコード ──
+
+    def to_bytes(self) -> bytes:
+        """ヘッダ + start/end (float64) + offsets (uint32) + UTF-8 テキスト。"""
+        raw = self.text.encode("utf-8")
+        return b"".join((
+            _HEADER.pack(_MAGIC, len(self), len(raw)),
+            _little_endian(self.starts),
+            _little_endian(self.ends),
+            _little_endian(self.offsets),
+            raw,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> SegmentArray:
+        magic, n, text_len = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a segment buffer")
+        pos = _HEADER.size
+        starts, pos = _read_array("d", data, pos, n)
+        ends, pos = _read_array("d", data, pos, n)
+        offsets, pos = _read_array("I", data, pos, n + 1)
+        text = data[pos:pos + text_len].decode("utf-8")
+        return cls(starts, ends, offsets, text)
+
+    def to_columns(self) -> dict:
+        """列形式の JSON 用 dict。セグメントごとの dict より小さく速い。"""
+        return {
+            "start": self.starts.tolist(),
+            "end": self.ends.tolist(),
+            "text": [seg.text for seg in self],
+        }
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "little":
+        return values.tobytes()
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def _read_array(typecode: str, data: bytes, pos: int, count: int) -> tuple[array, int]:
+    values = array(typecode)
+    end = pos + values.itemsize * count
+    values.frombytes(data[pos:end])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values, end
@@ -5,6 +5,17 @@ import json
 import re
 import logging
 import time
+import contextvars
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import cancellation
+import metrics
+import profiling
+from segments import SegmentArray
+from services import rate_limit
 
 logger = logging.getLogger(__name__)
 
@@ -12,60 +23,45 @@ USE_CLAUDE = bool(os.environ.get("ANTHROPIC_API_KEY"))
 _gemini_key = (os.environ.get("GOOGLE_API_KEY") or os.environ.get("GEMINI_API_KEY") or "").strip()
 USE_GEMINI = bool(_gemini_key)
 
-SYSTEM_PROMPT = """\
-あなたはSNSコンテンツ戦略の専門家です。
-動画の文字起こしテキストとタイムスタンプ情報を受け取り、以下の3つを生成してください。
-
-1. viral_clips: 動画内の「バズりそうな切り抜き箇所」（3〜5個）
+# single: 1回の呼び出しで全成果物を生成 | parallel: 成果物ごとに並列で呼び出してマージ
+GENERATION_MODE = os.environ.get("GENERATION_MODE", "single")
+# parallel モードで失敗した成果物だけを再試行する回数
+ARTIFACT_RETRIES = int(os.environ.get("GENERATION_ARTIFACT_RETRIES", "1"))
+
+# プロンプトキャッシュ。システムプロンプト + 文字起こしを共通の先頭部分にして、
+# 同じジョブの2回目以降の呼び出し（parallel・選択再生成）でキャッシュから読ませる
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "1") == "1"
+# Gemini の明示的なコンテキストキャッシュ（有料枠向け。無料枠は暗黙キャッシュのみ）
+GEMINI_CONTEXT_CACHE = os.environ.get("GEMINI_CONTEXT_CACHE", "0") == "1"
+GEMINI_CACHE_TTL_SEC = int(os.environ.get("GEMINI_CACHE_TTL_SEC", "600"))
+GEMINI_CACHE_MIN_TOKENS = 1024  # これより短い内容はキャッシュを作れない
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# 生成する成果物（results のキー）。選択再生成ではこのうち一部だけを生成する
+ARTIFACTS = ("viral_clips", "x_thread", "blog_article")
+# 言語によらない成果物（切り抜き箇所はタイムスタンプで決まる）。複数言語で出力しても1回だけ生成する
+LANGUAGE_INDEPENDENT = ("viral_clips",)
+
+# 出力言語: same=動画と同じ | ja=日本語 | en=英語
+OUTPUT_LANGUAGES = ("same", "ja", "en")
+
+# 成果物ごとの指示・出力フォーマット・JSON スキーマ・出力トークン上限
+_ARTIFACT_SPECS = {
+    "viral_clips": {
+        "instruction": """\
+viral_clips: 動画内の「バズりそうな切り抜き箇所」（3〜5個）
    - 文字起こしのタイムスタンプを参考に start_time / end_time を MM:SS 形式で指定
-   - 各クリップにキャッチーなタイトルと、なぜバズるかの理由を記載
-
-2. x_thread: X（旧Twitter）用のスレッド投稿（5〜10連投）
-   - 1投目は強いフックで始める
-   - 最終投稿にCTA（行動喚起）を入れる
-   - 各投稿は280文字以内
-
-3. blog_article: SEO最適化されたブログ記事（約800文字、Markdown形式）
-   - h1, h2 の見出しを持つ
-   - 簡潔にまとめる
-
-重要: 出力言語は後述の指示に従ってください。
-
-必ず有効なJSON形式のみで返答してください。改行・余分な空白は避け、コンパクトに。
-マークダウンのコードブロック（```）で囲まないでください。"""
-
-GENERATION_PROMPT = """\
-以下の動画文字起こしを分析し、JSONで返してください。
-
-## 出力フォーマット
-{{
+   - 各クリップにキャッチーなタイトルと、なぜバズるかの理由を記載""",
+        "format": """\
   "viral_clips": [
-    {{
+    {
       "start_time": "MM:SS",
       "end_time": "MM:SS",
       "title": "切り抜きタイトル",
       "reason": "バズる理由の説明"
-    }}
-  ],
-  "x_thread": [
-    "1/N ツイート本文...",
-    "2/N ツイート本文..."
-  ],
-  "blog_article": "# タイトル\\n\\nMarkdown形式の記事本文（約800文字）"
-}}
-
-## タイムスタンプ付き文字起こし
-{transcript_with_timestamps}
-
-## 全文テキスト
-{transcript}
-"""
-
-# Structured output 用 JSON スキーマ（Gemini が有効な JSON のみ返すようにする）
-GEMINI_JSON_SCHEMA = {
-    "type": "object",
-    "properties": {
-        "viral_clips": {
+    }
+  ]""",
+        "schema": {
             "type": "array",
             "items": {
                 "type": "object",
@@ -78,66 +74,272 @@ GEMINI_JSON_SCHEMA = {
                 "required": ["start_time", "end_time", "title", "reason"],
             },
         },
-        "x_thread": {
+        "max_tokens": 1024,
+    },
+    "x_thread": {
+        "instruction": """\
+x_thread: X（旧Twitter）用のスレッド投稿（5〜10連投）
+   - 1投目は強いフックで始める
+   - 最終投稿にCTA（行動喚起）を入れる
+   - 各投稿は280文字以内""",
+        "format": """\
+  "x_thread": [
+    "1/N ツイート本文...",
+    "2/N ツイート本文..."
+  ]""",
+        "schema": {
             "type": "array",
             "items": {"type": "string"},
             "description": "X用スレッド投稿",
         },
-        "blog_article": {
+        "max_tokens": 2048,
+    },
+    "blog_article": {
+        "instruction": """\
+blog_article: SEO最適化されたブログ記事（約800文字、Markdown形式）
+   - h1, h2 の見出しを持つ
+   - 簡潔にまとめる""",
+        "format": """\
+  "blog_article": "# タイトル\\n\\nMarkdown形式の記事本文（約800文字）\"""",
+        "schema": {
             "type": "string",
             "description": "Markdown形式のブログ記事",
         },
+        "max_tokens": 2048,
     },
-    "required": ["viral_clips", "x_thread", "blog_article"],
 }
 
 
+def _json_schema(artifacts: tuple[str, ...]) -> dict:
+    """Structured output 用 JSON スキーマ（Gemini が有効な JSON のみ返すようにする）"""
+    return {
+        "type": "object",
+        "properties": {name: _ARTIFACT_SPECS[name]["schema"] for name in artifacts},
+        "required": list(artifacts),
+    }
+
+
+# 成果物に依存しない（キャッシュされる先頭部分）。成果物ごとの指示は文字起こしの後に置く
+SYSTEM_PROMPT = """\
+あなたはSNSコンテンツ戦略の専門家です。
+動画の文字起こしテキストとタイムスタンプ情報を受け取り、指示された成果物を生成してください。
+
+重要: 出力言語は後述の指示に従ってください。
+
+必ず有効なJSON形式のみで返答してください。改行・余分な空白は避け、コンパクトに。
+マークダウンのコードブロック（```）で囲まないでください。"""
+
+GEMINI_JSON_SCHEMA = _json_schema(ARTIFACTS)
+
+
 def _output_lang_instruction(output_language: str) -> str:
     """出力言語の指示文を返す。"""
     if output_language == "ja":
         return "必ず日本語で出力してください。文字起こしが英語の場合は、要約・翻訳して日本語で出力してください。"
+    if output_language == "en":
+        return "必ず英語で出力してください。文字起こしが日本語の場合は、要約・翻訳して英語で出力してください。"
     return "文字起こしが英語の場合は英語で、日本語の場合は日本語で出力してください。"
 
 
 def generate_content(
     transcript: str,
-    segments: list[dict] | None = None,
+    segments: SegmentArray | list[dict] | None = None,
     output_language: str = "same",
+    artifacts: tuple[str, ...] | list[str] | None = None,
 ) -> dict:
     """
     文字起こしテキストからコンテンツを生成する。
 
     Args:
         transcript: 文字起こし全文
-        segments: [{"start": float, "end": float, "text": str}, ...]
-        output_language: same=動画と同じ | ja=日本語で出力（英語動画を日本語化）
+        segments: SegmentArray または [{"start": float, "end": float, "text": str}, ...]
+        output_language: same=動画と同じ | ja=日本語で出力（英語動画を日本語化） | en=英語で出力
+        artifacts: 生成する成果物（ARTIFACTS の部分集合）。None なら全部
 
     Returns:
         {"viral_clips": [...], "x_thread": [...], "blog_article": "..."}
+        （artifacts 指定時はそのキーだけ）
+    """
+    artifacts = _normalize_artifacts(artifacts)
+    if GENERATION_MODE == "parallel" and len(artifacts) > 1:
+        return _generate_parallel(transcript, segments, output_language, artifacts)
+    return _generate_with_fallback(transcript, segments, output_language, artifacts)
+
+
+def normalize_languages(
+    output_languages: str | list[str] | tuple[str, ...],
+    transcript_language: str | None = None,
+) -> tuple[str, ...]:
+    """
+    出力言語の指定（リスト・カンマ区切り）を、指定順の重複なしのタプルにする。
+    transcript_language（ja / en）が分かっていれば same をその言語に置き換えてから重複を除く
+    （文字起こしが ja なら same,ja は ja の1回だけ生成する）。auto なら same のまま残す。
+    """
+    if isinstance(output_languages, str):
+        output_languages = [output_languages]
+    same = transcript_language if transcript_language in OUTPUT_LANGUAGES else "same"
+    languages: list[str] = []
+    for value in output_languages:
+        for lang in value.split(","):
+            lang = lang.strip()
+            if lang == "same":
+                lang = same
+            if lang and lang not in languages:
+                languages.append(lang)
+    unknown = [lang for lang in languages if lang not in OUTPUT_LANGUAGES]
+    if not languages or unknown:
+        raise ValueError(f"output_languages must be a non-empty subset of {list(OUTPUT_LANGUAGES)}")
+    return tuple(languages)
+
+
+def generate_languages(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None,
+    output_languages: str | list[str] | tuple[str, ...],
+    artifacts: tuple[str, ...] | list[str] | None = None,
+    transcript_language: str | None = None,
+) -> dict:
+    """
+    複数の出力言語でコンテンツを生成する。言語が1つなら generate_content と同じ。
+    same は transcript_language に置き換えてから重複を除く（normalize_languages）。
+
+    切り抜き箇所（LANGUAGE_INDEPENDENT）は先頭の言語の呼び出しで1回だけ分析し、
+    文章の成果物だけを残りの言語ごとに並列で生成する。
+
+    Returns:
+        {"viral_clips": [...], "x_thread": [...], "blog_article": "...",   # 先頭の言語
+         "languages": {"ja": {"x_thread": [...], "blog_article": "..."}, "en": {...}}}
+        languages は文章の成果物を生成したときだけ。先頭の言語の文章はトップレベルと
+        languages の両方に入る。トップレベルは output_languages 導入前の
+        クライアント向け、languages は言語を区別せずに全部を並べるクライアント向け
+    """
+    artifacts = _normalize_artifacts(artifacts)
+    languages = normalize_languages(output_languages, transcript_language)
+    if len(languages) == 1:
+        return generate_content(transcript, segments, output_language=languages[0], artifacts=artifacts)
+
+    text_artifacts = tuple(name for name in artifacts if name not in LANGUAGE_INDEPENDENT)
+    tasks = [(languages[0], artifacts)]
+    if text_artifacts:
+        tasks += [(lang, text_artifacts) for lang in languages[1:]]
+    logger.info("Generating for languages: %s (%s per language)", ", ".join(languages), ", ".join(text_artifacts))
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="language") as pool:
+        # ジョブのメトリクス・キャンセルトークン・プロファイルを各スレッドに引き継ぐ
+        futures = [
+            pool.submit(contextvars.copy_context().run, profiling.run_attached,
+                        generate_content, transcript, segments, lang, names)
+            for lang, names in tasks
+        ]
+        outputs = [future.result() for future in futures]
+
+    results = dict(outputs[0])
+    if text_artifacts:
+        results["languages"] = {
+            lang: {name: output[name] for name in text_artifacts} for (lang, _), output in zip(tasks, outputs)
+        }
+    return results
+
+
+def _generate_parallel(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None,
+    output_language: str,
+    artifacts: tuple[str, ...],
+) -> dict:
     """
+    成果物ごとに小さなリクエストを並列で投げてマージする。
+    所要時間は一番遅い成果物で決まり、失敗した成果物だけを再試行する。
+    """
+    def generate_one(name: str) -> dict:
+        for attempt in range(ARTIFACT_RETRIES + 1):
+            try:
+                return _generate_with_fallback(transcript, segments, output_language, (name,))
+            except Exception as e:
+                # 枠待ちの上限に達したものは再試行してもまた待つだけ
+                if attempt >= ARTIFACT_RETRIES or isinstance(e, rate_limit.RateLimited):
+                    raise
+                logger.warning("Generating %s failed (%s), retrying", name, type(e).__name__)
+
+    logger.info("Parallel generation: %s", ", ".join(artifacts))
+    with ThreadPoolExecutor(max_workers=len(artifacts), thread_name_prefix="artifact") as pool:
+        # ジョブのメトリクス・キャンセルトークン・プロファイルを各スレッドに引き継ぐ
+        futures = [pool.submit(contextvars.copy_context().run, profiling.run_attached, generate_one, name)
+                   for name in artifacts]
+        results: dict = {}
+        for future in futures:
+            results.update(future.result())
+    return results
+
+
+def _generate_with_fallback(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None,
+    output_language: str,
+    artifacts: tuple[str, ...],
+) -> dict:
+    """
+    設定に応じたプロバイダで生成し、失敗したら次のプロバイダにフォールバックする。
+    レート制限の枠が空かなかった（RateLimited）ときはフォールバックせずに送出し、
+    ダミーの結果で完了させない。
+    """
+    args = (transcript, segments, output_language, artifacts)
     if USE_CLAUDE:
-        return _generate_claude(transcript, segments, output_language)
+        return _call_provider("claude", "claude", artifacts, _generate_claude, *args)
     if USE_GEMINI:
         try:
-            return _generate_gemini(transcript, segments, output_language)
+            return _call_provider("gemini", "gemini", artifacts, _generate_gemini, *args)
+        except rate_limit.RateLimited:
+            raise
         except Exception as e:
             logger.warning("Gemini API failed (%s): %s", type(e).__name__, e)
             logger.info("Trying Gemini REST API fallback...")
             try:
-                return _generate_gemini_rest(transcript, segments, output_language)
+                return _call_provider("gemini_rest", "gemini>gemini_rest", artifacts, _generate_gemini_rest, *args)
+            except rate_limit.RateLimited:
+                raise
             except Exception as e_rest:
                 logger.warning("Gemini REST also failed (%s), trying Ollama...", type(e_rest).__name__)
             try:
-                return _generate_ollama(transcript, segments, output_language)
+                return _call_provider("ollama", "gemini>gemini_rest>ollama", artifacts, _generate_ollama, *args)
+            except rate_limit.RateLimited:
+                raise
             except Exception as e2:
                 logger.warning("Ollama failed (%s), falling back to dummy: %s", type(e2).__name__, e2)
-                return _generate_dummy(transcript)
+                return _call_provider("dummy", "gemini>gemini_rest>ollama>dummy", artifacts,
+                                      _generate_dummy, transcript, artifacts)
     # Gemini 未設定時: Ollama を試してからダミー
     try:
-        return _generate_ollama(transcript, segments, output_language)
+        return _call_provider("ollama", "ollama", artifacts, _generate_ollama, *args)
+    except rate_limit.RateLimited:
+        raise
     except Exception as e:
         logger.info("Ollama not available (%s), using dummy", type(e).__name__)
-        return _generate_dummy(transcript)
+        return _call_provider("dummy", "ollama>dummy", artifacts, _generate_dummy, transcript, artifacts)
+
+
+def _normalize_artifacts(artifacts) -> tuple[str, ...]:
+    """成果物の指定を ARTIFACTS の順に並べた重複なしのタプルにする。"""
+    if not artifacts:
+        return ARTIFACTS
+    unknown = set(artifacts) - set(ARTIFACTS)
+    if unknown:
+        raise ValueError(f"Unknown artifacts: {', '.join(sorted(unknown))}")
+    return tuple(name for name in ARTIFACTS if name in artifacts)
+
+
+def _call_provider(provider: str, path: str, artifacts: tuple[str, ...], fn, *args) -> dict:
+    """
+    プロバイダを呼び出し、レイテンシとエラーをメトリクスに記録する。path はフォールバック経路。
+    ジョブがキャンセル・タイムアウトしたら応答を待たずに JobCancelled を送出する。
+    応答に artifacts のキーが揃っていなければ ValueError（次のプロバイダにフォールバック）。
+    """
+    with metrics.track_provider("llm", provider, path):
+        result = cancellation.call(fn, *args)
+        missing = [name for name in artifacts if name not in result]
+        if missing:
+            raise ValueError(f"{provider} の応答に {', '.join(missing)} がありません")
+        # 頼んでいない成果物は返さない（選択再生成で既存の結果を上書きしない）
+        return {name: result[name] for name in artifacts}
 
 
 def _format_timestamp(seconds: float) -> str:
@@ -147,42 +349,118 @@ def _format_timestamp(seconds: float) -> str:
     return f"{m:02d}:{s:02d}"
 
 
-def _build_timestamped_transcript(segments: list[dict] | None) -> str:
+def _build_timestamped_transcript(segments: SegmentArray | list[dict] | None) -> str:
     """セグメント情報をタイムスタンプ付きテキストに整形。"""
     if not segments:
         return "(タイムスタンプ情報なし)"
+    if not isinstance(segments, SegmentArray):
+        segments = SegmentArray.from_dicts(segments)
+
+    return "\n".join(
+        f"[{_format_timestamp(start)} - {_format_timestamp(end)}] {text}"
+        for start, end, text in segments
+    )
+
+
+def _build_transcript_block(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None,
+    artifacts: tuple[str, ...],
+) -> str:
+    """文字起こし部分（ジョブ内で共通の先頭部分）。"""
+    parts = []
+    # タイムスタンプが必要なのは切り抜き箇所だけ。キャッシュ無効時はそれ以外で省いて入力を減らす。
+    # キャッシュ有効時は成果物によらず同じ内容にして、キャッシュを共有する
+    if PROMPT_CACHE or "viral_clips" in artifacts:
+        parts.append(f"## タイムスタンプ付き文字起こし\n{_build_timestamped_transcript(segments)}\n")
+    parts.append(f"## 全文テキスト\n{transcript}\n")
+    return "\n".join(parts)
+
+
+def _build_task_prompt(output_language: str, artifacts: tuple[str, ...]) -> str:
+    """成果物ごとの指示・出力フォーマット・出力言語（文字起こしの後に置く）。"""
+    items = "\n\n".join(
+        f"{i}. {_ARTIFACT_SPECS[name]['instruction']}" for i, name in enumerate(artifacts, 1)
+    )
+    fields = ",\n".join(_ARTIFACT_SPECS[name]["format"] for name in artifacts)
+    return f"""\
+上の動画文字起こしを分析し、以下の{len(artifacts)}つを生成してJSONで返してください。
+
+{items}
 
-    lines = []
-    for seg in segments:
-        start = _format_timestamp(seg["start"])
-        end = _format_timestamp(seg["end"])
-        lines.append(f"[{start} - {end}] {seg['text']}")
-    return "\n".join(lines)
+## 出力フォーマット
+{{
+{fields}
+}}
+
+## 出力言語
+{_output_lang_instruction(output_language)}"""
+
+
+def _build_user_prompt(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None,
+    output_language: str,
+    artifacts: tuple[str, ...],
+) -> str:
+    """文字起こし + 成果物の指示。"""
+    return f"{_build_transcript_block(transcript, segments, artifacts)}\n{_build_task_prompt(output_language, artifacts)}"
 
 
-def _generate_claude(transcript: str, segments: list[dict] | None = None, output_language: str = "same") -> dict:
+def _cache_control() -> dict:
+    """Anthropic のキャッシュ区切り（ここまでの先頭部分をキャッシュする）。"""
+    return {"cache_control": {"type": "ephemeral"}} if PROMPT_CACHE else {}
+
+
+def _max_output_tokens(artifacts: tuple[str, ...], full: int) -> int:
+    """全成果物なら full、一部だけなら成果物ごとの上限の合計（full を超えない）。"""
+    if artifacts == ARTIFACTS:
+        return full
+    return min(full, sum(_ARTIFACT_SPECS[name]["max_tokens"] for name in artifacts))
+
+
+def _generate_claude(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None = None,
+    output_language: str = "same",
+    artifacts: tuple[str, ...] = ARTIFACTS,
+) -> dict:
     """Claude API でコンテンツを生成。"""
     import anthropic
 
     client = anthropic.Anthropic()
     logger.info("Claude API: generating content (%d chars transcript)", len(transcript))
 
-    timestamped = _build_timestamped_transcript(segments)
-    user_content = GENERATION_PROMPT.format(
-        transcript=transcript,
-        transcript_with_timestamps=timestamped,
-    )
-    user_content += f"\n\n## 出力言語\n{_output_lang_instruction(output_language)}"
-
-    message = client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=4096,
-        system=SYSTEM_PROMPT,
-        messages=[{"role": "user", "content": user_content}],
-    )
+    transcript_block = _build_transcript_block(transcript, segments, artifacts)
+    task_prompt = _build_task_prompt(output_language, artifacts)
+
+    slot = rate_limit.reserve("claude", SYSTEM_PROMPT + transcript_block + task_prompt)
+    # キャンセル時はクライアントを閉じて、見捨てられたスレッドのリクエストも切る
+    with cancellation.on_cancel(client.close):
+        message = client.messages.create(
+            model="claude-sonnet-4-5-20250929",
+            max_tokens=_max_output_tokens(artifacts, 4096),
+            timeout=cancellation.remaining(300),
+            system=[{"type": "text", "text": SYSTEM_PROMPT, **_cache_control()}],
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": transcript_block, **_cache_control()},
+                    {"type": "text", "text": task_prompt},
+                ],
+            }],
+        )
 
     raw = message.content[0].text
     logger.info("Claude API response received (%d chars)", len(raw))
+    usage = getattr(message, "usage", None)
+    if usage is not None:
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        metrics.record_tokens("claude", usage.input_tokens, usage.output_tokens,
+                              cache_read=cache_read, cache_write=cache_write)
+        # キャッシュから読んだ分は入力トークンの制限に数えられない
+        slot.settle(usage.input_tokens + cache_write)
 
     # JSON パース（```json ... ``` で囲まれている場合に対応）
     cleaned = re.sub(r"^```(?:json)?\s*", "", raw.strip())
@@ -196,7 +474,7 @@ def _generate_claude(transcript: str, segments: list[dict] | None = None, output
         raise ValueError(f"Claude の応答をJSONとしてパースできませんでした: {e}") from e
 
 
-def _parse_json_response(raw: str, source: str = "") -> dict:
+def _parse_json_response(raw: str, source: str = "", required: tuple[str, ...] = ARTIFACTS) -> dict:
     """生テキストから JSON を抽出してパース。途切れ・コードブロックに対応。"""
     cleaned = re.sub(r"^```(?:json)?\s*", "", raw.strip())
     cleaned = re.sub(r"\s*```$", "", cleaned)
@@ -213,7 +491,7 @@ def _parse_json_response(raw: str, source: str = "") -> dict:
             if cleaned[end] == "}":
                 try:
                     obj = json.loads(cleaned[start : end + 1])
-                    if "viral_clips" in obj and "x_thread" in obj and "blog_article" in obj:
+                    if all(name in obj for name in required):
                         return obj
                 except json.JSONDecodeError:
                     continue
@@ -223,7 +501,12 @@ def _parse_json_response(raw: str, source: str = "") -> dict:
 
 # ── Google Gemini（無料枠あり） ──
 
-def _generate_gemini(transcript: str, segments: list[dict] | None = None, output_language: str = "same") -> dict:
+def _generate_gemini(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None = None,
+    output_language: str = "same",
+    artifacts: tuple[str, ...] = ARTIFACTS,
+) -> dict:
     """Google Gemini API でコンテンツを生成。無料枠あり。"""
     from google import genai
     from google.genai import types
@@ -231,117 +514,176 @@ def _generate_gemini(transcript: str, segments: list[dict] | None = None, output
     client = genai.Client(api_key=_gemini_key)
     logger.info("Gemini API: generating content (%d chars transcript)", len(transcript))
 
-    timestamped = _build_timestamped_transcript(segments)
-    user_prompt = GENERATION_PROMPT.format(
-        transcript=transcript,
-        transcript_with_timestamps=timestamped,
-    )
-    user_prompt += f"\n\n## 出力言語\n{_output_lang_instruction(output_language)}"
-    full_prompt = f"{SYSTEM_PROMPT}\n\n{user_prompt}"
-
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=full_prompt,
-        config=types.GenerateContentConfig(
-            max_output_tokens=8192,
-            response_mime_type="application/json",
-            response_schema=GEMINI_JSON_SCHEMA,
-            thinking_config=types.ThinkingConfig(thinking_budget=0),  # トークン節約・JSON途切れ防止
-        ),
-    )
+    transcript_block = _build_transcript_block(transcript, segments, artifacts)
+    task_prompt = _build_task_prompt(output_language, artifacts)
+    full_prompt = f"{SYSTEM_PROMPT}\n\n{transcript_block}\n{task_prompt}"
+
+    cached_content = _gemini_cached_content(client, types, transcript_block) if GEMINI_CONTEXT_CACHE else None
+    # 明示キャッシュから読む分は入力トークンの制限に数えないので、送る指示部分だけ予約する
+    slot = rate_limit.reserve("gemini", task_prompt if cached_content else full_prompt)
+    # close() のない古い SDK では止められないが、遅れて届いた結果はジョブに書かれない
+    close = getattr(client, "close", None)
+    with cancellation.on_cancel(close) if close is not None else nullcontext():
+        response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            # 明示キャッシュがあれば指示部分だけ送る。なければ先頭が共通なので暗黙キャッシュが効く
+            contents=task_prompt if cached_content else full_prompt,
+            config=types.GenerateContentConfig(
+                cached_content=cached_content,
+                max_output_tokens=_max_output_tokens(artifacts, 8192),
+                response_mime_type="application/json",
+                response_schema=_json_schema(artifacts),
+                thinking_config=types.ThinkingConfig(thinking_budget=0),  # トークン節約・JSON途切れ防止
+            ),
+        )
     raw = response.text or ""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        metrics.record_tokens("gemini", usage.prompt_token_count, usage.candidates_token_count,
+                              cache_read=usage.cached_content_token_count)
+        # prompt_token_count はキャッシュ分を含む。制限に数えるのはキャッシュ以外の分
+        slot.settle((usage.prompt_token_count or 0) - (usage.cached_content_token_count or 0))
+
+    return _parse_json_response(raw, "Gemini", artifacts)
+
+
+_gemini_caches: dict[str, tuple[str, float]] = {}  # 内容のハッシュ -> (キャッシュ名, 期限)
+_gemini_caches_lock = threading.Lock()
 
-    return _parse_json_response(raw, "Gemini")
+
+def _gemini_cached_content(client, types, transcript_block: str) -> str | None:
+    """
+    システムプロンプト + 文字起こしの明示キャッシュを作成（または再利用）して名前を返す。
+    短すぎる・作成に失敗した場合は None（通常の呼び出しに戻る）。
+    """
+    if rate_limit.estimate_tokens(SYSTEM_PROMPT + transcript_block) < GEMINI_CACHE_MIN_TOKENS:
+        return None
+    key = hashlib.sha256(f"{GEMINI_MODEL}\0{SYSTEM_PROMPT}\0{transcript_block}".encode()).hexdigest()
+    # parallel モードで同じ内容のキャッシュを重複して作らないよう、作成までロックする
+    with _gemini_caches_lock:
+        now = time.monotonic()
+        for k, (_, expires) in list(_gemini_caches.items()):
+            if expires <= now:
+                del _gemini_caches[k]
+        held = _gemini_caches.get(key)
+        if held is not None and held[1] > now + 30:  # 期限間際のものは使わない
+            return held[0]
+        try:
+            cache = client.caches.create(
+                model=GEMINI_MODEL,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=SYSTEM_PROMPT,
+                    contents=[transcript_block],
+                    ttl=f"{GEMINI_CACHE_TTL_SEC}s",
+                ),
+            )
+        except Exception as e:
+            logger.warning("Gemini context cache unavailable (%s): %s", type(e).__name__, e)
+            return None
+        _gemini_caches[key] = (cache.name, now + GEMINI_CACHE_TTL_SEC)
+        logger.info("Gemini context cache created: %s", cache.name)
+        return cache.name
 
 
 # ── Gemini REST API（SDK が 400 を返す場合の代替） ──
 
-def _generate_gemini_rest(transcript: str, segments: list[dict] | None = None, output_language: str = "same") -> dict:
-    """Gemini REST API を直接呼ぶ（google-genai SDK の 400 回避用）。"""
+def _generate_gemini_rest(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None = None,
+    output_language: str = "same",
+    artifacts: tuple[str, ...] = ARTIFACTS,
+) -> dict:
+    """
+    Gemini REST API を直接呼ぶ（google-genai SDK の 400 回避用）。
+    SSE のストリームで受け取り、キャンセル・期限切れなら接続を切って生成を止めさせる。
+    """
     import requests
 
-    timestamped = _build_timestamped_transcript(segments)
-    user_prompt = GENERATION_PROMPT.format(
-        transcript=transcript,
-        transcript_with_timestamps=timestamped,
-    )
-    user_prompt += f"\n\n## 出力言語\n{_output_lang_instruction(output_language)}"
+    user_prompt = _build_user_prompt(transcript, segments, output_language, artifacts)
     full_prompt = f"{SYSTEM_PROMPT}\n\n{user_prompt}"
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={_gemini_key}"
+    url = (f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:streamGenerateContent"
+           f"?alt=sse&key={_gemini_key}")
     payload = {
         "contents": [{"parts": [{"text": full_prompt}]}],
         "generationConfig": {
-            "maxOutputTokens": 8192,
+            "maxOutputTokens": _max_output_tokens(artifacts, 8192),
             "temperature": 0.7,
             "responseMimeType": "application/json",
-            "responseSchema": GEMINI_JSON_SCHEMA,
+            "responseSchema": _json_schema(artifacts),
             "thinkingConfig": {"thinkingBudget": 0},
         },
     }
 
-    resp = requests.post(url, json=payload, timeout=60)
-    if resp.status_code != 200:
-        err_msg = resp.text
-        try:
-            err_json = resp.json()
-            err_msg = err_json.get("error", {}).get("message", err_msg)
-        except Exception:
-            pass
-        raise ValueError(f"Gemini REST API error {resp.status_code}: {err_msg}")
-
-    data = resp.json()
-    raw = ""
-    for c in data.get("candidates", []) or []:
-        for p in c.get("content", {}).get("parts", []) or []:
-            raw += p.get("text", "")
-
-    return _parse_json_response(raw, "Gemini REST")
+    # SDK と同じ API キーの枠を使う
+    slot = rate_limit.reserve("gemini", full_prompt)
+    parts: list[str] = []
+    usage: dict = {}
+    with requests.post(url, json=payload, stream=True, timeout=cancellation.remaining(60)) as resp, \
+            cancellation.on_cancel(resp.close):
+        if resp.status_code != 200:
+            err_msg = resp.text
+            try:
+                err_json = resp.json()
+                err_msg = err_json.get("error", {}).get("message", err_msg)
+            except Exception:
+                pass
+            raise ValueError(f"Gemini REST API error {resp.status_code}: {err_msg}")
+
+        for line in resp.iter_lines(decode_unicode=True):
+            # 戻ると with を抜けて接続が切れ、Gemini 側も生成を止める
+            cancellation.check()
+            if not line or not line.startswith("data:"):
+                continue
+            chunk = json.loads(line[len("data:"):])
+            usage = chunk.get("usageMetadata") or usage  # 最後のチャンクが合計
+            for c in chunk.get("candidates", []) or []:
+                for p in c.get("content", {}).get("parts", []) or []:
+                    parts.append(p.get("text", ""))
+
+    metrics.record_tokens("gemini_rest", usage.get("promptTokenCount"), usage.get("candidatesTokenCount"),
+                          cache_read=usage.get("cachedContentTokenCount"))
+    slot.settle((usage.get("promptTokenCount") or 0) - (usage.get("cachedContentTokenCount") or 0))
+    raw = "".join(parts)
+
+    return _parse_json_response(raw, "Gemini REST", artifacts)
 
 
 # ── Ollama（完全無料・ローカル・APIキー不要） ──
 
-def _generate_ollama(transcript: str, segments: list[dict] | None = None, output_language: str = "same") -> dict:
+def _generate_ollama(
+    transcript: str,
+    segments: SegmentArray | list[dict] | None = None,
+    output_language: str = "same",
+    artifacts: tuple[str, ...] = ARTIFACTS,
+) -> dict:
     """Ollama でコンテンツを生成。Gemini が使えない場合の代替。"""
-    import requests
+    from services import ollama_engine
 
-    base_url = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
-    model = os.environ.get("OLLAMA_MODEL", "llama3.2")
-    timestamped = _build_timestamped_transcript(segments)
-    user_prompt = GENERATION_PROMPT.format(
-        transcript=transcript,
-        transcript_with_timestamps=timestamped,
-    )
-    user_prompt += f"\n\n## 出力言語\n{_output_lang_instruction(output_language)}"
-    full_prompt = f"{SYSTEM_PROMPT}\n\n{user_prompt}"
+    user_prompt = _build_user_prompt(transcript, segments, output_language, artifacts)
 
-    logger.info("Ollama: generating content (%s, %d chars)", model, len(transcript))
-    resp = requests.post(
-        f"{base_url}/api/generate",
-        json={"model": model, "prompt": full_prompt, "stream": False},
-        timeout=120,
+    logger.info("Ollama: generating content (%s, %d chars)", ollama_engine.OLLAMA_MODEL, len(transcript))
+    slot = rate_limit.reserve("ollama", f"{SYSTEM_PROMPT}\n\n{user_prompt}")
+    completion = ollama_engine.generate(
+        user_prompt,
+        system=SYSTEM_PROMPT,
+        schema=_json_schema(artifacts),
+        max_tokens=_max_output_tokens(artifacts, 4096),
     )
-    resp.raise_for_status()
-    raw = resp.json().get("response", "") or ""
-
-    cleaned = re.sub(r"^```(?:json)?\s*", "", raw.strip())
-    cleaned = re.sub(r"\s*```$", "", cleaned)
+    metrics.record_tokens("ollama", completion.prompt_tokens, completion.output_tokens)
+    slot.settle(completion.prompt_tokens)
 
-    try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError as e:
-        logger.error("Failed to parse Ollama response as JSON: %s", e)
-        raise ValueError(f"Ollama の応答をJSONとしてパースできませんでした: {e}") from e
+    return _parse_json_response(completion.text, "Ollama", artifacts)
 
 
 # ── ダミー実装（開発用） ──
 
-def _generate_dummy(transcript: str) -> dict:
+def _generate_dummy(transcript: str, artifacts: tuple[str, ...] = ARTIFACTS) -> dict:
     """ダミーの生成結果を返す（ANTHROPIC_API_KEY 未設定時）。"""
     logger.info("Dummy generation (%d chars, ANTHROPIC_API_KEY not set)", len(transcript))
     time.sleep(3)
 
-    return {
+    results = {
         "viral_clips": [
             {
                 "start_time": "00:35",
@@ -398,3 +740,4 @@ def _generate_dummy(transcript: str) -> dict:
             "AIを味方につけて、コンテンツの量産体制を構築しましょう。"
         ),
     }
+    return {name: results[name] for name in artifacts}
@@ -3,6 +3,9 @@
 import os
 import logging
 import shutil
+import subprocess
+
+import cancellation
 
 logger = logging.getLogger(__name__)
 
@@ -28,15 +31,88 @@ def extract_audio(input_path: str, output_dir: str) -> str:
         logger.info("Input is already audio: %s", input_path)
         return input_path
 
-    # 動画ファイルなら moviepy で音声を抽出
-    if ext in VIDEO_EXTENSIONS:
-        return _extract_with_moviepy(input_path, output_dir)
+    # 不明な拡張子でもとりあえず抽出を試す
+    if ext not in VIDEO_EXTENSIONS:
+        logger.warning("Unknown extension '%s', attempting extraction anyway", ext)
 
-    # 不明な拡張子でもとりあえず moviepy で試す
-    logger.warning("Unknown extension '%s', attempting extraction anyway", ext)
+    # ffmpeg を直接起動する（キャンセル・タイムアウト時に kill できる）。無ければ moviepy
+    ffmpeg = _ffmpeg_binary()
+    if ffmpeg:
+        return _extract_with_ffmpeg(ffmpeg, input_path, output_dir)
     return _extract_with_moviepy(input_path, output_dir)
 
 
+def _ffmpeg_binary() -> str | None:
+    """システムの ffmpeg、なければ moviepy が同梱する imageio-ffmpeg のバイナリ。"""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+def _extract_with_ffmpeg(ffmpeg: str, video_path: str, output_dir: str) -> str:
+    """ffmpeg で動画から 16kHz mono の WAV を抽出。"""
+    base = os.path.splitext(os.path.basename(video_path))[0]
+    audio_path = os.path.join(output_dir, f"{base}_audio.wav")
+
+    logger.info("Extracting audio: %s -> %s", video_path, audio_path)
+
+    cmd = [
+        ffmpeg, "-nostdin", "-y", "-loglevel", "error",
+        "-i", video_path,
+        "-vn", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",  # Whisper は 16kHz を想定
+        audio_path,
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        with cancellation.track_process(proc):
+            while True:
+                try:
+                    _, stderr = proc.communicate(timeout=cancellation.POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    cancellation.check()
+            cancellation.check()  # kill された場合
+    except BaseException:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+        raise
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg による音声抽出に失敗しました: {stderr.decode(errors='replace')[-500:]}")
+
+    logger.info("Audio extracted: %s (%.1f MB)", audio_path, os.path.getsize(audio_path) / 1e6)
+    return audio_path
+
+
+def cut_audio(input_path: str, start: float, end: float, output_path: str) -> str:
+    """音声の [start, end] 秒を 16kHz mono の WAV に切り出す（ffmpeg 必須）。"""
+    ffmpeg = _ffmpeg_binary()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg が見つかりません")
+    cmd = [
+        ffmpeg, "-nostdin", "-y", "-loglevel", "error",
+        "-ss", f"{start:.3f}", "-i", input_path, "-t", f"{end - start:.3f}",
+        "-vn", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",
+        output_path,
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    with cancellation.track_process(proc):
+        _, stderr = proc.communicate()
+    cancellation.check()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg による切り出しに失敗しました: {stderr.decode(errors='replace')[-500:]}")
+    return output_path
+
+
 def _extract_with_moviepy(video_path: str, output_dir: str) -> str:
     """moviepy を使って動画から音声を WAV で抽出。"""
     from moviepy import VideoFileClip
@@ -0,0 +1,201 @@
+"""
+faster-whisper のバッチ推論でローカル文字起こしをまとめて処理するサービス。
+
+長い1ファイルの VAD チャンクも、同時に走っている複数ジョブのチャンクも、
+1つの BatchedInferencePipeline にまとめて batch_size 単位でデコードし、
+セグメントを元のジョブ・元の時刻に戻して返す。
+
+WHISPER_BATCHED=1 で有効。WHISPER_BATCH_SIZE / WHISPER_BATCH_WAIT_MS で調整する。
+faster-whisper 1.2 以上が必要（1.1 は clip_timestamps を秒ではなくサンプル位置として扱い、
+1.0 には BatchedInferencePipeline がない）。それより古ければ逐次の文字起こしを使う。
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+
+import cancellation
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_SEC = 30  # Whisper の入力窓
+
+BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", "8"))
+# 最初のリクエストが来てから他のジョブのチャンクを待つ時間
+BATCH_WAIT_SEC = int(os.environ.get("WHISPER_BATCH_WAIT_MS", "200")) / 1000
+
+
+@dataclass
+class _Request:
+    audio: object                  # np.ndarray (float32, 16kHz)
+    chunks: list[tuple[int, int]]  # 元音声内の (start, end) サンプル位置
+    language: str | None
+    initial_prompt: str | None
+    future: Future = field(default_factory=Future)
+
+
+def split_speech_chunks(audio, max_sec: float = CHUNK_SEC) -> list[tuple[int, int]]:
+    """VAD で発話区間を検出し、max_sec 以内の連続区間にまとめる（サンプル位置）。"""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    speech = get_speech_timestamps(audio, VadOptions(max_speech_duration_s=max_sec))
+    limit = int(max_sec * SAMPLE_RATE)
+    chunks: list[tuple[int, int]] = []
+    for ts in speech:
+        if chunks and ts["end"] - chunks[-1][0] <= limit:
+            chunks[-1] = (chunks[-1][0], ts["end"])
+        else:
+            chunks.append((ts["start"], ts["end"]))
+    return chunks
+
+
+class BatchedTranscriber:
+    """複数スレッドから呼べるバッチ文字起こし。内部の1スレッドがデコードを担当する。"""
+
+    def __init__(self, model, batch_size: int = BATCH_SIZE, wait_sec: float = BATCH_WAIT_SEC,
+                 beam_size: int = 5):
+        from faster_whisper import BatchedInferencePipeline
+
+        self.pipeline = BatchedInferencePipeline(model=model)
+        self.batch_size = batch_size
+        self.wait_sec = wait_sec
+        self.beam_size = beam_size
+        self._queue: queue.Queue[_Request] = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="whisper-batcher", daemon=True)
+        self._thread.start()
+
+    def transcribe(self, file_path: str, language: str | None = None, initial_prompt: str | None = None) -> dict:
+        """1ファイルを文字起こしする。他ジョブのチャンクと同じバッチで処理されることがある。"""
+        from faster_whisper import decode_audio
+
+        audio = decode_audio(file_path, sampling_rate=SAMPLE_RATE)
+        chunks = split_speech_chunks(audio)
+        if not chunks:
+            return {"text": "", "segments": []}
+        req = _Request(audio=audio, chunks=chunks, language=language, initial_prompt=initial_prompt)
+        self._queue.put(req)
+        while True:
+            try:
+                return req.future.result(timeout=cancellation.POLL_SECONDS)
+            except FutureTimeout:
+                try:
+                    cancellation.check()
+                except cancellation.JobCancelled:
+                    req.future.cancel()  # まだデコード前ならバッチから外れる
+                    raise
+
+    # ── デコードスレッド ──
+
+    def _collect(self) -> list[_Request]:
+        """最初の1件を待ち、その後 wait_sec の間に届いたリクエストもまとめて取る。"""
+        batch = [self._queue.get()]
+        n_chunks = len(batch[0].chunks)
+        deadline = time.monotonic() + self.wait_sec
+        while n_chunks < self.batch_size * 4:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(req)
+            n_chunks += len(req.chunks)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            # 言語・プロンプトが同じものだけ同じパイプライン呼び出しに載せる。
+            # auto（言語検出）は先頭チャンクで判定されるので他ジョブと混ぜない
+            groups: dict[tuple, list[_Request]] = {}
+            for req in batch:
+                if not req.future.set_running_or_notify_cancel():
+                    continue  # キャンセル済み
+                key = (req.language, req.initial_prompt) if req.language else ("auto", id(req))
+                groups.setdefault(key, []).append(req)
+            for reqs in groups.values():
+                try:
+                    self._run_group(reqs)
+                except Exception as e:
+                    for req in reqs:
+                        if not req.future.done():
+                            req.future.set_exception(e)
+
+    def _run_group(self, reqs: list[_Request]) -> None:
+        import numpy as np
+
+        # 発話チャンクだけを連結し、各チャンクの連結後の位置と元の位置を記録する
+        pieces, clips, clip_pos, owners = [], [], [], []
+        pos = 0
+        for ri, req in enumerate(reqs):
+            for start, end in req.chunks:
+                pieces.append(req.audio[start:end])
+                clips.append({"start": pos / SAMPLE_RATE, "end": (pos + end - start) / SAMPLE_RATE})
+                clip_pos.append(pos)
+                owners.append((ri, start, end))
+                pos += end - start
+        audio = np.concatenate(pieces)
+
+        logger.info("Batched Whisper: %d jobs, %d chunks, %.1fs speech (batch_size=%d)",
+                    len(reqs), len(clips), pos / SAMPLE_RATE, self.batch_size)
+        segments_raw, _ = self.pipeline.transcribe(
+            audio,
+            language=reqs[0].language,
+            initial_prompt=reqs[0].initial_prompt,
+            batch_size=self.batch_size,
+            beam_size=self.beam_size,
+            clip_timestamps=clips,
+            without_timestamps=False,
+        )
+
+        per_job: list[list[dict]] = [[] for _ in reqs]
+        for seg in segments_raw:
+            text = seg.text.strip()
+            if not text:
+                continue
+            sample = int(seg.start * SAMPLE_RATE) + 1
+            ci = max(0, bisect.bisect_right(clip_pos, sample) - 1)
+            ri, orig_start, orig_end = owners[ci]
+            shift = (orig_start - clip_pos[ci]) / SAMPLE_RATE
+            per_job[ri].append({
+                "start": round(seg.start + shift, 3),
+                "end": round(min(seg.end + shift, orig_end / SAMPLE_RATE), 3),
+                "text": text,
+            })
+
+        for req, segments in zip(reqs, per_job):
+            req.future.set_result({"text": " ".join(s["text"] for s in segments), "segments": segments})
+
+
+_transcriber: BatchedTranscriber | None = None
+_transcriber_lock = threading.Lock()
+
+
+def is_supported() -> bool:
+    """インストールされている faster-whisper がバッチ推論（clip_timestamps を秒で渡す）に対応しているか。"""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        major, minor = (int(part) for part in version("faster-whisper").split(".")[:2])
+    except (PackageNotFoundError, ValueError):
+        return False
+    return (major, minor) >= (1, 2)
+
+
+def get_transcriber(model, beam_size: int = 5) -> BatchedTranscriber:
+    """プロセス内で共有する BatchedTranscriber を返す。"""
+    global _transcriber
+    with _transcriber_lock:
+        if _transcriber is None:
+            _transcriber = BatchedTranscriber(model, beam_size=beam_size)
+        return _transcriber
@@ -0,0 +1,190 @@
+"""
+viral_clips の切り抜きを元ファイルから書き出すサービス。
+
+1. LLM の MM:SS を文字起こしのセグメント境界にスナップする（セグメント開始位置の二分探索）
+2. ffmpeg で切り出す
+   - 通常: ストリームコピー（再エンコードなし）。開始位置は直前のキーフレームに合わせる
+   - accurate=True: 指定位置ちょうどから切るため再エンコードする
+3. 複数クリップをプロセスプールで並列に書き出し、終わった順に返す
+
+CLIP_WORKERS で並列数を変えられる（デフォルト: CPU コア数の半分）。
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator
+
+from segments import SegmentArray
+from services.audio_extractor import VIDEO_EXTENSIONS, _ffmpeg_binary
+
+logger = logging.getLogger(__name__)
+
+CLIP_WORKERS = int(os.environ.get("CLIP_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+RENDER_TIMEOUT_SEC = 600
+
+
+def parse_timestamp(value: str) -> float:
+    """"MM:SS" / "HH:MM:SS" / 秒の文字列を秒に変換する。"""
+    seconds = 0.0
+    for part in str(value).strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _nearest(values, x: float) -> int:
+    """昇順の values の中で x に最も近い要素の位置。"""
+    k = bisect.bisect_left(values, x)
+    if k == 0:
+        return 0
+    if k == len(values):
+        return len(values) - 1
+    return k if values[k] - x < x - values[k - 1] else k - 1
+
+
+def snap_to_segments(start: float, end: float, segments: SegmentArray | None) -> tuple[float, float]:
+    """開始を最も近いセグメントの開始に、終了をそれ以降で最も近いセグメントの終了に合わせる。"""
+    if not segments:
+        return start, end
+    i = _nearest(segments.starts, start)
+    j = max(i, _nearest(segments.ends, end))
+    return segments.starts[i], segments.ends[j]
+
+
+# ── ffmpeg（プロセスプール内で実行） ──
+
+def _keyframes(path: str) -> list[float]:
+    """映像のキーフレーム時刻（秒）。ffprobe が無い・映像がない場合は空。"""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return []
+    # パケットのフラグだけを読む（デコードしないので長い動画でも速い）
+    proc = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+        capture_output=True, text=True, timeout=RENDER_TIMEOUT_SEC,
+    )
+    times = []
+    for line in proc.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            times.append(float(pts))
+    return sorted(times)
+
+
+def _render(task: dict) -> dict:
+    """1クリップを書き出す。task: index, source, start, end, out_dir, accurate, keyframes"""
+    ffmpeg = _ffmpeg_binary()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg が見つかりません")
+    source, start, end = task["source"], task["start"], task["end"]
+    ext = os.path.splitext(source)[1].lower()
+    is_video = ext in VIDEO_EXTENSIONS
+
+    if task["accurate"]:
+        mode = "reencode"
+        out_ext = ".mp4" if is_video else ".m4a"
+        codec = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-c:a", "aac", "-b:a", "160k"]
+        if not is_video:
+            codec = ["-vn", "-c:a", "aac", "-b:a", "160k"]
+    else:
+        mode = "copy"
+        out_ext = ext or ".mp4"
+        codec = ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+        # コピーはキーフレームからしか始められないので、直前のキーフレームに合わせる
+        keyframes = task["keyframes"]
+        k = bisect.bisect_right(keyframes, start + 1e-3) - 1
+        if k >= 0:
+            start = keyframes[k]
+
+    out_path = os.path.join(task["out_dir"], f"{task['index']:02d}{out_ext}")
+    cmd = [
+        ffmpeg, "-nostdin", "-y", "-loglevel", "error",
+        "-ss", f"{start:.3f}", "-i", source, "-t", f"{max(0.1, end - start):.3f}",
+        *codec, out_path,
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=RENDER_TIMEOUT_SEC)
+    if proc.returncode != 0:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise RuntimeError(f"ffmpeg によるクリップ書き出しに失敗しました: {proc.stderr.decode(errors='replace')[-300:]}")
+    return {
+        "index": task["index"],
+        "start": round(start, 3),
+        "end": round(end, 3),
+        "mode": mode,
+        "path": out_path,
+        "size": os.path.getsize(out_path),
+    }
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # API・ワーカーはスレッドを持つので fork ではなく spawn で起動する
+            _pool = ProcessPoolExecutor(max_workers=CLIP_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """子プロセスが落ちたプールは使えないので、次回作り直す。"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def export_clips(
+    source: str,
+    clips: list[dict],
+    segments: SegmentArray | None,
+    out_dir: str,
+    accurate: bool = False,
+) -> Iterator[dict]:
+    """
+    viral_clips を並列で書き出し、終わった順に結果を返す。
+    失敗したクリップは {"index", "error"} を返す（他のクリップは続ける）。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    keyframes = [] if accurate else _keyframes(source)
+    tasks = []
+    for index, clip in enumerate(clips):
+        try:
+            start, end = snap_to_segments(
+                parse_timestamp(clip["start_time"]), parse_timestamp(clip["end_time"]), segments
+            )
+        except (KeyError, ValueError) as e:
+            yield {"index": index, "title": clip.get("title"), "error": f"タイムスタンプが不正です: {e}"}
+            continue
+        tasks.append({
+            "index": index, "title": clip.get("title"), "source": source, "start": start, "end": end,
+            "out_dir": out_dir, "accurate": accurate, "keyframes": keyframes,
+        })
+
+    logger.info("Exporting %d clips from %s (%s, %d workers)",
+                len(tasks), source, "reencode" if accurate else "stream copy", CLIP_WORKERS)
+    pool = _get_pool()
+    futures = {pool.submit(_render, task): task for task in tasks}
+    for future in as_completed(futures):
+        task = futures[future]
+        try:
+            yield {"title": task["title"], **future.result()}
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                _discard_pool(pool)
+            logger.warning("Clip %d failed: %s", task["index"], e)
+            yield {"index": task["index"], "title": task["title"], "error": str(e)}
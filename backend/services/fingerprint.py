@@ -0,0 +1,130 @@
+"""
+音声の指紋（スペクトルピークの組み合わせハッシュ）を計算するサービス。
+
+同じ話を書き出し直した・前後を切った・ファイルと YouTube の両方で出した、といった
+再エンコード違いの重複アップロードを見つけて、文字起こしを使い回すために使う。
+
+1. 16kHz mono の音声を STFT（1024 点、hop 512 = 32ms）
+2. フレームごとに周波数帯（300Hz〜4kHz を6帯域）の最大ビンを取り、前後 ±0.5 秒で
+   極大かつ帯域の平均より強いものをピークとして残す
+3. 各ピークを後続の FANOUT 個のピークと組にして (f1, f2, dt) を 24 ビットのハッシュにする
+
+ハッシュはビットレート・コーデックの違いに強く、アンカーの時刻を持つので
+一致したハッシュの時刻差から、どこからどこまでが同じ内容かが分かる。
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import NamedTuple, Sequence
+
+from segments import SegmentArray
+from services.waveform import SAMPLE_RATE, _pcm_chunks
+
+logger = logging.getLogger(__name__)
+
+N_FFT = 1024
+HOP = 512
+FRAMES_PER_SEC = SAMPLE_RATE / HOP
+_BAND_EDGES_HZ = (300, 500, 800, 1200, 1800, 2600, 4000)
+PEAK_WINDOW = 15  # 前後のフレーム数（約0.5秒）
+FANOUT = 5
+MAX_DT = 63  # 6ビット
+
+
+class Fingerprint(NamedTuple):
+    hashes: "np.ndarray"  # uint32
+    times: "np.ndarray"   # int32（アンカーのフレーム番号）
+    duration: float       # 秒
+
+
+def compute(audio_path: str) -> Fingerprint | None:
+    """音声ファイルの指紋。デコードできなければ None。"""
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    chunks = _pcm_chunks(audio_path)
+    if chunks is None:
+        return None
+    edges = [round(hz * N_FFT / SAMPLE_RATE) for hz in _BAND_EDGES_HZ]
+    window = np.hanning(N_FFT).astype(np.float32)
+    band_bins, band_mags = [], []
+    carry = np.empty(0, dtype=np.float32)
+    n_samples = 0
+    for chunk in chunks:
+        n_samples += len(chunk)
+        data = np.concatenate((carry, chunk.astype(np.float32) / 32768.0))
+        n_frames = 0 if len(data) < N_FFT else 1 + (len(data) - N_FFT) // HOP
+        if n_frames:
+            frames = sliding_window_view(data, N_FFT)[::HOP][:n_frames] * window
+            spectrum = np.log1p(np.abs(np.fft.rfft(frames, axis=1)).astype(np.float32))
+            # 帯域ごとの最大ビン（帯域の先頭からの位置を絶対ビンに直す）
+            bins = np.stack([spectrum[:, lo:hi].argmax(axis=1) + lo for lo, hi in zip(edges, edges[1:])], axis=1)
+            band_bins.append(bins)
+            band_mags.append(np.take_along_axis(spectrum, bins, axis=1))
+        carry = data[n_frames * HOP:]
+    if not band_bins:
+        return None
+
+    bins = np.concatenate(band_bins)
+    mags = np.concatenate(band_mags)
+    # 時間方向の極大（前後 PEAK_WINDOW フレームの最大と等しい）かつ帯域平均より強い
+    padded = np.pad(mags, ((PEAK_WINDOW, PEAK_WINDOW), (0, 0)), constant_values=-1)
+    local_max = sliding_window_view(padded, 2 * PEAK_WINDOW + 1, axis=0).max(axis=2)
+    is_peak = (mags == local_max) & (mags > mags.mean(axis=0))
+    times, bands = np.nonzero(is_peak)  # フレーム順に並ぶ
+    freqs = bins[times, bands]
+
+    hashes, anchors = [], []
+    for k in range(1, FANOUT + 1):
+        dt = times[k:] - times[:-k]
+        ok = (dt > 0) & (dt <= MAX_DT)
+        hashes.append((freqs[:-k][ok].astype(np.uint32) << 15) | (freqs[k:][ok].astype(np.uint32) << 6)
+                      | dt[ok].astype(np.uint32))
+        anchors.append(times[:-k][ok].astype(np.int32))
+    return Fingerprint(np.concatenate(hashes), np.concatenate(anchors), n_samples / SAMPLE_RATE)
+
+
+def reuse_segments(
+    source: SegmentArray,
+    offset: float,
+    start: float,
+    end: float,
+    duration: float,
+    min_gap: float = 1.0,
+    holes: Sequence[tuple[float, float]] = (),
+) -> tuple[list[dict], list[tuple[float, float]]]:
+    """
+    一致区間 [start, end]（新しい音声の秒）に入る元ジョブのセグメントを、新しい音声の時刻に直して返す。
+    offset は「元ジョブの時刻 - 新しい音声の時刻」。
+    holes（一致区間の途中で一致が途切れた区間）にかかるセグメントは流用しない。
+
+    あわせて、文字起こしが必要な範囲を返す: 流用できなかった先頭・末尾と、holes の前後の
+    流用したセグメントの間。一致区間の途中で一致が続いている部分は元ジョブと同じ内容とみなす
+    （fingerprint_index.best_match が途切れを holes として返す前提）。
+    """
+    def in_hole(a: float, b: float) -> bool:
+        return any(a < hole_end and b > hole_start for hole_start, hole_end in holes)
+
+    reused = [
+        {"start": round(max(0.0, s.start - offset), 3), "end": round(min(duration, s.end - offset), 3), "text": s.text}
+        for s in source
+        if s.start - offset >= start - 1.0 and s.end - offset <= end + 1.0
+        and not in_hole(s.start - offset, s.end - offset)
+    ]
+    if not reused:
+        return [], [(0.0, duration)]
+    gaps = [(0.0, reused[0]["start"])]
+    for hole_start, hole_end in holes:
+        gaps.append((
+            max((seg["end"] for seg in reused if seg["end"] <= hole_start), default=0.0),
+            min((seg["start"] for seg in reused if seg["start"] >= hole_end), default=duration),
+        ))
+    gaps.append((reused[-1]["end"], duration))
+    merged: list[tuple[float, float]] = []
+    for a, b in sorted(gaps):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return reused, [(a, b) for a, b in merged if b - a >= min_gap]
@@ -0,0 +1,89 @@
+"""
+アップロード時にメディアの長さ・コーデック・サイズを調べるサービス。
+
+  ファイル: ffprobe（無ければサイズだけ）
+  YouTube:  yt-dlp のメタデータ（ダウンロードはしない）
+
+結果は cost_model.estimate() に渡してジョブのコスト（CPU 秒・ピークメモリ）を見積もる。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+PROBE_TIMEOUT_SEC = 30
+
+
+def probe_file(path: str) -> dict:
+    """
+    Returns:
+        {"duration": 秒 | None, "size": バイト, "has_video": bool,
+         "audio_codec", "video_codec", "sample_rate", "channels"}（分からない項目は None）
+    """
+    info = {
+        "duration": None,
+        "size": os.path.getsize(path),
+        "has_video": None,
+        "audio_codec": None,
+        "video_codec": None,
+        "sample_rate": None,
+        "channels": None,
+    }
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return info
+    try:
+        proc = subprocess.run(
+            [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+            capture_output=True, timeout=PROBE_TIMEOUT_SEC,
+        )
+        data = json.loads(proc.stdout or b"{}")
+    except (subprocess.TimeoutExpired, ValueError) as e:
+        logger.warning("ffprobe failed for %s: %s", path, e)
+        return info
+
+    duration = (data.get("format") or {}).get("duration")
+    info["duration"] = float(duration) if duration not in (None, "N/A") else None
+    streams = data.get("streams") or []
+    # カバー画像（attached_pic）は映像として扱わない
+    video = next((s for s in streams if s.get("codec_type") == "video"
+                  and not (s.get("disposition") or {}).get("attached_pic")), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    info["has_video"] = video is not None
+    if video:
+        info["video_codec"] = video.get("codec_name")
+    if audio:
+        info["audio_codec"] = audio.get("codec_name")
+        info["sample_rate"] = int(audio["sample_rate"]) if audio.get("sample_rate") else None
+        info["channels"] = audio.get("channels")
+    return info
+
+
+def probe_youtube(url: str) -> dict | None:
+    """yt-dlp のメタデータから長さ・サイズを取る。取れなければ None（ジョブは受け付ける）。"""
+    try:
+        import yt_dlp
+
+        with yt_dlp.YoutubeDL({"quiet": True, "no_warnings": True, "skip_download": True,
+                               "format": "bestaudio/best", "socket_timeout": PROBE_TIMEOUT_SEC}) as ydl:
+            meta = ydl.extract_info(url.strip(), download=False)
+    except Exception as e:
+        logger.warning("YouTube metadata probe failed for %s: %s", url[:60], e)
+        return None
+    if not meta:
+        return None
+    return {
+        "duration": meta.get("duration"),
+        "size": meta.get("filesize") or meta.get("filesize_approx"),
+        "has_video": False,  # 音声だけをダウンロードする
+        "audio_codec": meta.get("acodec"),
+        "video_codec": None,
+        "sample_rate": meta.get("asr"),
+        "channels": meta.get("audio_channels"),
+    }
@@ -0,0 +1,217 @@
+"""
+Ollama（ローカル LLM サーバー）の呼び出し。
+
+  - keep_alive: OLLAMA_KEEP_ALIVE の間モデルをメモリに残す（-1 で常駐）。ジョブの合間に
+    アンロードされて毎回ロードし直すのを防ぐ。OLLAMA_WARMUP=1 なら起動時に先にロードしておく
+  - num_ctx: プロンプトの推定トークン数 + 出力上限から決める（既定の 2048 では長い文字起こしの
+    先頭が黙って切られる）。num_ctx が変わると Ollama はモデルをロードし直すので、
+    2 の累乗に切り上げ、それまでに使った最大値より小さくはしない
+  - format: 成果物の JSON スキーマを渡し、スキーマどおりの JSON だけを出力させる
+  - stream: 応答を逐次受け取り、キャンセル・期限切れなら接続を切って生成を止めさせる
+  - 同時実行数: Ollama サーバーの並列数（OLLAMA_NUM_PARALLEL）を超えて送らない。
+    超えた分はサーバー側でキューに入ってタイムアウトを食うだけなので、こちらで待たせる
+    （この待ちは generate ステージの制限時間に数えない）
+
+load_test.py の Ollama 互換スタブ（scripts/ollama_standin.py）に対して動作を確認できる。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import cancellation
+import metrics
+from services import rate_limit
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Ollama サーバー側の OLLAMA_NUM_PARALLEL と同じ値にする
+OLLAMA_NUM_PARALLEL = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "1")))
+OLLAMA_MIN_CTX = int(os.environ.get("OLLAMA_MIN_CTX", "4096"))
+OLLAMA_MAX_CTX = int(os.environ.get("OLLAMA_MAX_CTX", "32768"))
+OLLAMA_TIMEOUT_SEC = float(os.environ.get("OLLAMA_TIMEOUT_SEC", "300"))
+OLLAMA_WARMUP = os.environ.get("OLLAMA_WARMUP", "0") == "1"
+# 推定トークン数の誤差の分
+_CTX_MARGIN = 256
+_CONNECT_TIMEOUT = 10
+
+_slots = threading.BoundedSemaphore(OLLAMA_NUM_PARALLEL)
+_slots_lock = threading.Lock()
+_slots_waiting = 0
+_ctx_lock = threading.Lock()
+_loaded_ctx = 0  # これまでに使った最大の num_ctx（これより小さくするとロードし直しになる）
+
+metrics.LLM_INFLIGHT.labels(provider="ollama").set(0)
+metrics.LLM_SLOT_WAITING.labels(provider="ollama").set_function(lambda: _slots_waiting)
+
+
+class Completion(NamedTuple):
+    text: str
+    prompt_tokens: int | None
+    output_tokens: int | None
+    done_reason: str | None
+    num_ctx: int
+
+
+def _keep_alive() -> int | str:
+    """"-1" などの数値は秒数として、"30m" などはそのまま渡す。"""
+    value = OLLAMA_KEEP_ALIVE.strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def _num_ctx(prompt_tokens: int, max_tokens: int) -> int:
+    """プロンプト + 出力が収まる num_ctx。2 の累乗に切り上げ、使ったことのある最大値を下回らない。"""
+    global _loaded_ctx
+    needed = prompt_tokens + max_tokens + _CTX_MARGIN
+    if needed > OLLAMA_MAX_CTX:
+        logger.warning("Ollama: prompt needs ~%d tokens but OLLAMA_MAX_CTX=%d; the transcript will be truncated",
+                       needed, OLLAMA_MAX_CTX)
+    ctx = OLLAMA_MIN_CTX
+    while ctx < needed and ctx < OLLAMA_MAX_CTX:
+        ctx *= 2
+    with _ctx_lock:
+        _loaded_ctx = max(_loaded_ctx, min(ctx, OLLAMA_MAX_CTX))
+        return _loaded_ctx
+
+
+def _acquire_slot() -> None:
+    """
+    同時実行枠が空くまで待つ。キャンセルなら JobCancelled。
+    枠待ちはレート制限の待ちと同じく、ステージの制限時間に数えない（cancellation.paused）。
+    """
+    global _slots_waiting
+    if _slots.acquire(blocking=False):
+        return
+    started = time.monotonic()
+    with _slots_lock:
+        _slots_waiting += 1
+    try:
+        with cancellation.paused():
+            while not _slots.acquire(timeout=cancellation.POLL_SECONDS):
+                cancellation.check()
+    finally:
+        with _slots_lock:
+            _slots_waiting -= 1
+    waited = time.monotonic() - started
+    if waited >= 1:
+        logger.info("Ollama: waited %.1fs for a free slot (OLLAMA_NUM_PARALLEL=%d)", waited, OLLAMA_NUM_PARALLEL)
+
+
+def _raise_for_error(resp) -> None:
+    if resp.status_code < 400:
+        return
+    try:
+        err_msg = resp.json().get("error") or resp.text
+    except ValueError:
+        err_msg = resp.text
+    raise ValueError(f"Ollama API error {resp.status_code}: {str(err_msg)[:300]}")
+
+
+def generate(prompt: str, system: str = "", schema: dict | None = None, max_tokens: int = 4096) -> Completion:
+    """
+    prompt を Ollama に送り、ストリームで受け取った応答をつなげて返す。
+    schema を渡すとその JSON スキーマに沿った出力に制約する。
+    """
+    import requests
+
+    num_ctx = _num_ctx(rate_limit.estimate_tokens(system + prompt), max_tokens)
+    body = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "system": system,
+        "stream": True,
+        "keep_alive": _keep_alive(),
+        "options": {"num_ctx": num_ctx, "num_predict": max_tokens},
+    }
+    if schema is not None:
+        body["format"] = schema
+
+    _acquire_slot()
+    inflight = metrics.LLM_INFLIGHT.labels(provider="ollama")
+    inflight.inc()
+    try:
+        deadline = time.monotonic() + cancellation.remaining(OLLAMA_TIMEOUT_SEC)
+        started = time.monotonic()
+        first_token = None
+        parts: list[str] = []
+        final: dict = {}
+        with requests.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json=body,
+            stream=True,
+            timeout=(_CONNECT_TIMEOUT, max(1.0, deadline - time.monotonic())),
+        ) as resp:
+            _raise_for_error(resp)
+            for line in resp.iter_lines():
+                # 戻ると with を抜けて接続が切れ、Ollama は生成を止めて枠を空ける
+                cancellation.check()
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Ollama did not finish within {OLLAMA_TIMEOUT_SEC:.0f}s")
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise ValueError(f"Ollama API error: {chunk['error']}")
+                if chunk.get("response"):
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+                    parts.append(chunk["response"])
+                if chunk.get("done"):
+                    final = chunk
+                    break
+        if not final:
+            raise ValueError("Ollama の応答が途中で切れました")
+    finally:
+        inflight.dec()
+        _slots.release()
+
+    load_seconds = (final.get("load_duration") or 0) / 1e9
+    if load_seconds >= 1:
+        logger.info("Ollama: model %s was loaded for this request (%.1fs, num_ctx=%d)", OLLAMA_MODEL, load_seconds, num_ctx)
+    if final.get("done_reason") == "length":
+        logger.warning("Ollama: output hit num_predict=%d and was cut off", max_tokens)
+    logger.info("Ollama: done in %.1fs (first token %.1fs, num_ctx=%d)",
+                time.monotonic() - started, first_token or 0.0, num_ctx)
+    return Completion(
+        text="".join(parts),
+        prompt_tokens=final.get("prompt_eval_count"),
+        output_tokens=final.get("eval_count"),
+        done_reason=final.get("done_reason"),
+        num_ctx=num_ctx,
+    )
+
+
+def warm(timeout: float = 300) -> bool:
+    """モデルを keep_alive 付きでロードしておく（プロンプトなしの generate はロードだけ行う）。"""
+    import requests
+
+    with _ctx_lock:
+        num_ctx = max(_loaded_ctx, OLLAMA_MIN_CTX)
+    started = time.monotonic()
+    try:
+        resp = requests.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={"model": OLLAMA_MODEL, "keep_alive": _keep_alive(), "options": {"num_ctx": num_ctx}},
+            timeout=(_CONNECT_TIMEOUT, timeout),
+        )
+        _raise_for_error(resp)
+    except Exception as e:
+        logger.warning("Ollama warm-up failed (%s): %s", type(e).__name__, e)
+        return False
+    logger.info("Ollama: model %s loaded in %.1fs (keep_alive=%s, num_ctx=%d)",
+                OLLAMA_MODEL, time.monotonic() - started, OLLAMA_KEEP_ALIVE, num_ctx)
+    return True
+
+
+def warm_in_background() -> None:
+    """OLLAMA_WARMUP=1 ならバックグラウンドでモデルをロードする（起動は待たせない）。"""
+    if OLLAMA_WARMUP:
+        threading.Thread(target=warm, name="ollama-warmup", daemon=True).start()
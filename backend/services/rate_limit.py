@@ -0,0 +1,194 @@
+"""
+LLM プロバイダごとのレート制限（RPM / TPM のトークンバケット）。
+
+呼び出し前に reserve() でリクエスト1回分と推定プロンプトトークンを予約し、
+枠が空くまで待つ（失敗させてフォールバックに落とさない）。待ちは到着順。
+応答後に実際のトークン数で settle() して推定との差を精算する。
+
+  slot = rate_limit.reserve("gemini", prompt)
+  response = ...
+  slot.settle(input_tokens)
+
+設定: LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER>（0 なら無制限）
+現在の待ち時間は /metrics の mva_llm_ratelimit_wait_seconds で見られる。
+
+枠待ちの時間は generate ステージの制限時間（STAGE_TIMEOUT_GENERATE）に数えない
+（cancellation.paused）。代わりに LLM_RATELIMIT_MAX_WAIT_SEC を超えて待つと
+RateLimited を送出し、タイムアウトではなくレート制限による失敗として扱う。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import cancellation
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 1回の予約で枠待ちに使ってよい秒数の上限（0 なら無制限）
+MAX_WAIT_SEC = float(os.environ.get("LLM_RATELIMIT_MAX_WAIT_SEC", "600"))
+
+# 未設定時のデフォルト。Gemini は無料枠（gemini-2.5-flash）に合わせる
+_DEFAULT_LIMITS = {
+    "gemini": (10, 250_000),
+    "claude": (0, 0),
+    "ollama": (0, 0),
+}
+
+
+class RateLimited(RuntimeError):
+    """レート制限の枠が LLM_RATELIMIT_MAX_WAIT_SEC 以内に空かなかった。"""
+
+
+def estimate_tokens(text: str) -> int:
+    """プロンプトのトークン数の概算。ASCII は約4文字、それ以外（日本語）は約1文字で1トークン。"""
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class TokenBucket:
+    """1分あたり per_minute まで。満タンから始まり、連続的に補充される。"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)  # 1回で上限を超える要求は満タンになれば通す
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        # settle で推定より多かった分はマイナスになり、次の待ちに反映される
+        self.level = min(self.capacity, self.level - amount)
+
+
+class ProviderLimiter:
+    def __init__(self, name: str, rpm: float, tpm: float):
+        self.name = name
+        self.rpm = rpm
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self._waiting: deque[object] = deque()
+        self._typical_tokens = 0.0  # 推定待ち時間の表示用
+        metrics.RATELIMIT_WAIT.labels(provider=name).set_function(self.estimated_wait)
+        metrics.RATELIMIT_WAITING.labels(provider=name).set_function(lambda: len(self._waiting))
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(1, now)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def acquire(self, tokens: int) -> float:
+        """
+        枠が空くまで待って予約する。待った秒数を返す。待ちはステージの制限時間に数えない。
+        キャンセルで JobCancelled、MAX_WAIT_SEC を超えたら RateLimited。
+        """
+        if self.requests is None and self.tokens is None:
+            return 0.0
+        ticket = object()
+        started = time.monotonic()
+        with self._lock:
+            self._waiting.append(ticket)
+        try:
+            with cancellation.paused():
+                while True:
+                    with self._lock:
+                        now = time.monotonic()
+                        # 先頭のリクエストだけが枠を取れる（到着順）
+                        if self._waiting[0] is ticket:
+                            wait = self._wait_time(tokens, now)
+                        else:
+                            wait = cancellation.POLL_SECONDS
+                        if wait <= 0:
+                            self._waiting.popleft()
+                            if self.requests is not None:
+                                self.requests.take(1)
+                            if self.tokens is not None:
+                                self.tokens.take(tokens)
+                            self._typical_tokens = tokens if not self._typical_tokens else (
+                                0.8 * self._typical_tokens + 0.2 * tokens)
+                            break
+                    if MAX_WAIT_SEC > 0 and now - started + wait > MAX_WAIT_SEC:
+                        metrics.record_ratelimit_wait(self.name, now - started)
+                        raise RateLimited(
+                            f"{self.name} のレート制限の枠が {MAX_WAIT_SEC:.0f} 秒以内に空きませんでした"
+                            f"（LLM_RPM_{self.name.upper()} / LLM_TPM_{self.name.upper()}）"
+                        )
+                    cancellation.sleep(min(wait, cancellation.POLL_SECONDS))
+        except BaseException:
+            with self._lock:
+                self._waiting.remove(ticket)
+            raise
+        waited = time.monotonic() - started
+        metrics.record_ratelimit_wait(self.name, waited)
+        if waited >= 1:
+            logger.info("Rate limit (%s): waited %.1fs for %d tokens", self.name, waited, tokens)
+        return waited
+
+    def settle(self, reserved: int, actual: int) -> None:
+        """推定との差を精算する。"""
+        if self.tokens is not None and actual:
+            with self._lock:
+                self.tokens.take(actual - reserved)
+
+    def estimated_wait(self) -> float:
+        """今リクエストした場合の待ち時間の目安（先に待っている分を含む）。"""
+        with self._lock:
+            if self.requests is None and self.tokens is None:
+                return 0.0
+            wait = self._wait_time(self._typical_tokens, time.monotonic())
+            queued = len(self._waiting)
+        return wait + (queued * 60.0 / self.rpm if self.rpm > 0 else 0.0)
+
+
+class _Slot:
+    def __init__(self, limiter: ProviderLimiter, reserved: int):
+        self.limiter = limiter
+        self.reserved = reserved
+
+    def settle(self, actual_tokens: int | None) -> None:
+        self.limiter.settle(self.reserved, int(actual_tokens or 0))
+
+
+_limiters: dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rpm, tpm = _DEFAULT_LIMITS.get(provider, (0, 0))
+            rpm = float(os.environ.get(f"LLM_RPM_{provider.upper()}", rpm))
+            tpm = float(os.environ.get(f"LLM_TPM_{provider.upper()}", tpm))
+            limiter = _limiters[provider] = ProviderLimiter(provider, rpm, tpm)
+        return limiter
+
+
+def reserve(provider: str, prompt: str) -> _Slot:
+    """provider の枠（1リクエスト + prompt の推定トークン）が空くまで待って予約する。"""
+    limiter = get_limiter(provider)
+    reserved = estimate_tokens(prompt)
+    limiter.acquire(reserved)
+    return _Slot(limiter, reserved)
+
+
+# 既定の制限を持つプロバイダは最初から /metrics に出す
+for _provider in _DEFAULT_LIMITS:
+    get_limiter(_provider)
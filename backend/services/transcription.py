@@ -4,14 +4,32 @@ import os
 import logging
 import math
 
+import cancellation
+import metrics
+
 logger = logging.getLogger(__name__)
 
 # Whisper API のファイルサイズ上限 (25MB)
 MAX_FILE_SIZE = 25 * 1024 * 1024
 
+# Whisper API に送るチャンクの形式（16kHz mono Opus。24kbps なら 25MB で2時間強入る）
+API_SAMPLE_RATE = 16000
+API_CHUNK_FORMAT = "ogg"
+API_CHUNK_CODEC = "libopus"
+API_CHUNK_BITRATE = "24k"
+# 1チャンクの最大長（秒）。Opus なら 25MB を超えないので、長めにしてリクエスト数を減らす
+API_CHUNK_MAX_SEC = int(os.environ.get("WHISPER_API_CHUNK_SEC", "1800"))
+MIN_SILENCE_MS = 500    # これ以上の無音を発話区間の区切りとみなす
+LONG_SILENCE_MS = 2000  # これ以上の無音は送らずに詰める
+SILENCE_PAD_MS = 300    # 発話区間の前後に残す余白
+# faster-whisper（VAD）がないときの固定長チャンク（Opus なら 25MB に十分収まる）
+FIXED_CHUNK_SEC = 10 * 60
+
 # 1. OpenAI API 2. ローカル faster-whisper（無料） 3. ダミー
 USE_OPENAI_API = bool(os.environ.get("OPENAI_API_KEY"))
 USE_LOCAL_WHISPER = os.environ.get("USE_LOCAL_WHISPER", "1") == "1"
+# ローカル Whisper をバッチ推論で動かす（複数ジョブ・長尺ファイルのチャンクをまとめてデコード）
+USE_BATCHED_WHISPER = os.environ.get("WHISPER_BATCHED", "0") == "1"  # faster-whisper 1.2 以上
 
 
 def transcribe_audio(file_path: str, language: str | None = None) -> dict:
@@ -27,43 +45,57 @@ def transcribe_audio(file_path: str, language: str | None = None) -> dict:
     """
     lang = language or os.environ.get("TRANSCRIPT_LANGUAGE", "ja")
     if USE_OPENAI_API:
-        return _transcribe_whisper_api(file_path, lang)
+        with metrics.track_provider("asr", "whisper_api", "whisper_api"):
+            return _transcribe_whisper_api(file_path, lang)
     if USE_LOCAL_WHISPER and file_path and os.path.exists(file_path):
         try:
-            return _transcribe_local_whisper(file_path, lang)
+            with metrics.track_provider("asr", "local_whisper", "local_whisper"):
+                return _transcribe_local_whisper(file_path, lang)
         except Exception as e:
             logger.warning("Local Whisper failed (%s), falling back to dummy: %s", file_path, e)
-    return _transcribe_dummy(file_path)
+            with metrics.track_provider("asr", "dummy", "local_whisper>dummy"):
+                return _transcribe_dummy(file_path)
+    with metrics.track_provider("asr", "dummy", "dummy"):
+        return _transcribe_dummy(file_path)
 
 
 def _transcribe_whisper_api(file_path: str, language: str = "ja") -> dict:
-    """OpenAI Whisper API で文字起こし。25MB超のファイルはチャンク分割。"""
+    """
+    OpenAI Whisper API で文字起こし。
+
+    VAD で発話区間を検出し、無音で区切ったチャンク（長い無音は詰める）を
+    16kHz mono Opus に圧縮して送る。送信バイト数・課金対象の秒数・リクエスト数を減らす。
+    faster-whisper がなければ固定長のチャンクで送る。
+    """
     from openai import OpenAI
 
     client = OpenAI()
     file_size = os.path.getsize(file_path)
 
-    # 25MB 以下ならそのまま送信
-    if file_size <= MAX_FILE_SIZE:
-        logger.info("OpenAI Whisper API: transcription (%s, %.1f MB)",
-                     file_path, file_size / 1e6)
-        return _call_whisper_api(client, file_path)
-
-    # 25MB 超なら pydub で分割して順番に処理
-    logger.info("File too large (%.1f MB), splitting into chunks...", file_size / 1e6)
-    return _transcribe_chunked(client, file_path)
+    # キャンセル時はクライアントを閉じて、見捨てられたスレッドのアップロードも切る
+    with cancellation.on_cancel(client.close):
+        try:
+            return _transcribe_chunked(client, file_path, language)
+        except (ImportError, OSError, RuntimeError) as e:
+            # デコード/エンコードできない環境では、25MB 以下ならそのまま送信
+            if file_size > MAX_FILE_SIZE:
+                raise
+            logger.warning("Chunking unavailable (%s), sending original file (%.1f MB)", e, file_size / 1e6)
+            return cancellation.call(_call_whisper_api, client, file_path, language)
 
 
-def _call_whisper_api(client, file_path: str) -> dict:
+def _call_whisper_api(client, file_path: str, language: str = "ja") -> dict:
     """Whisper API を1回呼び出す。"""
     lang_param = {} if language == "auto" else {"language": language}
 
+    metrics.record_bytes("uploaded", "whisper_api", os.path.getsize(file_path))
     with open(file_path, "rb") as audio:
         result = client.audio.transcriptions.create(
             model="whisper-1",
             file=audio,
             response_format="verbose_json",
             timestamp_granularities=["segment"],
+            timeout=cancellation.remaining(600),
             **lang_param,
         )
 
@@ -78,60 +110,194 @@ def _call_whisper_api(client, file_path: str) -> dict:
     return {"text": result.text, "segments": segments}
 
 
-def _transcribe_chunked(client, file_path: str) -> dict:
-    """大きなファイルを10分ごとに分割して順番に文字起こし。"""
+def _plan_chunks(speech: list[dict], max_samples: int) -> list[list[tuple[int, int]]]:
+    """
+    発話区間からチャンクを組み立てる。各チャンクは元音声の (start, end) サンプル区間のリスト。
+
+    - チャンクの切れ目は必ず発話区間の間（無音）に置く
+    - LONG_SILENCE_MS 以上の無音は送らない（区間を分けて詰める）
+    - 1区間が max_samples を超える場合のみ強制的に分割する
+    """
+    long_gap = LONG_SILENCE_MS * API_SAMPLE_RATE // 1000
+    chunks: list[list[tuple[int, int]]] = []
+    pieces: list[tuple[int, int]] = []
+    kept = 0
+
+    for ts in speech:
+        start, end = ts["start"], ts["end"]
+        while end - start > max_samples:
+            if pieces:
+                chunks.append(pieces)
+                pieces, kept = [], 0
+            chunks.append([(start, start + max_samples)])
+            start += max_samples
+        joined = bool(pieces) and start - pieces[-1][1] < long_gap
+        growth = end - pieces[-1][1] if joined else end - start
+        if pieces and kept + growth > max_samples:
+            chunks.append(pieces)
+            pieces, kept, joined, growth = [], 0, False, end - start
+        if joined:
+            pieces[-1] = (pieces[-1][0], end)
+        else:
+            pieces.append((start, end))
+        kept += growth
+
+    if pieces:
+        chunks.append(pieces)
+    return chunks
+
+
+def _to_source_time(pieces: list[tuple[int, int]], t: float) -> float:
+    """チャンク内の時刻（秒）を元音声の時刻（秒）に戻す。"""
+    pos = int(t * API_SAMPLE_RATE)
+    local = 0
+    for start, end in pieces:
+        length = end - start
+        if pos <= local + length:
+            return (start + max(0, pos - local)) / API_SAMPLE_RATE
+        local += length
+    return pieces[-1][1] / API_SAMPLE_RATE
+
+
+def _transcribe_chunked(client, file_path: str, language: str = "ja") -> dict:
+    """
+    発話区間ごとのチャンクに分割・圧縮して順番に文字起こし。
+    VAD に使う faster-whisper がなければ、固定長のチャンク（_transcribe_fixed_chunks）に戻る。
+    """
+    try:
+        from faster_whisper import decode_audio
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+    except ImportError as e:
+        logger.warning("faster-whisper unavailable (%s), chunking at fixed %d-minute intervals",
+                       e, FIXED_CHUNK_SEC // 60)
+        return _transcribe_fixed_chunks(client, file_path, language)
+    import numpy as np
     from pydub import AudioSegment
 
-    audio = AudioSegment.from_file(file_path)
-    chunk_ms = 10 * 60 * 1000  # 10分
-    num_chunks = math.ceil(len(audio) / chunk_ms)
+    audio = decode_audio(file_path, sampling_rate=API_SAMPLE_RATE)
+    speech = get_speech_timestamps(
+        audio,
+        VadOptions(min_silence_duration_ms=MIN_SILENCE_MS, speech_pad_ms=SILENCE_PAD_MS),
+    )
+    if not speech:
+        logger.info("No speech detected in %s", file_path)
+        return {"text": "", "segments": []}
+
+    chunks = _plan_chunks(speech, API_CHUNK_MAX_SEC * API_SAMPLE_RATE)
+    speech_sec = sum(e - s for pieces in chunks for s, e in pieces) / API_SAMPLE_RATE
+    logger.info("Whisper API: %d chunk(s), %.0fs speech of %.0fs audio",
+                len(chunks), speech_sec, len(audio) / API_SAMPLE_RATE)
 
     all_text = []
     all_segments = []
-    offset_sec = 0.0
+    for i, pieces in enumerate(chunks):
+        cancellation.check()
+        samples = np.concatenate([audio[s:e] for s, e in pieces])
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        chunk_path = f"{file_path}_chunk{i}.{API_CHUNK_FORMAT}"
+        _export_chunk(AudioSegment(data=pcm, sample_width=2, frame_rate=API_SAMPLE_RATE, channels=1), chunk_path)
+
+        logger.info("Transcribing chunk %d/%d (%.0fs - %.0fs, %.1f MB)",
+                    i + 1, len(chunks), pieces[0][0] / API_SAMPLE_RATE, pieces[-1][1] / API_SAMPLE_RATE,
+                    os.path.getsize(chunk_path) / 1e6)
+
+        try:
+            result = cancellation.call(_call_whisper_api, client, chunk_path, language)
+            all_text.append(result["text"])
+
+            for seg in result["segments"]:
+                all_segments.append({
+                    "start": round(_to_source_time(pieces, seg["start"]), 3),
+                    "end": round(_to_source_time(pieces, seg["end"]), 3),
+                    "text": seg["text"],
+                })
+        finally:
+            os.remove(chunk_path)
+
+    return {"text": "".join(all_text), "segments": all_segments}
+
 
+def _export_chunk(segment, chunk_path: str) -> None:
+    """
+    チャンクを Opus で書き出す。ffmpeg に libopus がない等で書き出せなければ RuntimeError
+    （_transcribe_whisper_api が元のファイルをそのまま送る方に切り替える）。
+    """
+    from pydub.exceptions import CouldntEncodeError
+
+    try:
+        segment.export(chunk_path, format=API_CHUNK_FORMAT, codec=API_CHUNK_CODEC, bitrate=API_CHUNK_BITRATE)
+    except CouldntEncodeError as e:
+        if os.path.exists(chunk_path):
+            os.remove(chunk_path)
+        raise RuntimeError(f"could not encode {API_CHUNK_CODEC} chunk: {e}") from e
+
+
+def _transcribe_fixed_chunks(client, file_path: str, language: str = "ja") -> dict:
+    """
+    faster-whisper がない環境用。pydub で FIXED_CHUNK_SEC ごとに分割し、
+    16kHz mono Opus に圧縮して順番に文字起こし（無音の検出・詰めはしない）。
+    """
+    from pydub import AudioSegment
+    from pydub.exceptions import CouldntDecodeError
+
+    try:
+        audio = AudioSegment.from_file(file_path).set_frame_rate(API_SAMPLE_RATE).set_channels(1)
+    except CouldntDecodeError as e:
+        raise RuntimeError(f"pydub could not decode {file_path}: {e}") from e
+    chunk_ms = FIXED_CHUNK_SEC * 1000
+    num_chunks = math.ceil(len(audio) / chunk_ms)
+
+    all_text = []
+    all_segments = []
     for i in range(num_chunks):
+        cancellation.check()
         start_ms = i * chunk_ms
         end_ms = min((i + 1) * chunk_ms, len(audio))
-        chunk = audio[start_ms:end_ms]
-
-        # 一時ファイルに書き出し
-        chunk_path = f"{file_path}_chunk{i}.wav"
-        chunk.export(chunk_path, format="wav")
+        chunk_path = f"{file_path}_chunk{i}.{API_CHUNK_FORMAT}"
+        _export_chunk(audio[start_ms:end_ms], chunk_path)
 
-        logger.info("Transcribing chunk %d/%d (%.0fs - %.0fs)",
-                     i + 1, num_chunks, start_ms / 1000, end_ms / 1000)
+        logger.info("Transcribing chunk %d/%d (%.0fs - %.0fs)", i + 1, num_chunks, start_ms / 1000, end_ms / 1000)
 
         try:
-            result = _call_whisper_api(client, chunk_path)
+            result = cancellation.call(_call_whisper_api, client, chunk_path, language)
             all_text.append(result["text"])
 
             for seg in result["segments"]:
                 all_segments.append({
-                    "start": seg["start"] + offset_sec,
-                    "end": seg["end"] + offset_sec,
+                    "start": round(seg["start"] + start_ms / 1000, 3),
+                    "end": round(seg["end"] + start_ms / 1000, 3),
                     "text": seg["text"],
                 })
         finally:
             os.remove(chunk_path)
 
-        offset_sec += (end_ms - start_ms) / 1000
-
     return {"text": "".join(all_text), "segments": all_segments}
 
 
 # ── ローカル Whisper（無料・要 faster-whisper） ──
 
-def _transcribe_local_whisper(file_path: str, language: str = "ja") -> dict:
-    """faster-whisper でローカル文字起こし。pip install faster-whisper"""
-    from faster_whisper import WhisperModel
-
+def _local_whisper_config() -> tuple[str, str]:
     # Railway 無料枠はメモリ制限あり。base が安定しやすい（small は OOM しやすい）
     model_size = os.environ.get("WHISPER_MODEL_SIZE", "base")
     device = "cuda" if os.environ.get("WHISPER_DEVICE") == "cuda" else "cpu"
-    logger.info("Local Whisper: transcribing %s (model=%s, device=%s)", file_path, model_size, device)
+    return model_size, device
+
+
+def local_whisper_model():
+    """設定どおりの faster-whisper モデル（プロセスで共有）と実行設定。warmup からも使う。"""
+    from services.whisper_tuning import get_model, load_tuning
+
+    tuning = load_tuning()
+    return get_model(*_local_whisper_config(), tuning), tuning
+
+
+def _transcribe_local_whisper(file_path: str, language: str = "ja") -> dict:
+    """faster-whisper でローカル文字起こし。pip install faster-whisper"""
+    model_size, device = _local_whisper_config()
+    model, tuning = local_whisper_model()
+    logger.info("Local Whisper: transcribing %s (model=%s, device=%s, compute=%s, beam=%d)",
+                file_path, model_size, device, tuning.compute_type, tuning.beam_size)
 
-    model = WhisperModel(model_size, device=device)
     # 言語: auto なら自動検出、ja/en なら指定
     model_lang = None if language == "auto" else language
 
@@ -140,17 +306,25 @@ def _transcribe_local_whisper(file_path: str, language: str = "ja") -> dict:
         "WHISPER_INITIAL_PROMPT",
         "AI, content, creator, SNS, video, blog, tweet, YouTube",
     )
+    from services import batched_transcription
+
+    if USE_BATCHED_WHISPER and batched_transcription.is_supported():
+        return batched_transcription.get_transcriber(model, beam_size=tuning.beam_size).transcribe(
+            file_path, language=model_lang, initial_prompt=initial_prompt,
+        )
+
     segments_raw, info = model.transcribe(
         file_path,
         language=model_lang,
-        beam_size=5,
+        beam_size=tuning.beam_size,
         vad_filter=True,  # 無音区間をスキップして精度向上
         initial_prompt=initial_prompt,
     )
 
     segments = []
     all_text = []
-    for seg in segments_raw:
+    for seg in segments_raw:  # デコードはイテレート時に進むので、セグメントごとに中断を確認
+        cancellation.check()
         text = seg.text.strip()
         if text:
             segments.append({"start": seg.start, "end": seg.end, "text": text})
@@ -0,0 +1,178 @@
+"""
+波形プレビュー用のピーク（min / max）を計算するサービス。
+
+抽出した 16kHz mono の音声を、複数のズームレベルで区間ごとの min / max に縮約し、
+1ジョブ1ファイルのバイナリ（数 KB〜数百 KB）に保存する。UI は元メディア（数百 MB）を
+読まずに、このファイルの必要なレベルだけを Range リクエストで取って波形を描ける。
+
+ファイル形式（リトルエンディアン）:
+  ヘッダ   "PKS1", サンプルレート (u32), 総サンプル数 (u32), レベル数 (u32)
+  レベル表 レベルごとに 1区間のサンプル数 (u32), 区間数 (u32), データ位置 (u32)
+  データ   レベルごとに [min0, max0, min1, max1, ...]（int8、int16 の上位8ビット）
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import subprocess
+import wave
+from typing import Iterator
+
+import cancellation
+from services.audio_extractor import _ffmpeg_binary
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# 1区間のサンプル数。16kHz で 16ms / 64ms / 256ms / 1s 相当（1時間で約 450KB / 112KB / 28KB / 7KB）
+LEVELS = (256, 1024, 4096, 16384)
+CHUNK_SAMPLES = LEVELS[0] * 4096  # 一度に読むサンプル数（約 2MB）
+
+_MAGIC = b"PKS1"
+_HEADER = struct.Struct("<4sIII")
+_LEVEL = struct.Struct("<III")
+
+
+def compute_peaks(audio_path: str) -> bytes | None:
+    """音声ファイルのピークを計算してバイナリで返す。デコードできなければ None。"""
+    import numpy as np
+
+    mins, maxs = [], []
+    carry = np.empty(0, dtype=np.int16)
+    n_samples = 0
+    chunks = _pcm_chunks(audio_path)
+    if chunks is None:
+        return None
+    for chunk in chunks:
+        n_samples += len(chunk)
+        data = np.concatenate((carry, chunk)) if len(carry) else chunk
+        usable = len(data) - len(data) % LEVELS[0]
+        if usable:
+            # 区間ごとに reshape して一括で min / max
+            blocks = data[:usable].reshape(-1, LEVELS[0])
+            mins.append(blocks.min(axis=1))
+            maxs.append(blocks.max(axis=1))
+        carry = data[usable:]
+        cancellation.check()
+    if len(carry):
+        mins.append(carry.min(keepdims=True))
+        maxs.append(carry.max(keepdims=True))
+    if not mins:
+        return None
+
+    base_min = np.concatenate(mins) >> 8
+    base_max = np.concatenate(maxs) >> 8
+    levels = []
+    for samples_per_peak in LEVELS:
+        factor = samples_per_peak // LEVELS[0]
+        lo, hi = _downsample(base_min, factor, np.minimum), _downsample(base_max, factor, np.maximum)
+        interleaved = np.empty(len(lo) * 2, dtype="<i1")
+        interleaved[0::2] = lo
+        interleaved[1::2] = hi
+        levels.append((samples_per_peak, len(lo), interleaved.tobytes()))
+    return _pack(n_samples, levels)
+
+
+def _downsample(values, factor: int, reduce):
+    """factor 個ずつまとめて reduce（端数は末尾の値で埋める）。"""
+    import numpy as np
+
+    if factor == 1:
+        return values
+    pad = -len(values) % factor
+    if pad:
+        values = np.concatenate((values, np.full(pad, values[-1], dtype=values.dtype)))
+    return reduce.reduce(values.reshape(-1, factor), axis=1)
+
+
+def _pack(n_samples: int, levels: list[tuple[int, int, bytes]]) -> bytes:
+    offset = _HEADER.size + _LEVEL.size * len(levels)
+    table = []
+    for samples_per_peak, count, data in levels:
+        table.append(_LEVEL.pack(samples_per_peak, count, offset))
+        offset += len(data)
+    return b"".join((
+        _HEADER.pack(_MAGIC, SAMPLE_RATE, n_samples, len(levels)),
+        *table,
+        *(data for _, _, data in levels),
+    ))
+
+
+def read_header(data: bytes) -> dict:
+    """バイナリ先頭のヘッダとレベル表を読む（確認用）。"""
+    magic, sample_rate, n_samples, n_levels = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("Not a peaks file")
+    levels = [
+        dict(zip(("samples_per_peak", "count", "offset"), _LEVEL.unpack_from(data, _HEADER.size + i * _LEVEL.size)))
+        for i in range(n_levels)
+    ]
+    return {"sample_rate": sample_rate, "samples": n_samples, "levels": levels}
+
+
+def _pcm_chunks(audio_path: str) -> Iterator | None:
+    """16kHz mono int16 の PCM を numpy 配列で少しずつ返す。"""
+    import numpy as np
+
+    try:
+        wav = wave.open(audio_path, "rb")
+    except (wave.Error, EOFError):
+        wav = None
+    if wav is not None:
+        if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (SAMPLE_RATE, 1, 2):
+            # extract_audio が書いた WAV はそのまま読む
+            def read_wav():
+                with wav:
+                    while True:
+                        frames = wav.readframes(CHUNK_SAMPLES)
+                        if not frames:
+                            return
+                        yield np.frombuffer(frames, dtype="<i2")
+            return read_wav()
+        wav.close()
+
+    # 音声ファイル（mp3 など）は ffmpeg で 16kHz mono にデコードしながら読む
+    ffmpeg = _ffmpeg_binary()
+    if not ffmpeg:
+        logger.warning("ffmpeg not found, skipping waveform for %s", audio_path)
+        return None
+
+    def read_ffmpeg():
+        cmd = [
+            ffmpeg, "-nostdin", "-loglevel", "error", "-i", audio_path,
+            "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-",
+        ]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            with cancellation.track_process(proc):
+                while True:
+                    raw = proc.stdout.read(CHUNK_SAMPLES * 2)
+                    if not raw:
+                        break
+                    yield np.frombuffer(raw[: len(raw) - len(raw) % 2], dtype="<i2")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+    return read_ffmpeg()
+
+
+def peaks_path(output_dir: str, job_id: str) -> str:
+    return os.path.join(output_dir, "waveforms", f"{job_id}.peaks")
+
+
+def write_peaks(audio_path: str, output_dir: str, job_id: str) -> str | None:
+    """ピークを計算して output_dir/waveforms/{job_id}.peaks に保存する。"""
+    data = compute_peaks(audio_path)
+    if data is None:
+        return None
+    path = peaks_path(output_dir, job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    logger.info("Waveform peaks written: %s (%.1f KB)", path, len(data) / 1e3)
+    return path
@@ -0,0 +1,100 @@
+"""
+faster-whisper の実行設定（compute_type / スレッド数 / ワーカー数 / beam size）。
+
+優先順位: 環境変数 > キャリブレーション結果ファイル > デフォルト
+キャリブレーションは scripts/calibrate_whisper.py で実行する。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, replace
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_TYPES = ("int8", "int8_float32", "float32")
+
+# キャリブレーション結果の保存先
+TUNING_FILE = os.environ.get(
+    "WHISPER_TUNING_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "whisper_tuning.json"),
+)
+
+
+@dataclass(frozen=True)
+class WhisperTuning:
+    compute_type: str = "default"  # default は CTranslate2 に任せる
+    cpu_threads: int = 0           # 0 は CTranslate2 のデフォルト
+    num_workers: int = 1           # 同一モデルを並行で使えるスレッド数
+    beam_size: int = 5
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _from_env(base: WhisperTuning) -> WhisperTuning:
+    overrides: dict = {}
+    if os.environ.get("WHISPER_COMPUTE_TYPE"):
+        overrides["compute_type"] = os.environ["WHISPER_COMPUTE_TYPE"]
+    for key, env in (("cpu_threads", "WHISPER_CPU_THREADS"), ("num_workers", "WHISPER_NUM_WORKERS"),
+                     ("beam_size", "WHISPER_BEAM_SIZE")):
+        if os.environ.get(env):
+            overrides[key] = int(os.environ[env])
+    return replace(base, **overrides)
+
+
+def load_tuning(path: str | None = None) -> WhisperTuning:
+    """現在のホスト向けの設定を返す。"""
+    path = path or TUNING_FILE
+    tuning = WhisperTuning()
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            fields = WhisperTuning.__dataclass_fields__
+            tuning = WhisperTuning(**{k: v for k, v in data.get("config", data).items() if k in fields})
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Ignoring invalid whisper tuning file %s: %s", path, e)
+    return _from_env(tuning)
+
+
+def save_tuning(tuning: WhisperTuning, report: dict | None = None, path: str | None = None) -> str:
+    """キャリブレーション結果を保存する。"""
+    path = path or TUNING_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"config": tuning.to_dict(), "report": report or {}}, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# ── モデルキャッシュ（ジョブごとにロードし直さない） ──
+
+_models: dict[tuple, object] = {}
+_models_lock = threading.Lock()
+
+
+def get_model(model_size: str, device: str, tuning: WhisperTuning):
+    """設定ごとに WhisperModel を1つだけロードして使い回す。"""
+    from faster_whisper import WhisperModel
+
+    key = (model_size, device, tuning.compute_type, tuning.cpu_threads, tuning.num_workers)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            logger.info("Loading Whisper model (size=%s, device=%s, %s)", model_size, device, tuning)
+            options = dict(
+                device=device,
+                compute_type=tuning.compute_type,
+                cpu_threads=tuning.cpu_threads,
+                num_workers=tuning.num_workers,
+            )
+            # 焼き込み済み・ダウンロード済みならハブに問い合わせずにロードする
+            try:
+                model = WhisperModel(model_size, local_files_only=True, **options)
+            except Exception as e:
+                logger.info("Whisper model %s is not cached locally (%s), downloading", model_size, type(e).__name__)
+                model = WhisperModel(model_size, **options)
+            _models[key] = model
+        return model
@@ -4,6 +4,8 @@ import os
 import logging
 import re
 
+import cancellation
+
 logger = logging.getLogger(__name__)
 
 # YouTube URL のパターン（短縮 URL含む）
@@ -41,11 +43,22 @@ def download_youtube_audio(url: str, output_dir: str, job_id: str) -> str:
     os.makedirs(output_dir, exist_ok=True)
     out_tmpl = os.path.join(output_dir, f"{job_id}_youtube.%(ext)s")
 
+    # キャンセル・タイムアウト時はフックから JobCancelled を送出してダウンロードを止める
+    def _check_cancelled(_status):
+        cancellation.check()
+
+    common_opts = {
+        "progress_hooks": [_check_cancelled],
+        "postprocessor_hooks": [_check_cancelled],
+        "socket_timeout": 30,
+    }
+
     ydl_opts = {
         "format": "bestaudio/best",
         "outtmpl": {"default": out_tmpl},
         "quiet": True,
         "no_warnings": True,
+        **common_opts,
         "postprocessors": [
             {
                 "key": "FFmpegExtractAudio",
@@ -75,6 +88,7 @@ def download_youtube_audio(url: str, output_dir: str, job_id: str) -> str:
 
             raise ValueError("ダウンロードしたファイルが見つかりません")
     except yt_dlp.utils.DownloadError as e:
+        cancellation.check()  # フックからの中断が DownloadError に包まれた場合
         # FFmpeg が無い場合は音声形式でそのまま取得
         if "FFmpeg" in str(e) or "ffmpeg" in str(e).lower():
             logger.info("FFmpeg not found, downloading raw audio...")
@@ -83,6 +97,7 @@ def download_youtube_audio(url: str, output_dir: str, job_id: str) -> str:
                 "outtmpl": {"default": out_tmpl},
                 "quiet": True,
                 "no_warnings": True,
+                **common_opts,
             }
             with yt_dlp.YoutubeDL(opts) as ydl:
                 ydl.download([url])
@@ -1,17 +1,75 @@
 """
-インメモリのジョブストア。
+ジョブストア。
+JOB_DB_PATH 未設定ならインメモリ（単一プロセス）。
+設定時は SQLite に保存し、API プロセスとワーカープロセス（python -m worker）で共有する。
 本番では Supabase に差し替える。
 """
 
 from __future__ import annotations
 
+import base64
+import contextvars
+import json
+import logging
+import os
+import sqlite3
 import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Iterator
 
+from segments import SegmentArray
+
+# SQLite ファイルのパス。キュー（job_queue.py）も同じファイルを使う
+DB_PATH = os.environ.get("JOB_DB_PATH") or None
+
+logger = logging.getLogger(__name__)
 
 _lock = threading.Lock()
 _jobs: dict[str, dict[str, Any]] = {}
+# ワーカーが処理中のジョブとそのリースのトークン（leased() の中だけ）
+_lease: contextvars.ContextVar[tuple[str, str] | None] = contextvars.ContextVar("store_lease", default=None)
+
+
+def connect() -> sqlite3.Connection:
+    """共有 SQLite への接続を開く（呼び出しごとに新しい接続）。"""
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _encode(value: Any) -> Any:
+    # SegmentArray はバイナリを base64 で埋め込む（セグメントごとの dict にしない）
+    if isinstance(value, SegmentArray):
+        return {"__segments__": base64.b64encode(value.to_bytes()).decode("ascii")}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj: dict) -> Any:
+    if "__segments__" in obj:
+        return SegmentArray.from_bytes(base64.b64decode(obj["__segments__"]))
+    return obj
+
+
+def _dumps(job: dict[str, Any]) -> str:
+    return json.dumps(job, ensure_ascii=False, default=_encode)
+
+
+def _loads(data: str) -> dict[str, Any]:
+    return json.loads(data, object_hook=_decode)
+
+
+def _init_db() -> None:
+    conn = connect()
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    finally:
+        conn.close()
+
+
+if DB_PATH:
+    _init_db()
 
 
 def create_job(
@@ -22,6 +80,8 @@ def create_job(
     file_path: str | None = None,
     transcript_language: str = "ja",
     output_language: str = "same",
+    output_languages: list[str] | None = None,
+    estimate: dict | None = None,
 ) -> dict[str, Any]:
     job = {
         "id": job_id,
@@ -30,33 +90,112 @@ def create_job(
         "file_path": file_path,
         "transcript_language": transcript_language,
         "output_language": output_language,
+        "output_languages": output_languages or [output_language],  # 複数なら results に言語ごとの文章が入る
         "status": "uploaded",
         "transcript": None,
+        "segments": None,  # SegmentArray（選択再生成・GET /jobs/{id}/segments で使う）
         "results": None,
         "error": None,
+        "timings": {},  # ステージ名 -> 秒
+        "usage": {},    # LLM トークン数
+        "estimate": estimate,  # cost_model.estimate()（メディアの長さ・ステージごとのコスト）
+        "version": 1,   # 更新ごとに増える（GET /jobs/{id} の ETag）
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat(),
     }
+    if DB_PATH:
+        conn = connect()
+        try:
+            conn.execute("INSERT INTO jobs (id, data) VALUES (?, ?)", (job_id, _dumps(job)))
+        finally:
+            conn.close()
+        return job
     with _lock:
         _jobs[job_id] = job
     return job
 
 
 def get_job(job_id: str) -> dict[str, Any] | None:
+    if DB_PATH:
+        conn = connect()
+        try:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return _loads(row[0]) if row else None
     with _lock:
         return _jobs.get(job_id)
 
 
+@contextmanager
+def leased(job_id: str, token: str) -> Iterator[None]:
+    """
+    ジョブにリースのトークンを記録し、この中（このコンテキストから起動したスレッドを含む）の
+    update_job(job_id, ...) をそのトークンでフェンスする。リースが切れて別ワーカーが取り直すと
+    ジョブのトークンが書き換わるので、古いワーカーの途中経過・エラー・タイミングなどの書き込みは捨てられる。
+    """
+    update_job(job_id, lease_token=token)
+    reset = _lease.set((job_id, token))
+    try:
+        yield
+    finally:
+        _lease.reset(reset)
+
+
+def _fenced_out(job_id: str, job: dict[str, Any], fields: dict[str, Any]) -> bool:
+    """leased() の中の書き込みで、ジョブのリースが別のワーカーに移っていれば True。"""
+    held = _lease.get()
+    if held is None or held[0] != job_id or "lease_token" in fields:
+        return False
+    if job.get("lease_token") == held[1]:
+        return False
+    logger.warning("[%s] Lease lost, dropping update of %s", job_id, ", ".join(sorted(fields)))
+    return True
+
+
 def update_job(job_id: str, **fields: Any) -> dict[str, Any] | None:
+    """
+    フィールドを更新して更新後のジョブを返す。ジョブがない、または leased() の中で
+    リースを失っていて書き込まなかった場合は None。
+    """
+    if DB_PATH:
+        conn = connect()
+        try:
+            # 読み取りから書き込みまでを1トランザクションにして他プロセスの更新を潰さない
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            job = _loads(row[0])
+            if _fenced_out(job_id, job, fields):
+                conn.execute("ROLLBACK")
+                return None
+            job.update(fields)
+            job["version"] = job.get("version", 0) + 1
+            job["updated_at"] = datetime.now(timezone.utc).isoformat()
+            conn.execute("UPDATE jobs SET data = ? WHERE id = ?", (_dumps(job), job_id))
+            conn.execute("COMMIT")
+            return job
+        finally:
+            conn.close()
     with _lock:
         job = _jobs.get(job_id)
-        if job is None:
+        if job is None or _fenced_out(job_id, job, fields):
             return None
         job.update(fields)
+        job["version"] = job.get("version", 0) + 1
         job["updated_at"] = datetime.now(timezone.utc).isoformat()
         return job
 
 
 def list_jobs() -> list[dict[str, Any]]:
+    if DB_PATH:
+        conn = connect()
+        try:
+            rows = conn.execute("SELECT data FROM jobs").fetchall()
+        finally:
+            conn.close()
+        return [_loads(r[0]) for r in rows]
     with _lock:
         return list(_jobs.values())
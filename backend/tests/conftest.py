@@ -0,0 +1,17 @@
+"""
+バックエンドのテスト共通設定。
+
+  cd backend && python -m pytest -q
+
+モジュールは backend/ 直下からの import（import store 等）なので、backend を sys.path に入れる。
+ストア・キュー・索引は環境変数が未設定ならインメモリで動くので、共有 DB の設定は外してから import する。
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+for _name in ("JOB_DB_PATH", "SEARCH_DB_PATH", "FINGERPRINT_DB_PATH"):
+    os.environ.pop(_name, None)
@@ -0,0 +1,73 @@
+"""重複アップロードの指紋照合と、文字起こしの流用範囲。"""
+
+import numpy as np
+
+import fingerprint_index
+from segments import SegmentArray
+from services.fingerprint import FRAMES_PER_SEC, Fingerprint, reuse_segments
+
+
+def _segments(n: int, length: float = 5.0) -> SegmentArray:
+    return SegmentArray.from_dicts(
+        [{"start": i * length, "end": (i + 1) * length, "text": f"seg{i}"} for i in range(n)]
+    )
+
+
+def _random_fingerprint(rng, seconds: float, per_second: int = 20) -> Fingerprint:
+    n = int(seconds * per_second)
+    times = np.sort(rng.integers(0, int(seconds * FRAMES_PER_SEC), n)).astype(np.int32)
+    hashes = rng.integers(0, 1 << 24, n).astype(np.uint32)
+    return Fingerprint(hashes, times, seconds)
+
+
+def test_reuse_segments_transcribes_only_the_ends_without_holes():
+    reused, gaps = reuse_segments(_segments(20), offset=10.0, start=0.0, end=90.0, duration=100.0)
+
+    assert reused[0] == {"start": 0.0, "end": 5.0, "text": "seg2"}
+    assert [seg["text"] for seg in reused] == [f"seg{i}" for i in range(2, 20)]
+    assert gaps == [(90.0, 100.0)]
+
+
+def test_reuse_segments_transcribes_holes_instead_of_reusing_them():
+    reused, gaps = reuse_segments(_segments(20), offset=0.0, start=0.0, end=100.0, duration=100.0,
+                                  holes=[(42.0, 58.0)])
+
+    texts = [seg["text"] for seg in reused]
+    assert "seg7" in texts and "seg8" not in texts and "seg11" not in texts and "seg12" in texts
+    assert not any(seg["start"] < 58.0 and seg["end"] > 42.0 for seg in reused)
+    assert gaps == [(40.0, 60.0)]
+
+
+def test_best_match_reports_a_replaced_middle_section_as_a_hole():
+    rng = np.random.default_rng(0)
+    original = _random_fingerprint(rng, 120.0)
+    fingerprint_index.add("original", original)
+    try:
+        # 先頭 10 秒を切って再エンコードし、50〜70 秒（新しい音声の時刻）を別の内容に差し替えた
+        shift = int(10 * FRAMES_PER_SEC)
+        keep = original.times >= shift
+        hashes, times = original.hashes[keep].copy(), original.times[keep] - shift
+        replaced = (times >= 50 * FRAMES_PER_SEC) & (times < 70 * FRAMES_PER_SEC)
+        hashes[replaced] = rng.integers(0, 1 << 24, int(replaced.sum())).astype(np.uint32)
+
+        match = fingerprint_index.best_match(Fingerprint(hashes, times, 110.0), exclude="new")
+    finally:
+        fingerprint_index.remove("original")
+
+    assert match is not None and match.job_id == "original"
+    assert abs(match.offset - 10.0) < 0.1
+    assert len(match.holes) == 1
+    hole_start, hole_end = match.holes[0]
+    assert 49.0 <= hole_start <= 50.5 and 69.5 <= hole_end <= 71.0
+
+
+def test_best_match_has_no_holes_for_a_plain_reencode():
+    rng = np.random.default_rng(1)
+    original = _random_fingerprint(rng, 90.0)
+    fingerprint_index.add("plain", original)
+    try:
+        match = fingerprint_index.best_match(original._replace(), exclude="new")
+    finally:
+        fingerprint_index.remove("plain")
+
+    assert match is not None and match.offset == 0.0 and match.holes == ()
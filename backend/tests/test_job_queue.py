@@ -0,0 +1,105 @@
+"""ジョブキューのリース（失効・取り直し・フェンシング）。"""
+
+import pytest
+
+import job_queue
+import store
+
+
+@pytest.fixture(params=["inprocess", "sqlite"])
+def queue(request, monkeypatch, tmp_path):
+    if request.param == "sqlite":
+        monkeypatch.setattr(store, "DB_PATH", str(tmp_path / "jobs.db"))
+        store._init_db()
+        return job_queue.SQLiteQueue()
+    return job_queue.InProcessQueue()
+
+
+def test_claim_and_complete(queue):
+    queue.enqueue("job-1")
+    lease = queue.claim("w1", timeout=0)
+
+    assert lease.job_id == "job-1" and lease.attempt == 1
+    assert queue.claim("w2", timeout=0) is None
+    assert queue.heartbeat(lease)
+    assert queue.complete(lease)
+    assert queue.claim("w2", timeout=0) is None
+
+
+def test_expired_lease_is_reclaimed_and_stale_token_rejected(queue, monkeypatch):
+    queue.enqueue("job-1")
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", -1.0)  # 取った瞬間に失効する
+    stale = queue.claim("w1", timeout=0)
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", 60.0)
+
+    fresh = queue.claim("w2", timeout=0)
+
+    assert fresh is not None and fresh.job_id == "job-1"
+    assert fresh.attempt == 2 and fresh.token != stale.token
+    # 古いワーカーは延長も完了もできない
+    assert not queue.heartbeat(stale)
+    assert not queue.complete(stale)
+    assert queue.heartbeat(fresh)
+    assert queue.complete(fresh)
+
+
+def test_lease_gives_up_after_max_attempts(queue, monkeypatch):
+    store.create_job("job-1", source_type="upload")
+    queue.enqueue("job-1")
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", -1.0)
+    monkeypatch.setattr(job_queue, "MAX_ATTEMPTS", 2)
+
+    assert queue.claim("w1", timeout=0).attempt == 1
+    assert queue.claim("w2", timeout=0).attempt == 2
+    assert queue.claim("w3", timeout=0) is None
+    assert store.get_job("job-1")["status"] == "error"
+
+
+def test_release_returns_job_without_counting_attempt(queue):
+    queue.enqueue("job-1")
+    lease = queue.claim("w1", timeout=0)
+    queue.release(lease)
+
+    again = queue.claim("w2", timeout=0)
+    assert again.job_id == "job-1" and again.attempt == 1
+    assert not queue.complete(lease)
+
+
+def _entry(job_id, seconds, enqueued_at, memory_mb=100.0):
+    return job_queue._Entry(job_id, seconds, memory_mb, enqueued_at)
+
+
+def test_shortest_job_first(monkeypatch):
+    monkeypatch.setattr(job_queue, "QUEUE_AGING", 1.0)
+    entries = [_entry("long", 600, 1000.0), _entry("short", 30, 1010.0)]
+
+    assert job_queue._pick(entries, 1010.0, 0).job_id == "short"
+
+
+def test_long_job_ages_to_the_front(monkeypatch):
+    monkeypatch.setattr(job_queue, "QUEUE_AGING", 1.0)
+    long = _entry("long", 600, 1000.0)
+
+    # 短いジョブが次々来ても、待った秒数だけ長いジョブの優先度が上がる
+    assert job_queue._pick([long, _entry("short", 30, 1500.0)], 1500.0, 0).job_id == "short"
+    assert job_queue._pick([long, _entry("short", 30, 1580.0)], 1580.0, 0).job_id == "long"
+
+
+def test_in_process_queue_orders_by_cost():
+    queue = job_queue.InProcessQueue()
+    queue.enqueue("long", seconds=600)
+    queue.enqueue("short", seconds=30)
+
+    assert queue.estimate("short")["position"] == 1
+    assert queue.claim("w1", timeout=0).job_id == "short"
+
+
+def test_memory_budget_lets_smaller_jobs_pass(monkeypatch):
+    monkeypatch.setattr(job_queue.cost_model, "MEMORY_BUDGET_MB", 1000.0)
+    entries = [_entry("big", 30, 1000.0, memory_mb=800.0), _entry("small", 60, 1000.0, memory_mb=100.0)]
+
+    assert job_queue._pick(entries, 1010.0, 500.0).job_id == "small"
+    assert job_queue._pick(entries, 1010.0, 0).job_id == "big"
+    # 先頭が長く待ちすぎていれば、追い越させずにメモリが空くのを待つ
+    now = 1000.0 + job_queue.QUEUE_STARVATION_SECONDS
+    assert job_queue._pick(entries, now, 500.0) is None
@@ -0,0 +1,87 @@
+"""文字起こしの全文検索（trigram と、2文字以下の語の n-gram）。"""
+
+import sqlite3
+
+import pytest
+
+import search_index
+from segments import SegmentArray
+
+
+@pytest.fixture(autouse=True)
+def index(monkeypatch, tmp_path):
+    path = str(tmp_path / "search.db")
+    monkeypatch.setattr(search_index, "INDEX_PATH", path)
+    monkeypatch.setattr(search_index, "_available", None)
+    if not search_index.available():
+        pytest.skip("SQLite FTS5 trigram is not available")
+    search_index.index_job("job-1", SegmentArray.from_dicts([
+        {"start": 0.0, "end": 5.0, "text": "OpenAI の新しい AI モデル"},
+        {"start": 5.0, "end": 9.0, "text": "動画の要約を作る"},
+        {"start": 9.0, "end": 12.0, "text": "C++ で書き直す"},
+    ]))
+    search_index.index_job("job-2", SegmentArray.from_dicts([
+        {"start": 1.0, "end": 3.0, "text": "日本の動画サイト"},
+    ]))
+    return path
+
+
+def _hits(query, **kwargs):
+    return [(hit["job_id"], hit["start"]) for hit in search_index.search(query, **kwargs)]
+
+
+def test_trigram_search():
+    assert _hits("OpenAI") == [("job-1", 0.0)]
+    assert _hits("要約を") == [("job-1", 5.0)]
+    assert _hits("存在しない語") == []
+
+
+def test_short_terms_use_ngrams():
+    assert _hits("AI") == [("job-1", 0.0)]
+    assert _hits("ai") == [("job-1", 0.0)]  # unicode61 は大文字小文字を区別しない
+    assert _hits("動画") == [("job-2", 1.0), ("job-1", 5.0)]
+    assert _hits("日") == [("job-2", 1.0)]
+
+
+def test_short_and_long_terms_together():
+    assert _hits("動画 要約を") == [("job-1", 5.0)]
+    assert _hits("AI モデル") == [("job-1", 0.0)]
+    assert _hits("日 要約を") == []
+
+
+def test_short_term_with_symbols_uses_like():
+    assert _hits("C+") == [("job-1", 9.0)]
+    assert _hits("%") == []
+
+
+def test_highlights_short_terms():
+    [hit] = search_index.search("日")
+    assert hit["snippet"] == "[日]本の動画サイト"
+
+
+def test_job_filter():
+    assert _hits("動画", job_id="job-1") == [("job-1", 5.0)]
+
+
+def test_reindex_replaces_segments():
+    search_index.index_job("job-2", SegmentArray.from_dicts([{"start": 0.0, "end": 1.0, "text": "音声のみ"}]))
+
+    assert _hits("動画") == [("job-1", 5.0)]
+    assert _hits("日") == []
+    assert _hits("音声") == [("job-2", 0.0)]
+
+
+def test_backfills_ngrams_for_segments_indexed_before_them(monkeypatch, tmp_path):
+    # transcript_grams がなかった頃の索引
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    for statement in search_index._SCHEMA[:5]:
+        conn.execute(statement)
+    conn.execute("INSERT INTO transcript_segments (job_id, start, end, text) VALUES ('old', 0, 1, 'AI の動画')")
+    conn.close()
+    monkeypatch.setattr(search_index, "INDEX_PATH", path)
+    monkeypatch.setattr(search_index, "_available", None)
+
+    assert search_index.available()
+    assert _hits("AI") == [("old", 0.0)]
+    assert _hits("動画") == [("old", 0.0)]
@@ -0,0 +1,51 @@
+"""SegmentArray のバイナリ表現と、ストアの JSON に埋め込む base64 の往復。"""
+
+import json
+
+import store
+from segments import SegmentArray
+
+SEGMENTS = [
+    {"start": 0.0, "end": 2.5, "text": "こんにちは"},
+    {"start": 2.5, "end": 4.125, "text": "AI で動画を要約 🎬"},
+    {"start": 4.125, "end": 7.0, "text": "end."},
+]
+
+
+def test_bytes_round_trip():
+    segs = SegmentArray.from_dicts(SEGMENTS)
+
+    restored = SegmentArray.from_bytes(segs.to_bytes())
+
+    assert restored.to_dicts() == SEGMENTS
+    assert restored.text == "こんにちは AI で動画を要約 🎬 end."
+    assert restored[1].text == "AI で動画を要約 🎬"
+
+
+def test_empty_round_trip():
+    restored = SegmentArray.from_bytes(SegmentArray.from_dicts([]).to_bytes())
+
+    assert len(restored) == 0 and not restored
+    assert restored.to_dicts() == []
+
+
+def test_store_json_embeds_segments_as_base64():
+    job = {"id": "job-1", "segments": SegmentArray.from_dicts(SEGMENTS), "results": {"ja": "本文"}}
+
+    data = store._dumps(job)
+    restored = store._loads(data)
+
+    assert set(json.loads(data)["segments"]) == {"__segments__"}
+    assert isinstance(restored["segments"], SegmentArray)
+    assert restored["segments"].to_dicts() == SEGMENTS
+    assert restored["results"] == {"ja": "本文"}
+
+
+def test_sqlite_store_keeps_segments(monkeypatch, tmp_path):
+    monkeypatch.setattr(store, "DB_PATH", str(tmp_path / "jobs.db"))
+    store._init_db()
+    store.create_job("job-1", source_type="upload")
+
+    store.update_job("job-1", segments=SegmentArray.from_dicts(SEGMENTS))
+
+    assert store.get_job("job-1")["segments"].to_dicts() == SEGMENTS
@@ -0,0 +1,64 @@
+"""リースのトークンによるジョブ更新のフェンシング。"""
+
+import contextvars
+import threading
+
+import pytest
+
+import store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def job_id(request, monkeypatch, tmp_path):
+    if request.param == "sqlite":
+        monkeypatch.setattr(store, "DB_PATH", str(tmp_path / "jobs.db"))
+        store._init_db()
+    job_id = f"job-{request.param}"
+    store.create_job(job_id, source_type="upload")
+    return job_id
+
+
+def test_update_within_lease(job_id):
+    with store.leased(job_id, "token-a"):
+        job = store.update_job(job_id, status="transcribing")
+
+    assert job["status"] == "transcribing"
+    assert store.get_job(job_id)["lease_token"] == "token-a"
+
+
+def test_stale_lease_writes_are_dropped(job_id):
+    with store.leased(job_id, "token-a"):
+        # リースが切れて別のワーカーが取り直した
+        store.update_job(job_id, lease_token="token-b")
+        version = store.get_job(job_id)["version"]
+
+        assert store.update_job(job_id, status="error", error="late") is None
+
+    job = store.get_job(job_id)
+    assert job["status"] == "uploaded" and job["error"] is None
+    assert job["version"] == version
+
+
+def test_fencing_applies_to_threads_started_in_lease(job_id):
+    results = []
+
+    def write():
+        results.append(store.update_job(job_id, status="done"))
+
+    with store.leased(job_id, "token-a"):
+        store.update_job(job_id, lease_token="token-b")
+        # コンテキストをコピーして起動するスレッド（ステージの並列処理）からの書き込み
+        ctx = contextvars.copy_context()
+        thread = threading.Thread(target=ctx.run, args=(write,))
+        thread.start()
+        thread.join()
+
+    assert results == [None]
+    assert store.get_job(job_id)["status"] == "uploaded"
+
+
+def test_writes_outside_lease_are_not_fenced(job_id):
+    with store.leased(job_id, "token-a"):
+        store.update_job(job_id, lease_token="token-b")
+
+    assert store.update_job(job_id, status="error")["status"] == "error"
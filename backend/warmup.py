@@ -0,0 +1,123 @@
+"""
+起動直後のウォームアップ（コールドスタート対策）。
+
+デプロイ・スケールアップ直後の最初のジョブは、関数の中で遅延 import している重いモジュール
+（yt_dlp・faster_whisper・各プロバイダの SDK など）の import と Whisper モデルのロードの分だけ遅い。
+STARTUP_WARMUP=1 なら、それらを起動時に先に済ませる。
+
+  - API: lifespan でバックグラウンドのスレッドとして始めるので、起動（uvicorn の bind）は待たせない。
+    /health はプロセスが応答するか、/ready はウォームアップが終わったかを返す
+  - ワーカープロセス: ジョブを取り始める前に同じ処理を終わらせる
+
+ウォームアップの失敗（未インストールのモジュールなど）は記録だけして、終わったものとして扱う。
+Docker イメージでは Whisper モデルの焼き込みとバイトコードのコンパイルも行う（Dockerfile）。
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "0") == "1"
+# プロセスの起動時刻の代わり（main / worker から最初に import される時点）
+PROCESS_STARTED = time.monotonic()
+
+_lock = threading.Lock()
+_state: dict = {"status": "disabled" if not STARTUP_WARMUP else "pending", "steps": {}}
+_done = threading.Event()
+if not STARTUP_WARMUP:
+    _done.set()
+
+
+def _modules() -> list[str]:
+    """この設定のジョブが遅延 import するモジュール。"""
+    from services import ai_generator, transcription
+
+    modules = ["numpy", "requests", "yt_dlp"]
+    if shutil.which("ffmpeg") is None:
+        modules += ["imageio_ffmpeg", "moviepy"]  # audio_extractor のフォールバック
+    if transcription.USE_OPENAI_API:
+        modules += ["openai", "pydub", "faster_whisper.vad"]
+    elif transcription.USE_LOCAL_WHISPER:
+        modules.append("faster_whisper")
+        if transcription.USE_BATCHED_WHISPER:
+            modules.append("services.batched_transcription")
+    if ai_generator.USE_CLAUDE:
+        modules.append("anthropic")
+    if ai_generator.USE_GEMINI:
+        modules.append("google.genai")
+    return modules
+
+
+def _warm_whisper() -> None:
+    """ローカル Whisper のモデルをロードし、1秒の無音で1回推論しておく（初回の初期化を済ませる）。"""
+    import numpy as np
+
+    from services.transcription import local_whisper_model
+
+    model, _ = local_whisper_model()
+    segments, _ = model.transcribe(np.zeros(16000, dtype=np.float32), language="en", beam_size=1)
+    list(segments)
+
+
+def _steps() -> list[tuple[str, Callable[[], object]]]:
+    from services import transcription
+
+    steps: list[tuple[str, Callable[[], object]]] = [
+        (f"import:{name}", lambda name=name: importlib.import_module(name)) for name in _modules()
+    ]
+    if transcription.USE_LOCAL_WHISPER and not transcription.USE_OPENAI_API:
+        steps.append(("whisper_model", _warm_whisper))
+    return steps
+
+
+def run() -> dict:
+    """ウォームアップを実行して結果を返す。2回目以降は何もしない。"""
+    with _lock:
+        started_here = _state["status"] == "pending"
+        if started_here:
+            _state["status"] = "warming"
+    if not started_here:
+        return status()  # _lock は再入できないので、外してから読む
+    started = time.monotonic()
+    for name, step in _steps():
+        t = time.monotonic()
+        try:
+            step()
+            result = {"ok": True}
+        except Exception as e:
+            logger.warning("Warm-up step %s failed (%s): %s", name, type(e).__name__, e)
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        result["seconds"] = round(time.monotonic() - t, 3)
+        with _lock:
+            _state["steps"][name] = result
+    with _lock:
+        _state["status"] = "ready"
+        _state["warmup_seconds"] = round(time.monotonic() - started, 3)
+        _state["ready_after_seconds"] = round(time.monotonic() - PROCESS_STARTED, 3)
+    _done.set()
+    logger.info("Warm-up done in %.1fs (%.1fs after start)", _state["warmup_seconds"], _state["ready_after_seconds"])
+    return status()
+
+
+def start_in_background() -> None:
+    """STARTUP_WARMUP=1 ならウォームアップをバックグラウンドで始める。"""
+    if STARTUP_WARMUP:
+        threading.Thread(target=run, name="warmup", daemon=True).start()
+
+
+def is_ready() -> bool:
+    return _done.is_set()
+
+
+def status() -> dict:
+    """GET /ready の本文。status: disabled | pending | warming | ready"""
+    with _lock:
+        return {"ready": _done.is_set(), **_state, "steps": dict(_state["steps"])}
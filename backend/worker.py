@@ -0,0 +1,133 @@
+"""
+ジョブワーカー。キューからリース付きでジョブを取り出して _process_job を実行する。
+
+  python -m worker            # 単独のワーカープロセス（JOB_DB_PATH で API と同じ DB を指定）
+
+JOB_DB_PATH 未設定（インメモリ構成）の場合は、API プロセス内で EMBEDDED_WORKERS 本の
+ワーカースレッドが同じループを回す（main.py の lifespan から起動）。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import socket
+import threading
+
+from dotenv import load_dotenv
+
+# .env を backend フォルダから確実に読み込む（python -m worker で単独起動する場合）
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+logger = logging.getLogger(__name__)
+
+# リース失効（QUEUE_LEASE_SECONDS）より十分短い間隔で延長する
+HEARTBEAT_SECONDS = float(os.environ.get("QUEUE_HEARTBEAT_SECONDS", "15"))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "2"))
+# API プロセス内で動かすワーカー数。共有 DB を使う構成では別プロセスに任せるので 0
+EMBEDDED_WORKERS = int(os.environ.get("EMBEDDED_WORKERS", "0" if os.environ.get("JOB_DB_PATH") else "4"))
+
+
+def _run_leased(queue, lease) -> None:
+    """リースを heartbeat で延長しながら1ジョブを処理する。"""
+    import profiling
+    import store
+    from routers.generate import _process_job
+
+    stop_beat = threading.Event()
+    lost = threading.Event()
+
+    def beat():
+        while not stop_beat.wait(HEARTBEAT_SECONDS):
+            if not queue.heartbeat(lease):
+                logger.warning("[%s] Lease lost by %s", lease.job_id, lease.worker_id)
+                lost.set()
+                return
+
+    def still_leased() -> bool:
+        # 結果を書き込む直前に呼ばれる。延長できればその後 LEASE_SECONDS は他に取られない
+        # （他の書き込みは store.leased() のトークンでフェンスする）
+        return not lost.is_set() and queue.heartbeat(lease)
+
+    beater = threading.Thread(target=beat, name=f"heartbeat-{lease.job_id[:8]}", daemon=True)
+    beater.start()
+    try:
+        # リースを失った後の書き込み（途中経過・エラー・プロファイル等）は store がすべて捨てる
+        with store.leased(lease.job_id, lease.token), profiling.profile_job(lease.job_id):
+            _process_job(lease.job_id, still_leased=still_leased)
+    finally:
+        stop_beat.set()
+        beater.join()
+        if not queue.complete(lease):
+            logger.warning("[%s] Lease was lost before completion; result discarded", lease.job_id)
+
+
+def run_worker(worker_id: str, stop: threading.Event) -> None:
+    """stop がセットされるまでキューからジョブを取り出して処理する。"""
+    import job_queue
+
+    queue = job_queue.get_queue()
+    logger.info("Worker %s started (backend=%s)", worker_id, job_queue.BACKEND)
+    while not stop.is_set():
+        try:
+            lease = queue.claim(worker_id, timeout=1.0)
+        except Exception:
+            logger.exception("Worker %s failed to claim a job", worker_id)
+            stop.wait(1.0)
+            continue
+        if lease is None:
+            continue
+        logger.info("[%s] Claimed by %s (attempt %d)", lease.job_id, worker_id, lease.attempt)
+        try:
+            _run_leased(queue, lease)
+        except Exception:
+            logger.exception("[%s] Worker %s crashed while processing", lease.job_id, worker_id)
+    logger.info("Worker %s stopped", worker_id)
+
+
+def start_workers(count: int, stop: threading.Event) -> list[threading.Thread]:
+    """count 本のワーカースレッドを起動する。"""
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = []
+    for i in range(count):
+        t = threading.Thread(target=run_worker, args=(f"{prefix}:{i}", stop), name=f"worker-{i}", daemon=True)
+        t.start()
+        threads.append(t)
+    return threads
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    metrics_port = os.environ.get("WORKER_METRICS_PORT")
+    if metrics_port:
+        from prometheus_client import start_http_server
+
+        start_http_server(int(metrics_port))
+
+    stop = threading.Event()
+    # SIGTERM では新しいジョブを取らず、処理中のジョブを終えてから終了する
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    import warmup
+    from services import ollama_engine
+
+    ollama_engine.warm_in_background()
+    # ジョブを取る前に重いモジュール・Whisper モデルを準備する（取ったジョブが待たされないように）
+    if warmup.STARTUP_WARMUP:
+        warmup.run()
+    threads = start_workers(WORKER_CONCURRENCY, stop)
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=1.0)
+
+
+if __name__ == "__main__":
+    main()
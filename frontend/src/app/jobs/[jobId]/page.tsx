@@ -1,9 +1,10 @@
 "use client";
 
-import { use } from "react";
+import { use, useState } from "react";
 import { ArrowLeft, Zap } from "lucide-react";
 import Link from "next/link";
-import { useJobPolling } from "@/lib/useJobPolling";
+import { cancelJob } from "@/lib/api";
+import { TERMINAL, useJobPolling } from "@/lib/useJobPolling";
 import JobProgress from "@/components/JobProgress";
 import ResultViewer from "@/components/ResultViewer";
 
@@ -13,7 +14,18 @@ export default function JobPage({
   params: Promise<{ jobId: string }>;
 }) {
   const { jobId } = use(params);
-  const { job, loading, pollError } = useJobPolling(jobId);
+  const { job, loading, pollError, refetch } = useJobPolling(jobId);
+  const [cancelling, setCancelling] = useState(false);
+
+  const handleCancel = async () => {
+    setCancelling(true);
+    try {
+      await cancelJob(jobId);
+      await refetch();
+    } catch {
+      setCancelling(false);
+    }
+  };
 
   return (
     <div className="min-h-screen">
@@ -52,6 +64,15 @@ export default function JobPage({
                 <span className="text-xs text-gray-400 font-mono">
                   {jobId.slice(0, 8)}
                 </span>
+                {!TERMINAL.has(job.status) && (
+                  <button
+                    onClick={handleCancel}
+                    disabled={cancelling}
+                    className="ml-2 text-xs text-gray-400 hover:text-red-400 transition-colors disabled:opacity-50"
+                  >
+                    {cancelling ? "キャンセル中..." : "キャンセル"}
+                  </button>
+                )}
               </div>
             )}
           </div>
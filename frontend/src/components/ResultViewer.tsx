@@ -13,9 +13,16 @@ import {
   TrendingUp,
 } from "lucide-react";
 import type { JobData } from "@/lib/useJobPolling";
+import Waveform from "./Waveform";
 
 type Tab = "clips" | "thread" | "blog";
 
+const LANGUAGE_LABELS: Record<string, string> = {
+  same: "動画と同じ言語",
+  ja: "日本語",
+  en: "英語",
+};
+
 interface ResultViewerProps {
   job: JobData;
 }
@@ -24,13 +31,17 @@ export default function ResultViewer({ job }: ResultViewerProps) {
   const [activeTab, setActiveTab] = useState<Tab>("clips");
   const [copiedId, setCopiedId] = useState<string | null>(null);
   const [expandedClip, setExpandedClip] = useState<number | null>(null);
+  const [language, setLanguage] = useState<string | null>(null);
 
   const results = job.results;
   if (!results) return null;
 
+  // 複数言語で出力したジョブは文章（X ツリー・ブログ）を言語ごとに切り替える
+  const languages = Object.keys(results.languages ?? {});
+  const localized = (language && results.languages?.[language]) || results;
   const viralClips = results.viral_clips ?? [];
-  const xThread = results.x_thread ?? [];
-  const blogArticle = results.blog_article ?? "";
+  const xThread = localized.x_thread ?? [];
+  const blogArticle = localized.blog_article ?? "";
 
   const copyToClipboard = async (text: string, id: string) => {
     await navigator.clipboard.writeText(text);
@@ -96,11 +107,36 @@ export default function ResultViewer({ job }: ResultViewerProps) {
         ))}
       </div>
 
+      {/* Language Switch */}
+      {languages.length > 1 && activeTab !== "clips" && (
+        <div className="flex justify-center gap-2">
+          {languages.map((lang) => (
+            <button
+              key={lang}
+              onClick={() => setLanguage(lang)}
+              className={`px-3 py-1.5 rounded-lg text-xs font-medium transition-all duration-300 ${
+                (language ?? languages[0]) === lang
+                  ? "bg-white/[0.12] text-white"
+                  : "glass text-gray-400 hover:text-white"
+              }`}
+            >
+              {LANGUAGE_LABELS[lang] ?? lang}
+            </button>
+          ))}
+        </div>
+      )}
+
       {/* Tab Content */}
       <div className="min-h-[400px]">
         {/* Viral Clips */}
         {activeTab === "clips" && (
           <div className="space-y-4">
+            <Waveform
+              jobId={job.job_id}
+              clips={viralClips}
+              activeClip={expandedClip}
+              onSelectClip={setExpandedClip}
+            />
             {viralClips.map((clip, i) => (
               <div
                 key={i}
@@ -18,13 +18,22 @@ interface UploadAreaProps {
   onJobStarted: (jobId: string) => void;
 }
 
+// 出力の選択肢 → API に渡す出力言語（both は切り抜き分析1回で両方の言語の文章を作る）
+type OutputChoice = OutputLang | "both";
+const OUTPUT_LANGUAGES: Record<OutputChoice, OutputLang[]> = {
+  same: ["same"],
+  ja: ["ja"],
+  en: ["en"],
+  both: ["same", "ja"],
+};
+
 export default function UploadArea({ onJobStarted }: UploadAreaProps) {
   const [state, setState] = useState<UploadState>("idle");
   const [file, setFile] = useState<File | null>(null);
   const [youtubeUrl, setYoutubeUrl] = useState("");
   const [mode, setMode] = useState<"file" | "url">("file");
   const [videoLang, setVideoLang] = useState<VideoLang>("ja");
-  const [outputLang, setOutputLang] = useState<OutputLang>("same");
+  const [outputLang, setOutputLang] = useState<OutputChoice>("same");
   const [progress, setProgress] = useState(0);
   const [error, setError] = useState<string | null>(null);
   const [jobId, setJobId] = useState<string | null>(null);
@@ -50,7 +59,7 @@ export default function UploadArea({ onJobStarted }: UploadAreaProps) {
     }, 80);
 
     try {
-      const data = await uploadFile(selectedFile, videoLang, outputLang);
+      const data = await uploadFile(selectedFile, videoLang, OUTPUT_LANGUAGES[outputLang]);
       clearInterval(interval);
       setProgress(100);
       setState("done");
@@ -105,7 +114,7 @@ export default function UploadArea({ onJobStarted }: UploadAreaProps) {
     }, 80);
 
     try {
-      const data = await submitYoutubeUrl(youtubeUrl, videoLang, outputLang);
+      const data = await submitYoutubeUrl(youtubeUrl, videoLang, OUTPUT_LANGUAGES[outputLang]);
       clearInterval(interval);
       setProgress(100);
       setState("done");
@@ -174,12 +183,13 @@ export default function UploadArea({ onJobStarted }: UploadAreaProps) {
               <span className="text-sm text-gray-500">出力:</span>
               <select
                 value={outputLang}
-                onChange={(e) => setOutputLang(e.target.value as OutputLang)}
+                onChange={(e) => setOutputLang(e.target.value as OutputChoice)}
                 disabled={state !== "idle"}
                 className="px-3 py-2 rounded-lg bg-white/[0.06] border border-white/[0.08] text-sm text-gray-200 focus:outline-none focus:border-neon-blue/50 disabled:opacity-50"
               >
                 <option value="same">英語のまま</option>
                 <option value="ja">日本語で要約</option>
+                <option value="both">英語 + 日本語</option>
               </select>
             </div>
           )}
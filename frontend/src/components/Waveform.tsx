@@ -0,0 +1,90 @@
+"use client";
+
+import { useEffect, useRef, useState } from "react";
+import { getWaveform, type WaveformPeaks } from "@/lib/api";
+
+interface WaveformProps {
+  jobId: string;
+  clips: { start_time: string; end_time: string }[];
+  activeClip: number | null;
+  onSelectClip: (index: number) => void;
+}
+
+const HEIGHT = 72;
+
+function toSeconds(value: string): number {
+  return value.split(":").reduce((acc, part) => acc * 60 + Number(part), 0);
+}
+
+export default function Waveform({ jobId, clips, activeClip, onSelectClip }: WaveformProps) {
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+  const [data, setData] = useState<WaveformPeaks | null>(null);
+
+  useEffect(() => {
+    const width = canvasRef.current?.clientWidth || 800; // 非表示の間は幅 0
+    getWaveform(jobId, width * (window.devicePixelRatio || 1))
+      .then(setData)
+      .catch(() => setData(null));
+  }, [jobId]);
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas || !data) return;
+    const dpr = window.devicePixelRatio || 1;
+    const width = canvas.clientWidth * dpr;
+    const height = HEIGHT * dpr;
+    canvas.width = width;
+    canvas.height = height;
+    const ctx = canvas.getContext("2d");
+    if (!ctx) return;
+
+    const count = data.peaks.length / 2;
+    const mid = height / 2;
+    const secondsToX = (s: number) => (s / data.duration) * width;
+
+    // クリップ区間
+    clips.forEach((clip, i) => {
+      const x0 = secondsToX(toSeconds(clip.start_time));
+      const x1 = secondsToX(toSeconds(clip.end_time));
+      ctx.fillStyle = i === activeClip ? "rgba(0, 212, 255, 0.25)" : "rgba(0, 212, 255, 0.08)";
+      ctx.fillRect(x0, 0, Math.max(1, x1 - x0), height);
+    });
+
+    // 1ピクセルに入る区間の min / max をまとめて縦線で描く
+    ctx.fillStyle = "rgba(168, 85, 247, 0.8)";
+    for (let x = 0; x < width; x++) {
+      const from = Math.floor((x / width) * count);
+      const to = Math.max(from + 1, Math.floor(((x + 1) / width) * count));
+      let lo = 0;
+      let hi = 0;
+      for (let i = from; i < to && i < count; i++) {
+        lo = Math.min(lo, data.peaks[i * 2]);
+        hi = Math.max(hi, data.peaks[i * 2 + 1]);
+      }
+      const top = mid - (hi / 128) * mid;
+      ctx.fillRect(x, top, 1, Math.max(1, ((hi - lo) / 128) * mid));
+    }
+  }, [data, clips, activeClip]);
+
+  if (!data) return <canvas ref={canvasRef} className="hidden" />;
+
+  const handleClick = (e: React.MouseEvent<HTMLCanvasElement>) => {
+    const rect = e.currentTarget.getBoundingClientRect();
+    const seconds = ((e.clientX - rect.left) / rect.width) * data.duration;
+    const index = clips.findIndex(
+      (c) => toSeconds(c.start_time) <= seconds && seconds <= toSeconds(c.end_time)
+    );
+    if (index >= 0) onSelectClip(index);
+  };
+
+  return (
+    <div className="rounded-2xl glass p-4">
+      <canvas
+        ref={canvasRef}
+        onClick={handleClick}
+        className="w-full cursor-pointer"
+        style={{ height: HEIGHT }}
+      />
+    </div>
+  );
+}
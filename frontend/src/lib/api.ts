@@ -1,19 +1,22 @@
 const API_BASE = (process.env.NEXT_PUBLIC_API_URL ?? "http://localhost:8001").replace(/\/$/, "");
 
 export type VideoLang = "ja" | "en";
-export type OutputLang = "same" | "ja";
+export type OutputLang = "same" | "ja" | "en";
+
+// 複数指定すると、切り抜き箇所は1回だけ分析し、文章（X ツリー・ブログ）を言語ごとに生成する
+const toLanguageList = (langs: OutputLang | OutputLang[]) => (Array.isArray(langs) ? langs : [langs]);
 
 export async function uploadFile(
   file: File,
   transcriptLanguage: VideoLang = "ja",
-  outputLanguage: OutputLang = "same"
+  outputLanguages: OutputLang | OutputLang[] = "same"
 ) {
   const formData = new FormData();
   formData.append("file", file);
 
   const params = new URLSearchParams({
     transcript_language: transcriptLanguage,
-    output_language: outputLanguage,
+    output_languages: toLanguageList(outputLanguages).join(","),
   });
   const res = await fetch(`${API_BASE}/api/upload?${params}`, {
     method: "POST",
@@ -37,7 +40,7 @@ export async function uploadFile(
 export async function submitYoutubeUrl(
   url: string,
   transcriptLanguage: VideoLang = "ja",
-  outputLanguage: OutputLang = "same"
+  outputLanguages: OutputLang | OutputLang[] = "same"
 ) {
   const res = await fetch(`${API_BASE}/api/upload/youtube`, {
     method: "POST",
@@ -45,7 +48,7 @@ export async function submitYoutubeUrl(
     body: JSON.stringify({
       url,
       transcript_language: transcriptLanguage,
-      output_language: outputLanguage,
+      output_languages: toLanguageList(outputLanguages),
     }),
   });
 
@@ -62,8 +65,19 @@ export async function generateContent(jobId: string) {
   return res.json();
 }
 
-export async function getJobStatus(jobId: string) {
-  const res = await fetch(`${API_BASE}/api/jobs/${jobId}`);
+export async function cancelJob(jobId: string) {
+  const res = await fetch(`${API_BASE}/api/jobs/${jobId}/cancel`, {
+    method: "POST",
+  });
+
+  if (!res.ok) throw new Error("Cancel failed");
+  return res.json();
+}
+
+export async function getJobStatus(jobId: string, fields?: string[]) {
+  // ETag + Cache-Control: no-cache なので、変化がなければブラウザが 304 で再検証する
+  const query = fields ? `?fields=${fields.join(",")}` : "";
+  const res = await fetch(`${API_BASE}/api/jobs/${jobId}${query}`);
 
   if (!res.ok) {
     const text = await res.text();
@@ -78,3 +92,42 @@ export async function getJobStatus(jobId: string) {
   }
   return res.json();
 }
+
+export interface WaveformPeaks {
+  sampleRate: number;
+  duration: number;
+  samplesPerPeak: number;
+  // [min0, max0, min1, max1, ...]（-128〜127）
+  peaks: Int8Array;
+}
+
+// 波形ピーク（PKS1 形式）を Range で取得する。先頭でレベル表を読み、
+// minPeaks 以上の区間数を持つ最も粗いレベルだけを取りに行く。無ければ null
+export async function getWaveform(jobId: string, minPeaks: number): Promise<WaveformPeaks | null> {
+  const url = `${API_BASE}/api/jobs/${jobId}/waveform`;
+  const head = await fetch(url, { headers: { Range: "bytes=0-255" } });
+  if (head.status === 404) return null;
+  if (!head.ok) throw new Error("Failed to fetch waveform");
+
+  const view = new DataView(await head.arrayBuffer());
+  const sampleRate = view.getUint32(4, true);
+  const samples = view.getUint32(8, true);
+  const levels = Array.from({ length: view.getUint32(12, true) }, (_, i) => ({
+    samplesPerPeak: view.getUint32(16 + i * 12, true),
+    count: view.getUint32(20 + i * 12, true),
+    offset: view.getUint32(24 + i * 12, true),
+  }));
+  // レベルは細かい順に並んでいる
+  const level = [...levels].reverse().find((l) => l.count >= minPeaks) ?? levels[0];
+
+  const body = await fetch(url, {
+    headers: { Range: `bytes=${level.offset}-${level.offset + level.count * 2 - 1}` },
+  });
+  if (!body.ok) throw new Error("Failed to fetch waveform");
+  return {
+    sampleRate,
+    duration: samples / sampleRate,
+    samplesPerPeak: level.samplesPerPeak,
+    peaks: new Int8Array(await body.arrayBuffer()),
+  };
+}
@@ -7,6 +7,7 @@ export interface JobData {
   job_id: string;
   status: string;
   source_type: string;
+  output_languages?: string[];
   transcript: string | null;
   results: {
     viral_clips: {
@@ -17,13 +18,18 @@ export interface JobData {
     }[];
     x_thread: string[];
     blog_article: string;
+    // 複数言語で出力したジョブのみ。言語ごとの文章（先頭の言語が上の x_thread / blog_article）
+    languages?: Record<string, { x_thread?: string[]; blog_article?: string }>;
   } | null;
   error: string | null;
   created_at: string;
   updated_at: string;
 }
 
-const TERMINAL = new Set(["completed", "error"]);
+export const TERMINAL = new Set(["completed", "error", "cancelled", "timed_out"]);
+
+// 処理中のポーリングでは文字起こし・結果を受け取らない
+const POLL_FIELDS = ["status", "source_type", "error", "created_at", "updated_at"];
 
 export function useJobPolling(jobId: string, intervalMs = 3000) {
   const [job, setJob] = useState<JobData | null>(null);
@@ -33,13 +39,15 @@ export function useJobPolling(jobId: string, intervalMs = 3000) {
 
   const fetchOnce = useCallback(async () => {
     try {
-      const data = await getJobStatus(jobId);
-      setJob(data);
-      setPollError(null);
-      if (TERMINAL.has(data.status)) {
-        // 完了したらポーリング停止
+      const lean = await getJobStatus(jobId, POLL_FIELDS);
+      if (TERMINAL.has(lean.status)) {
+        // 完了したらポーリング停止し、結果込みで取り直す
         if (timerRef.current) clearInterval(timerRef.current);
+        setJob(await getJobStatus(jobId));
+      } else {
+        setJob((prev) => ({ transcript: null, results: null, ...prev, ...lean }));
       }
+      setPollError(null);
     } catch (err) {
       const msg = err instanceof Error ? err.message : "ステータスの取得に失敗しました";
       if (msg.includes("[404]") || msg.includes("Job not found")) {